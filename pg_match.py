@@ -13,7 +13,7 @@ from __future__ import print_function
 # 02.  Assumes the secret database credentials file (.dbcompare) is populated correctly.
 #
 # usage:
-# type = simplescan | detailedscan
+# type = simplescan | detailedscan | samplescan
 # pg_match.py -t simplescan -H localhost --Sport 5414 --Suser postgres --Sdb clone_testing --Sschema sample --Thost localhost --Tport 5414 --Tuser postgres --Tdb clone_testing --Tschema sample_clone1
 # pg_match.py -t simplescan -H eddp-staging-popstore3.cluster-cddj9wcflvor.us-gov-west-1.rds.amazonaws.com  --Sport 5432 --Suser root --Sdb popstore3 --Sschema lookup_module --Thost eddp-staging-popstore3.cluster-cddj9wcflvor.us-gov-west-1.rds.amazonaws.com --Tport 5432 --Tuser root --Tdb popstore3 --Tschema lookup_module_beta
 # Assumptions:
@@ -42,17 +42,86 @@ from __future__ import print_function
 #                                              Fixed column attribute slowness
 # 2023-01-13    Michael Vitale    version 3.1  Fixed logic for handling cases where no objects found in a particular class
 # 2023-01-18    Michael Vitale    version 3.2  Enhancement: add bypass columns parm, inplace updates for row counts during DetailedScan, added signal handler for ctrl-c interruptions
+# 2026-10-17    Michael Vitale    version 4.0  Concurrent query engine: source and target catalog queries run at the same time over a small pool of connections per side.
+#                                              Keyed diffs replace the nested loops. Columns compared in one pass over all tables with a fixed number of queries.
+#                                              DetailedScan counts run in parallel over the connection pool, biggest tables first.
+#                                              Phase 7: optional order-independent table content checksums.
+#                                              SampleScan: row counts estimated from a TABLESAMPLE page sample with 95% confidence intervals.
+#                                              Snapshot mode: all connections of a side read from one exported snapshot.
+#                                              Catalog cache: Phase 1-5 results of an unchanged schema are loaded from a local SQLite file.
+#                                              Schema snapshot files: export a target schema once, compare any source against it offline.
+#                                              Incremental mode: only tables and functions changed since the last run are fetched again.
+#                                              Fan-out mode: one source extract compared against many targets at once, with a drift matrix.
+#                                              Multi-schema mode: all mapped schema pairs of two databases with one catalog query per side per phase.
+#                                              Pipeline transport: with psycopg 3, each side's catalog queries share one round trip.
+#                                              JSON catalog extraction: each side's catalog built server-side as one json document.
+#                                              Streaming column diff: merge of two server-side cursors, memory bounded by the largest table.
+#                                              pg_catalog backend for the information_schema based catalog queries, used on PG10+.
+#                                              Slotted catalog records with interned strings in place of positional row tuples.
+#                                              Per-phase timings file (--timings) and the scale benchmark in pg_match_bench.py.
+#                                              Profiling (--profile): per-query execute/fetch times, rows and bytes, per-phase CPU time and peak memory.
+#                                              OpenMetrics textfile (--metrics) with phase durations, query counts, diffs per category and last success time.
+#                                              NDJSON diff output (--ndjson): one record per difference through a buffered writer.
+#                                              Console and log file lines written in batches by a background thread, drained on exit and CTRL-C.
+#                                              Diff budget (--max_diffs): stop and cancel the running queries after N differences, exit with RC_DIFF.
+#                                              DetailedScan count strategy per table and side: index-only, parallel or seq scan, with an optional timeout.
+#                                              Partition-aware row counts (--partitions): leaf partitions rolled up to their partitioned table.
 ##########################################################################################
-import string, curses, sys, os, subprocess, time, datetime, types, warnings, random, getpass, signal
+import string, curses, sys, os, subprocess, time, datetime, types, warnings, random, getpass, signal, threading, math
 from optparse  import OptionParser
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 from decimal import *
+import hashlib, gzip, json, itertools, re, collections
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    import asyncio
+    import concurrent.futures
+except ImportError:
+    # python 2: no fan-out mode
+    asyncio = None
+try:
+    import psycopg
+except ImportError:
+    # psycopg 3 is optional: without it --pipeline falls back to the psycopg2 workers
+    psycopg = None
+try:
+    import resource
+except ImportError:
+    # windows: --timings reports no peak RSS
+    resource = None
+try:
+    import tracemalloc
+except ImportError:
+    # python 2: --profile reports no per-phase peak memory
+    tracemalloc = None
+try:
+    import sqlite3
+except ImportError:
+    # python built without sqlite: the catalog cache is simply not available
+    sqlite3 = None
 import psycopg2
+try:
+    intern = sys.intern
+except AttributeError:
+    # python 2: intern is a builtin
+    pass
+try:
+    process_time = time.process_time
+except AttributeError:
+    # python 2: time.clock is the processor time of the process
+    process_time = time.clock
 
 DESCRIPTION="This python utility program compares schemas for a specific database."
-VERSION    = 3.2
+VERSION    = 4.0
 PROGNAME   = "pg_match"
-ADATE      = "January 18, 2023"
-PROGDATE   = "2023-01-18"
+ADATE      = "October 17, 2026"
+PROGDATE   = "2026-10-17"
 
 #Globals
 FAIL = 1
@@ -73,7 +142,135 @@ ERR   ="ERROR "
 FATAL ="FATAL "
 DIFF  ="DIFF  "
 
+# Catalog cache: default location and size limit (MB) of the on-disk cache of Phase 1-5 query results
+CACHEFILE      = os.path.join(os.path.expanduser('~'), '.pg_match_cache.db')
+CACHEMB        = 64
+
+# Schema snapshot files (--export/--Tsnapshot): format tag checked on load
+SNAPSHOTFORMAT = 'pg_match-schema-snapshot-1'
+
+# Fan-out mode: settings every per-target maint takes over from the command line
+FANOUT_SETTINGS = ('Shost', 'Sport', 'Suser', 'Sdb', 'Sschema', 'scantype', 'logging', 'verbose', 'IgnoreRowCounts', 'IgnoreIndexes',
+                   'IgnoreFuncs', 'IgnoreColumns', 'workers', 'snapshot', 'NoCache', 'cachemb', 'pipeline', 'jsoncatalog', 'InfoSchema', 'profiler', 'ndjson', 'maxdiffs', 'counttimeout', 'Partitions')
+
+# Multi-schema mode: settings every schema pair takes over from the coordinator, and the
+# placeholder the schema literal is generated as before it becomes a LATERAL column reference
+MULTISCHEMA_SETTINGS = FANOUT_SETTINGS + ('Thost', 'Tport', 'Tuser', 'Tdb', 'samplepct', 'Checksums', 'queueS', 'queueT',
+                                          'pg_version_numS', 'pg_version_numT', 'prokindS', 'prokindT', 'is_prokind', 'poolS', 'poolT', 'stopped')
+SCHEMATOKEN = '@@pg_match_schema@@'
+
+# Incremental mode: per-object catalog queries, the kind of change marker their rows belong to,
+# the output column holding the object key, and the ORDER BY of the full query.
+INCREMENTALFORMAT  = 'pg_match-incremental-1'
+INCREMENTAL_QUERIES = {'columns':     ('table', 'table_name', '1,2'),
+                       'constraints': ('table', 'tablename',  '1,2'),
+                       'indexes':     ('table', 'tablename',  '1,2'),
+                       'funcs':       ('func',  'ddldef',     '1')}
+
+# DetailedScan count strategies: the all-visible share of a table's pages above which its primary key is
+# counted with an index-only scan, and the heap size (MB) above which a parallel seq scan with this many workers is used
+COUNTALLVISIBLE = 0.9
+COUNTPARALLELMB = 1024
+COUNTPARALLEL   = 4
+
+# SampleScan: z value for 95% confidence intervals, the page size used to size tables,
+# and the fewest expected sampled pages before a table is counted exactly instead
+Z95            = 1.96
+BLOCKSIZE      = 8192
+MINSAMPLEPAGES = 10
+
+# catalog queries run on both sides, in phase order: (query name, phase, error label)
+CATALOG_QUERIES = (('objects',     1, 'Object Count Diff'),
+                   ('comments',    1, 'Comments'),
+                   ('tables',      2, 'Table Diff'),
+                   ('views',       2, 'View Diff'),
+                   ('columns',     3, 'Column Diff'),
+                   ('constraints', 4, 'Constraints Diff'),
+                   ('indexes',     4, 'Indexes Diff'),
+                   ('funcs',       5, 'Funcs/Procs'),
+                   ('rowcounts',   6, 'Table Row Counts'),
+                   ('tablesizes',  7, 'Table Sizes'))
+
+# the Compare* method of each phase: the name --timings and --profile report a phase and its catalog queries under
+PHASE_METHODS = {1: 'CompareObjects', 2: 'CompareTablesViews', 3: 'CompareColumns', 4: 'CompareKeysIndexes',
+                 5: 'CompareFuncsProcs', 6: 'CompareRowCounts', 7: 'CompareChecksums'}
+
+# --profile: the slowest queries listed at exit
+PROFILETOP = 20
+
+# --ndjson: records buffered per write, and the object type of each diff category
+NDJSONBATCH      = 500
+DIFF_OBJECTTYPES = {'Object Count Diff': 'schema', 'Comments Diff': 'comment', 'Tables Diff': 'table', 'Views Diff': 'view',
+                    'Columns Diff': 'table', 'Attributes Diff': 'column', 'Constraints Diff': 'constraint', 'Indexes Diff': 'index',
+                    'Funcs/Procs Diff': 'function', 'Row Counts Diff': 'table', 'Checksums Diff': 'table', 'Schema Diff': 'schema'}
+
+#####################################################################
+# Background log writer: logit, Echo and the progress lines queue   #
+# their text, and one thread writes it to the console and the log   #
+# file in batches, so the diff loops never wait on terminal I/O.    #
+# A deque and a busy flag instead of a Queue: no locks, so Drain is #
+# safe to call from the SIGINT handler.                             #
+#####################################################################
+class logwriter:
+    def __init__(self):
+        self.pending = collections.deque()
+        self.busy    = False
+        self.thread  = None
+        self.stamp   = (None, '')
+
+    def Now(self):
+        # the log timestamp has one second resolution, so it is formatted once per second
+        secs = int(time.time())
+        if self.stamp[0] != secs:
+            self.stamp = (secs, datetime.datetime.fromtimestamp(secs).strftime("%y-%m-%d %H:%M:%S "))
+        return self.stamp[1]
+
+    def Put(self, f, text):
+        # text goes to f (sys.stdout or a log file) as is, line ends included
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.Writer)
+            self.thread.daemon = True
+            self.thread.start()
+        self.pending.append((f, text))
+
+    def Writer(self):
+        while True:
+            if not self.pending:
+                time.sleep(0.02)
+                continue
+            self.busy = True
+            # everything queued so far, consecutive texts for the same file joined into one write
+            runs = []
+            while self.pending:
+                f, text = self.pending.popleft()
+                if runs and runs[-1][0] is f:
+                    runs[-1][1].append(text)
+                else:
+                    runs.append((f, [text]))
+            for f, texts in runs:
+                try:
+                    f.write(''.join(texts))
+                except Exception:
+                    pass
+            for f in set([f for f, texts in runs]):
+                try:
+                    f.flush()
+                except Exception:
+                    pass
+            self.busy = False
+
+    def Drain(self, timeout=10.0):
+        # wait until the writer thread has written everything queued so far
+        waited = 0.0
+        while (self.pending or self.busy) and waited < timeout:
+            time.sleep(0.01)
+            waited += 0.01
+
+LOGWRITER = logwriter()
+
 def signal_handler(signal, frame):
+     # whatever is still queued for the console and log file goes out first
+     LOGWRITER.Drain()
      print('User-interrupted!')
      # sys.exit only creates an exception, it doesn't really exit!
      #sys.exit(1)
@@ -89,7 +286,148 @@ def signal_handler(signal, frame):
          #sys._exit(1)
          # --> AttributeError: 'module' object has no attribute '_exit'
          exit(1)
-         
+
+
+#############################################################
+# One query for one side, executed by a pooled connection.  #
+#############################################################
+class querytask:
+    def __init__(self, name, side, sql):
+        self.name  = name
+        self.side  = side
+        self.sql   = sql
+        self.phase = ''
+        # settings (name, value) set for this query alone: count strategies, timeouts, checksum output formats
+        self.settings = None
+        self.rows  = None
+        self.error = None
+        self.done  = threading.Event()
+
+
+#####################################################################
+# Profile data (--profile): one record per executed query and one   #
+# per phase, shared by every maint of the run.                      #
+#####################################################################
+class profiledata:
+    def __init__(self):
+        self.queries = []
+        self.phases  = []
+
+
+#####################################################################
+# NDJSON diff output (--ndjson): one json record per line, kept in  #
+# a buffer and written NDJSONBATCH lines at a time.  Fan-out        #
+# targets share one writer, so writes are serialized.               #
+#####################################################################
+class ndjsonwriter:
+    def __init__(self, f, batch):
+        self.f     = f
+        self.batch = batch
+        self.lines = []
+        self.lock  = threading.Lock()
+
+    def Write(self, record):
+        line = json.dumps(record, default=str, separators=(',', ':'))
+        with self.lock:
+            self.lines.append(line)
+            if len(self.lines) >= self.batch:
+                self.WriteLines()
+
+    def Flush(self):
+        with self.lock:
+            self.WriteLines()
+
+    def WriteLines(self):
+        # caller holds the lock; flushed so a reader at the other end of a pipe sees each batch as it is written
+        if self.lines:
+            self.f.write('\n'.join(self.lines) + '\n')
+            self.f.flush()
+            self.lines = []
+
+
+#####################################################################
+# Keyed diff: match source rows to target rows on their natural key #
+# (table name, table+constraint, table+index, function signature)  #
+# in one pass over each side instead of nested loops.               #
+#####################################################################
+class keyeddiff:
+    def __init__(self, Srows, Trows, keyfunc, firstmatch=False):
+        # when a key repeats in the target, the source row is paired with every target row of that key in target
+        # order, like the old loops that compared each match; firstmatch keeps only the first, like the loops that broke
+        index = {}
+        for tRow in Trows:
+            index.setdefault(keyfunc(tRow), []).append(tRow)
+
+        # pairs: every source row in source order with its target row(s), or None if missing in target
+        skeys = set()
+        self.pairs = []
+        for sRow in Srows:
+            key = keyfunc(sRow)
+            skeys.add(key)
+            tRows = index.get(key, [None])
+            for tRow in (tRows[:1] if firstmatch else tRows):
+                self.pairs.append((sRow, tRow))
+
+        self.matched    = [(sRow, tRow) for sRow, tRow in self.pairs if tRow is not None]
+        self.sourceonly = [sRow for sRow, tRow in self.pairs if tRow is None]
+        self.targetonly = [tRow for tRow in Trows if keyfunc(tRow) not in skeys]
+
+
+#####################################################################
+# Catalog records: one slotted object per per-object catalog row.   #
+# String fields are interned, so the names, types and YES/NO flags  #
+# repeated across thousands of rows are held once per side.         #
+# 'compared' lists the fields the phase checks, in report order,    #
+# with the label its DIFF line uses.                                #
+#####################################################################
+class catalogrecord(object):
+    __slots__ = ()
+    compared  = ()
+
+    def __init__(self, row):
+        for field, value in zip(self.__slots__, row):
+            setattr(self, field, intern(value) if type(value) is str else value)
+
+    def Mismatches(self, other, skip=()):
+        # the compared fields whose values differ, each with its label
+        return [(field, label) for field, label in self.compared if field not in skip and getattr(self, field) != getattr(other, field)]
+
+class tablerecord(catalogrecord):
+    __slots__ = ('name', 'owner', 'tablespace', 'hasindexes', 'hasrules', 'hastriggers', 'rowsecurity')
+    compared  = (('tablespace', 'TableSpace'), ('hasindexes', 'HasIndexes'), ('hasrules', 'HasRules'), ('hastriggers', 'HasTriggers'), ('rowsecurity', 'RowSecurity'))
+
+class viewrecord(catalogrecord):
+    __slots__ = ('name', 'definition', 'checkoption', 'isupdatable', 'isinsertable', 'istriggerupdatable', 'istriggerdeletable', 'istriggerinsertable')
+    compared  = (('definition', 'def'), ('checkoption', 'CheckOption'), ('isupdatable', 'IsUpdatable'), ('isinsertable', 'IsInsertable_into'),
+                 ('istriggerupdatable', 'IsTriggerUpdatable'), ('istriggerdeletable', 'IsTriggerDeletable'), ('istriggerinsertable', 'IsTriggerInsertable_into'))
+
+class columnrecord(catalogrecord):
+    __slots__ = ('table', 'ordinal', 'name', 'default', 'isnullable', 'datatype', 'charmaxlen', 'numprecradix', 'numscale', 'isidentity', 'isgenerated')
+    compared  = (('ordinal', 'Ordinal Position'), ('default', 'Default'), ('isnullable', 'Is Nullable'), ('datatype', 'Data Type'), ('charmaxlen', 'Char Max Len'),
+                 ('numprecradix', 'Numeric Precision Radix'), ('numscale', 'Numeric Scale'), ('isidentity', 'Is Identity'), ('isgenerated', 'Is Generated'))
+
+class constraintrecord(catalogrecord):
+    __slots__ = ('table', 'name', 'contype', 'confupdtype', 'confdeltype', 'confmatchtype', 'conkey', 'confkey', 'definition', 'columns')
+    compared  = (('contype', 'Constraint Type'), ('confupdtype', 'ConfUpdType'), ('confdeltype', 'ConfDelType'), ('confmatchtype', 'ConfMatchType'),
+                 ('conkey', 'ConKey'), ('confkey', 'ConfKey'), ('definition', 'ConstraintDef'))
+
+class indexrecord(catalogrecord):
+    __slots__ = ('table', 'name', 'natts', 'nkeyatts', 'isunique', 'isprimary', 'isexclusion', 'isimmediate', 'isclustered', 'isvalid', 'isready', 'islive',
+                 'indkey', 'keycols', 'indexdef')
+    compared  = (('natts', 'Index IndNatts'), ('nkeyatts', 'Index KeyAtts'), ('isunique', 'Index IsUnique'), ('isprimary', 'Index IsPrimary'),
+                 ('isexclusion', 'Index IsExclusion'), ('isclustered', 'Index IsClustered'), ('isvalid', 'Index IsValid'), ('isready', 'Index IsReady'),
+                 ('islive', 'Index IsLive'), ('indkey', 'Index IndKey'), ('keycols', 'Index KeyCols'), ('indexdef', 'Index IndexDef'))
+
+class funcrecord(catalogrecord):
+    __slots__ = ('ddldef',)
+
+class rowcountrecord(catalogrecord):
+    __slots__ = ('table', 'rowcnt', 'stattable', 'livetup', 'relsize')
+
+# the record type each per-object catalog query is loaded into; other queries stay plain tuples
+CATALOG_RECORDS = {'tables': tablerecord, 'views': viewrecord, 'columns': columnrecord, 'constraints': constraintrecord,
+                   'indexes': indexrecord, 'funcs': funcrecord, 'rowcounts': rowcountrecord}
+
 class maint:
     def __init__(self):
         self.PythonVersion     =  sys.version_info[0]
@@ -124,9 +462,72 @@ class maint:
         self.funcdiffs         = 0;
         self.viewdiffs         = 0;
         self.rowcntdiffs       = 0;
+        self.datadiffs         = 0;
         self.is_prokind        = True;
         self.pg_version_numS   = 0;
         self.pg_version_numT   = 0;
+        self.IgnoreRowCounts   = False
+        self.IgnoreIndexes     = False
+        self.IgnoreFuncs       = False
+        self.IgnoreColumns     = False
+        self.Checksums         = False
+        self.Partitions        = False
+        self.samplepct         = 1.0
+        self.snapshot          = False
+        self.snapshots         = {}
+        self.NoCache           = False
+        self.cachemb           = CACHEMB
+        self.cache             = None
+        self.cachekeys         = {}
+        self.cachehits         = set()
+        self.Export            = ''
+        self.Tsnapshot         = ''
+        self.schemasnap        = None
+        self.prokindS          = True
+        self.prokindT          = True
+        self.Incremental       = ''
+        self.incmarkers        = {}
+        self.incplans          = {}
+        self.incresults        = {}
+        self.Targets           = ''
+        self.fanout            = False
+        self.sourcerows        = None
+        self.report            = None
+        self.diffobjects       = set()
+        self.multischema       = False
+        self.AllSchemas        = False
+        self.SchemaMap         = ''
+        self.targetrows        = None
+        self.pipeline          = False
+        self.batches           = None
+        self.jsoncatalog       = False
+        self.itersize          = 0
+        self.InfoSchema        = False
+        self.Timings           = ''
+        self.phasetimes        = []
+        self.batchthreads      = []
+        self.Profile           = False
+        self.ProfileJson       = ''
+        self.profiler          = None
+        self.Metrics           = ''
+        self.ndjson            = None
+        self.maxdiffs          = 0
+        self.counttimeout      = 0
+        self.stopped           = threading.Event()
+        self.diffcounts        = {}
+        self.countedtables     = 0
+        self.currentphase      = 'Setup'
+        self.runsecs           = 0.0
+        self.runs              = []
+
+        # query engine: connections per side, work queues and submitted tasks
+        self.workers           = 2
+        self.poolS             = []
+        self.poolT             = []
+        self.queueS            = queue.Queue()
+        self.queueT            = queue.Queue()
+        self.threads           = []
+        self.tasks             = {}
 
 
     #######################
@@ -144,33 +545,87 @@ class maint:
             self.logfile = "%spg_match_%s.log" % (path,now)
             self.flog = open(self.logfile, 'a')
 
-        now = datetime.datetime.now().strftime("%y-%m-%d %H:%M:%S ")
+        now = LOGWRITER.Now()
         if self.logging:
-            self.flog.write(severity + now + msg + "\n")
+            LOGWRITER.Put(self.flog, severity + now + msg + "\n")
         if self.verbose:
-            print (now + ' ' + msg)
+            self.Echo(now + ' ' + msg)
         else:    
-            print (msg)
+            self.Echo(msg)
         return self.flog
 
+    def Echo(self, msg=''):
+        # console output, written by the background log writer; in fan-out mode it is kept with this target's report instead
+        if self.report is not None:
+            self.report.append(msg)
+        else:
+            LOGWRITER.Put(sys.stdout, '%s\n' % msg)
+
+    def Progress(self, msg):
+        # a progress line, overwritten in place by the next one; queued behind the log lines printed before it
+        LOGWRITER.Put(sys.stdout, '\r' + msg)
+
+    def ReportDiff(self, typediff, objkey, msg, attribute='', svalue=None, tvalue=None, extra=None, counter='ddldiffs'):
+        # every difference goes through here: counted (ddldiffs, rowcntdiffs or datadiffs), logged, counted per category for
+        # --metrics, remembered per object for the fan-out drift matrix, and with --ndjson written as a record with the
+        # differing attribute and both values
+        if self.stopped.is_set():
+            # --max_diffs: the budget is used up, differences in rows already fetched are neither counted nor reported
+            return
+        setattr(self, counter, getattr(self, counter) + 1)
+        category = typediff.strip(' :')
+        self.diffobjects.add((category, objkey))
+        self.diffcounts[category] = self.diffcounts.get(category, 0) + 1
+        if self.ndjson is not None:
+            record = {'phase': self.currentphase, 'objtype': DIFF_OBJECTTYPES.get(category, category), 'objkey': objkey, 'attribute': attribute,
+                      'source_value': svalue, 'target_value': tvalue, 'category': category, 'source_schema': self.Sschema, 'target_schema': self.Tschema}
+            if self.report is not None:
+                # fan-out: which target this record belongs to
+                record['target'] = '%s:%s/%s' % (self.Thost, self.Tport, self.Tdb)
+            if extra:
+                record.update(extra)
+            self.ndjson.Write(record)
+        self.logit(DIFF, msg)
+        if self.maxdiffs > 0 and self.ddldiffs + self.rowcntdiffs + self.datadiffs >= self.maxdiffs:
+            self.StopQueries("Diff budget (%d) reached: cancelling the remaining queries." % self.maxdiffs)
+
     ##########################
     # close stuff gracefully #
     ##########################
-    def CloseStuff(self):
+    def CloseStuff(self, rc=RC_OK):
+
+        # diff records still in the --ndjson buffer
+        if self.ndjson is not None:
+            self.ndjson.Flush()
+        # and the console and log file lines the background writer has not written yet
+        LOGWRITER.Drain()
 
         # rollback any unintentional changes
-        if self.connS is None:
+        if self.connS is None and self.connT is None:
             # nothing to rollback
             if self.flog:
                 self.flog.close()            
             return    
+
+        # stop the query workers, then release the extra pool connections.
+        # In snapshot mode this ends the importing transactions before the coordinators below release theirs.
+        # After an error, queries may still be queued or running (real counts, checksums): drop and cancel them
+        # first, or joining the workers times out and rollback() waits on the connection until the server is done.
+        if rc not in (RC_OK, RC_DIFF) and not self.stopped.is_set():
+            self.StopQueries()
+        for t in self.batchthreads:
+            t.join(5)
+        self.StopWorkers()
+        for conn in self.poolS[1:] + self.poolT[1:]:
+            conn.rollback()
+            conn.close()
             
         if self.connS is not None:
             self.connS.rollback()
         if self.connT is not None:            
             self.connT.rollback()
 
-        if self.curS is not None:
+        if self.connS is not None:
             self.curS.close()
             self.connS.close()
     
@@ -178,6 +633,9 @@ class maint:
             self.curT.close()        
             self.connT.close()
 
+        if self.cache is not None:
+            self.cache.close()
+
         if self.flog:
             self.flog.close()
 
@@ -188,208 +646,1010 @@ class maint:
     # Connection function #
     #######################
     def ConnectAll(self):
-        # get connection and cursor handles for source and target databases
-    
-        self.connstrS = "dbname=%s port=%d user=%s host=%s application_name=%s" % (self.Sdb, self.Sport, self.Suser, self.Shost, PROGNAME)
-        try:
-            self.connS = psycopg2.connect(self.connstrS)
-        except Exception as error:
-            msg="Source Connection Error %s *** %s" % (type(error), error)
-            if 'fe_sendauth: no password supplied' in msg:
-                # prompt them for password and try again
-                apass = getpass.getpass(prompt='Enter Source DB Password: ')
-                self.connstrS = "dbname=%s port=%d user=%s host=%s application_name=%s password=%s" % (self.Sdb, self.Sport, self.Suser, self.Shost, PROGNAME, apass)
-                try:
-                    self.connS = psycopg2.connect(self.connstrS)
-                except Exception as error:
-                    msg="Source Connection Error %s *** %s" % (type(error), error)                    
-                    self.logit(ERR, msg)
-                    return RC_ERR
-                self.curS = self.connS.cursor()                    
-            else:                    
-                # some other connection error
-                self.logit(ERR, msg)
-                return RC_ERR
-        self.curS = self.connS.cursor()
+        # get connection and cursor handles for source and target databases.
+        # A side read from a schema snapshot file (--Tsnapshot) has no connection; export mode (--export) only needs the target.
+        for side in ('S', 'T'):
+            if side == 'S' and (self.Export != '' or self.sourcerows is not None):
+                continue
+            if side == 'T' and self.fanout:
+                continue
+            if side == 'T' and self.Tsnapshot != '':
+                rc = self.LoadSchemaSnapshot()
+            else:
+                rc = self.ConnectSide(side)
+            if rc != RC_OK:
+                return rc
 
-     
-        self.connstrT = "dbname=%s port=%d user=%s host=%s application_name=%s" % (self.Tdb, self.Tport, self.Tuser, self.Thost, PROGNAME)
+        # For backward compatibility, Source and Target schemas must both be v10 if either one of them is v10.
+        if self.Export == '' and not self.fanout and self.prokindS != self.prokindT:
+            # version mismatch
+            msg="For backward compatibility, Source and Target schemas must both be v10 if either one of them is v10."
+            self.logit(ERR, msg)
+            return RC_ERR            
+        self.is_prokind = self.prokindT if self.Export != '' else self.prokindS
+
+        # Snapshot mode: the coordinator connections export the snapshots the rest of the pool imports
+        if self.snapshot:
+            rc = self.ExportSnapshots()
+            if rc != RC_OK:
+                return rc
+
+        # open the rest of the connection pool and start the query workers
+        rc = self.StartWorkers()
+        return rc
+
+    def ConnectSide(self, side):
+        if side == 'S':
+            label, host, port, user, db, schema = 'Source', self.Shost, self.Sport, self.Suser, self.Sdb, self.Sschema
+        else:
+            label, host, port, user, db, schema = 'Target', self.Thost, self.Tport, self.Tuser, self.Tdb, self.Tschema
+
+        connstr = "dbname=%s port=%d user=%s host=%s application_name=%s" % (db, port, user, host, PROGNAME)
         try:
-            self.connT = psycopg2.connect(self.connstrT)
+            conn = psycopg2.connect(connstr)
         except Exception as error:
-            msg="Target Connection Error %s *** %s" % (type(error), error)
+            msg="%s Connection Error %s *** %s" % (label, type(error), error)
             if 'fe_sendauth: no password supplied' in msg:
                 # prompt them for password and try again
-                apass = getpass.getpass(prompt='Enter Target DB Password: ')
-                self.connstrT = "dbname=%s port=%d user=%s host=%s application_name=%s password=%s" % (self.Tdb, self.Tport, self.Tuser, self.Thost, PROGNAME, apass)
+                apass = getpass.getpass(prompt='Enter %s DB Password: ' % label)
+                connstr = "dbname=%s port=%d user=%s host=%s application_name=%s password=%s" % (db, port, user, host, PROGNAME, apass)
                 try:
-                    self.connT = psycopg2.connect(self.connstrT)
+                    conn = psycopg2.connect(connstr)
                 except Exception as error:
-                    msg="Target Connection Error %s *** %s" % (type(error), error)                    
+                    msg="%s Connection Error %s *** %s" % (label, type(error), error)                    
                     self.logit(ERR, msg)
                     return RC_ERR
-                self.curT = self.connT.cursor()                    
             else:                    
+                # some other connection error
                 self.logit(ERR, msg)
                 return RC_ERR
-        self.curT = self.connT.cursor()
+        cur = conn.cursor()
+        if side == 'S':
+            self.connstrS, self.connS, self.curS = connstr, conn, cur
+        else:
+            self.connstrT, self.connT, self.curT = connstr, conn, cur
 
         # For compatibility with PG V10, check if pg_proc.prokind exists.  If not determine function another way.
         sql = "SELECT count(*) FROM pg_attribute WHERE  attrelid = 'pg_proc'::regclass AND attname = 'prokind'"
         try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Schema Version Check Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-        arow = self.curS.fetchone()
-        if len(arow) == 0:
-            msg="Source schema Version Check Error: No rows returned."
-            self.logit(ERR, msg)
-            return RC_ERR    
-        if arow[0] == 0:
-            self.is_prokind = False;
-        else:
-            self.is_prokind = True;
-
-        # Target schema must also be v10 if source is v10.
-        try:              
-            self.curT.execute(sql)
+            rows = self.ExecuteQuery(cur, 'prokind', side, sql)
         except Exception as error:
-            msg="Target Schema Version Check Error %s *** %s" % (type(error), error)
+            msg="%s Schema Version Check Error %s *** %s" % (label, type(error), error)
             self.logit(ERR, msg)
             return RC_ERR
-        arow = self.curT.fetchone()
+        arow = rows[0] if rows else ()
         if len(arow) == 0:
-            msg="Target schema Version Check Error: No rows returned."
+            msg="%s schema Version Check Error: No rows returned." % label
             self.logit(ERR, msg)
             return RC_ERR    
-        if (not self.is_prokind and arow[0] > 0) or (self.is_prokind and arow[0] == 0):
-            # version mismatch
-            msg="For backward compatibility, Source and Target schemas must both be v10 if either one of them is v10."
-            self.logit(ERR, msg)
-            return RC_ERR            
+        prokind = arow[0] > 0
 
-        # get source and target PG version numbers for logic later...	
+        # get PG version number for logic later...	
         sql = "SELECT setting FROM pg_settings WHERE name = 'server_version_num'"
         try:              
-            self.curS.execute(sql)
+            rows = self.ExecuteQuery(cur, 'version', side, sql)
         except Exception as error:
-            msg="Source PG Version Check Error %s *** %s" % (type(error), error)
+            msg="%s PG Version Check Error %s *** %s" % (label, type(error), error)
             self.logit(ERR, msg)
             return RC_ERR
-        arow = self.curS.fetchone()
+        arow = rows[0] if rows else ()
         if len(arow) == 0:
-            msg="Source PG Version Check Error: No rows returned."
+            msg="%s PG Version Check Error: No rows returned." % label
             self.logit(ERR, msg)
             return RC_ERR    
-        self.pg_version_numS = int(arow[0])
-        if self.pg_version_numS < 100000:
-          msg = "Source PG Version Number: %d   PG Versions older than v10 are not supported." % self.pg_version_numS
+        version = int(arow[0])
+        if version < 100000:
+          msg = "%s PG Version Number: %d   PG Versions older than v10 are not supported." % (label, version)
           self.logit(ERR, msg)
           return RC_ERR    
+        if side == 'S':
+            self.prokindS, self.pg_version_numS = prokind, version
+        else:
+            self.prokindT, self.pg_version_numT = prokind, version
+
+        # multi-schema mode validates its schema list later
+        if self.multischema:
+            return RC_OK
 
+        # Validate schema exists
+        sql = "SELECT count(*) FROM pg_namespace n WHERE n.nspname = '%s'" % schema
         try:              
-            self.curT.execute(sql)
+            rows = self.ExecuteQuery(cur, 'schema', side, sql)
         except Exception as error:
-            msg="Target PG Version Check Error %s *** %s" % (type(error), error)
+            msg="%s Schema Validation Error %s *** %s" % (label, type(error), error)
             self.logit(ERR, msg)
             return RC_ERR
-        arow = self.curT.fetchone()
+        arow = rows[0] if rows else ()
         if len(arow) == 0:
-            msg="Target PG Version Check Error: No rows returned."
+            msg="%s schema Validation Count Error: No rows returned." % label
             self.logit(ERR, msg)
             return RC_ERR    
-        self.pg_version_numT = int(arow[0])
-        if self.pg_version_numT < 100000:
-          msg = "Target PG Version Number: %d   PG Versions older than v10 are not supported." % self.pg_version_numT
-          self.logit(ERR, msg)
-          return RC_ERR    
+        if arow[0] == 0:
+            msg="%s schema (%s) not found." % (label, schema)
+            self.logit(ERR, msg)
+            return RC_ERR            
+        return RC_OK
 
-        # Validate schemas exist
-        sql = "SELECT count(*) FROM pg_namespace n WHERE n.nspname = '%s'" % self.Sschema
-        try:              
-            self.curS.execute(sql)
+    def ExportSnapshots(self):
+        # end the implicit transaction of the checks above and open a REPEATABLE READ one on each coordinator.
+        # It stays open until CloseStuff, since an exported snapshot is only importable while its transaction lives.
+        for side, conn, cur in (('S', self.connS, self.curS), ('T', self.connT, self.curT)):
+            if conn is None:
+                continue
+            label = 'Source' if side == 'S' else 'Target'
+            try:
+                conn.rollback()
+                conn.set_session(isolation_level='REPEATABLE READ')
+                arow = self.ExecuteQuery(cur, 'exportsnapshot', side, "SELECT pg_export_snapshot()")[0]
+            except Exception as error:
+                msg="%s Snapshot Export Error %s *** %s" % (label, type(error), error)
+                self.logit(ERR, msg)
+                return RC_ERR
+            self.snapshots[side] = arow[0]
+            self.logit(DEBUG, "%s snapshot exported: %s" % (label, arow[0]))
+        return RC_OK
+
+    def ImportSnapshot(self, conn, side):
+        # SET TRANSACTION SNAPSHOT must be the first statement of a REPEATABLE READ transaction
+        label = 'Source' if side == 'S' else 'Target'
+        try:
+            conn.set_session(isolation_level='REPEATABLE READ')
+            cur = conn.cursor()
+            self.ExecuteQuery(cur, 'importsnapshot', side, "SET TRANSACTION SNAPSHOT '%s'" % self.snapshots[side])
+            cur.close()
         except Exception as error:
-            msg="Source Schema Validation Error %s *** %s" % (type(error), error)
+            msg="%s Snapshot Import Error %s *** %s" % (label, type(error), error)
             self.logit(ERR, msg)
             return RC_ERR
-        arow = self.curS.fetchone()
-        if len(arow) == 0:
-            msg="Source schema Validation Count Error: No rows returned."
+        return RC_OK
+
+    #################################################################
+    # Query engine: pooled source/target connections, one worker    #
+    # thread per connection, fed from a work queue per side.        #
+    #################################################################
+    def StartWorkers(self):
+        # one pool per connected side; a side read from a schema snapshot file has none
+        self.poolS = [self.connS] if self.connS is not None else []
+        self.poolT = [self.connT] if self.connT is not None else []
+        for side, pool, connstr in (('S', self.poolS, self.connstrS), ('T', self.poolT, self.connstrT)):
+            label = 'Source' if side == 'S' else 'Target'
+            for i in range(1, self.workers if pool else 0):
+                try:
+                    conn = psycopg2.connect(connstr)
+                except Exception as error:
+                    msg="%s Pool Connection Error %s *** %s" % (label, type(error), error)
+                    self.logit(ERR, msg)
+                    return RC_ERR
+                pool.append(conn)
+                if self.snapshot and self.ImportSnapshot(conn, side) != RC_OK:
+                    return RC_ERR
+
+        for pool, tasks in ((self.poolS, self.queueS), (self.poolT, self.queueT)):
+            for conn in pool:
+                t = threading.Thread(target=self.QueryWorker, args=(conn, tasks))
+                t.daemon = True
+                t.start()
+                self.threads.append((t, tasks))
+        return RC_OK
+
+    def StopQueries(self, msg=None):
+        # --max_diffs used up, or a run ending with an error: queued tasks are failed without running, and every
+        # pooled connection gets a cancel request so the server stops whatever it is scanning for us right away.
+        if msg is not None:
+            self.logit(WARN, msg)
+        self.stopped.set()
+        for tasks in (self.queueS, self.queueT):
+            stops = 0
+            while True:
+                try:
+                    task = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    stops = stops + 1
+                    continue
+                task.error = Exception('cancelled: run stopped')
+                task.done.set()
+            for i in range(stops):
+                tasks.put(None)
+        for conn in self.poolS + self.poolT:
+            try:
+                conn.cancel()
+            except Exception:
+                pass
+
+    def StopWorkers(self):
+        for t, tasks in self.threads:
+            tasks.put(None)
+        for t, tasks in self.threads:
+            t.join(5)
+        self.threads = []
+
+    def QueryWorker(self, conn, tasks):
+        # runs in its own thread: execute queued tasks on this connection until told to stop
+        cur = conn.cursor()
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            if self.stopped.is_set():
+                # taken off the queue just before StopQueries emptied it
+                task.error = Exception('cancelled: run stopped')
+                task.done.set()
+                continue
+            # In snapshot mode every task runs inside a savepoint: a failed one (the json catalog or incremental
+            # markers query falling back, a statement timeout) is rolled back to it, and the transaction holding the
+            # exported or imported snapshot lives on.  Task settings are scoped to the savepoint in any mode.
+            savepoint = self.snapshot or bool(task.settings)
+            try:
+                if savepoint:
+                    cur.execute('SAVEPOINT pg_match_task' + ''.join(['; SET LOCAL %s = %s' % setting for setting in task.settings or ()]))
+                task.rows = self.ExecuteQuery(cur, task.name, task.side, task.sql, task.phase)
+            except Exception as error:
+                task.error = error
+            if savepoint:
+                try:
+                    cur.execute('ROLLBACK TO SAVEPOINT pg_match_task; RELEASE SAVEPOINT pg_match_task')
+                except Exception as error:
+                    conn.rollback()
+                    if self.snapshot:
+                        msg="%s snapshot lost after %s query error %s *** %s: later queries on this connection read the current state" % \
+                            ('Source' if task.side == 'S' else 'Target', task.name, type(error), error)
+                        self.logit(ERR, msg)
+            elif task.error is not None:
+                conn.rollback()
+            task.done.set()
+        cur.close()
+
+    def ExecuteQuery(self, cur, name, side, sql, phase=''):
+        # execute and fetch on a psycopg2 cursor; with --profile the query is recorded with both times
+        started = time.time()
+        cur.execute(sql)
+        executed = time.time()
+        rows = cur.fetchall() if cur.description is not None else []
+        if self.profiler is not None:
+            self.ProfileQuery(name, side, sql, phase, executed - started, time.time() - executed, len(rows), self.RowBytes(rows))
+        return rows
+
+    def SubmitQuery(self, name, side, sql, settings=None):
+        task = querytask(name, side, sql)
+        task.phase = self.currentphase
+        task.settings = settings
+        if self.stopped.is_set():
+            # --max_diffs or an error: nothing new is scheduled once the run is stopped
+            task.error = Exception('cancelled: run stopped')
+            task.done.set()
+            return task
+        if side == 'S':
+            self.queueS.put(task)
+        else:
+            self.queueT.put(task)
+        return task
+
+    def CompletedQuery(self, name, side, sql, rows):
+        # a task whose rows are already known (catalog cache, schema snapshot file)
+        task = querytask(name, side, sql)
+        task.rows = rows
+        task.done.set()
+        return task
+
+    def WaitQuery(self, task):
+        # wait in short slices so CTRL-C is still delivered to the main thread
+        while not task.done.wait(0.5):
+            pass
+        return task
+
+    def RunPair(self, name, label, sqlS, sqlT):
+        # run the source and target side of a query at the same time, picking up prefetched tasks if any
+        taskS = self.tasks.pop((name, 'S'), None) or self.SubmitQuery(name, 'S', sqlS)
+        taskT = self.tasks.pop((name, 'T'), None) or self.SubmitQuery(name, 'T', sqlT)
+        return self.WaitPair(label, taskS, taskT)
+
+    def WaitPair(self, label, taskS, taskT):
+        self.WaitQuery(taskS)
+        self.WaitQuery(taskT)
+        if self.stopped.is_set():
+            # the budget ran out: the phase ends here, and errors of cancelled queries are expected
+            return RC_DIFF, None, None
+        if taskS.error is not None:
+            msg="Source %s Error %s *** %s" % (label, type(taskS.error), taskS.error)
             self.logit(ERR, msg)
-            return RC_ERR    
-        if arow[0] == 0:
-            msg="Source schema (%s) not found." % self.Sschema
+            return RC_ERR, None, None
+        if taskT.error is not None:
+            msg="Target %s Error %s *** %s" % (label, type(taskT.error), taskT.error)
             self.logit(ERR, msg)
-            return RC_ERR            
-            
-        sql = "SELECT count(*) FROM pg_namespace n WHERE n.nspname = '%s'" % self.Tschema
-        try:              
-            self.curT.execute(sql)
+            return RC_ERR, None, None
+        return RC_OK, taskS.rows, taskT.rows
+
+    def FetchPair(self, qname):
+        label = [q[2] for q in CATALOG_QUERIES if q[0] == qname][0]
+        rc, Srows, Trows = self.RunPair(qname, label, self.CatalogSQL(qname, 'S'), self.CatalogSQL(qname, 'T'))
+        if rc == RC_OK:
+            Srows = self.IncrementalMerge(qname, 'S', Srows)
+            Trows = self.IncrementalMerge(qname, 'T', Trows)
+            self.CacheStore(qname, 'S', Srows)
+            self.CacheStore(qname, 'T', Trows)
+            record = CATALOG_RECORDS.get(qname)
+            if record is not None:
+                Srows = [record(row) for row in Srows]
+                Trows = [record(row) for row in Trows]
+        return rc, Srows, Trows
+
+    def PhaseEnabled(self, phase):
+        if self.Export != '':
+            # a schema snapshot file holds every catalog phase plus the row estimates
+            return phase <= 6 and (phase != 5 or self.pg_version_numT >= 110000)
+        if phase == 3:
+            return not self.IgnoreColumns
+        elif phase == 4:
+            return not self.IgnoreIndexes
+        elif phase == 5:
+            return not self.IgnoreFuncs and self.pg_version_numS >= 110000 and (self.fanout or self.pg_version_numT >= 110000)
+        elif phase == 6:
+            return not self.IgnoreRowCounts
+        elif phase == 7:
+            return self.Checksums
+        return True
+
+    def Prefetch(self):
+        # Queue the catalog queries of every enabled phase up front.  Each phase only waits for its own
+        # source/target results, so later phases are already running while earlier ones are being diffed.
+        # Results of an unchanged side come straight from the catalog cache instead.
+        if not self.NoCache:
+            self.OpenCache()
+        if self.Incremental != '' and self.Export == '':
+            self.LoadIncrementalState()
+        if self.pipeline or self.jsoncatalog:
+            self.batches = {'S': [], 'T': []}
+        for qname, phase, label in CATALOG_QUERIES:
+            if not self.PhaseEnabled(phase) or (qname == 'columns' and self.StreamEnabled()):
+                continue
+            for side in ('S', 'T'):
+                if (side == 'S' and self.Export != '') or (side == 'T' and self.fanout):
+                    continue
+                if side == 'S' and self.sourcerows is not None:
+                    self.tasks[(qname, side)] = self.CompletedQuery(qname, side, '', self.sourcerows.get(qname, []))
+                    continue
+                if side == 'T' and self.schemasnap is not None:
+                    self.tasks[(qname, side)] = self.CompletedQuery(qname, side, '', self.SnapshotRows(qname))
+                    continue
+                if side == 'T' and self.targetrows is not None:
+                    self.tasks[(qname, side)] = self.CompletedQuery(qname, side, '', self.targetrows.get(qname, []))
+                    continue
+                sql = self.CatalogSQL(qname, side)
+                task = self.CacheLoad(qname, side, sql)
+                if task is not None:
+                    # complete rows from the cache, nothing to merge
+                    self.incplans.pop((qname, side), None)
+                elif (qname, side) in self.incplans:
+                    task = self.IncrementalQuery(qname, side, sql)
+                if task is None:
+                    task = self.QueueCatalogQuery(qname, side, sql)
+                self.tasks[(qname, side)] = task
+        if self.batches is not None:
+            for side in ('S', 'T'):
+                if self.batches[side] and self.jsoncatalog:
+                    self.StartJsonCatalog(side, self.batches[side])
+                elif self.batches[side]:
+                    self.StartPipeline(side, self.batches[side])
+            self.batches = None
+
+    def QueueCatalogQuery(self, qname, side, sql):
+        # while Prefetch collects a pipeline batch the query waits for it, otherwise it goes to the workers
+        if self.batches is None:
+            return self.SubmitQuery(qname, side, sql)
+        task = querytask(qname, side, sql)
+        self.batches[side].append(task)
+        return task
+
+    #################################################################
+    # JSON catalog extraction (--json_catalog): the server builds   #
+    # one json document holding every prefetched catalog query of a #
+    # side, so the whole catalog arrives in a single round trip.    #
+    #################################################################
+    def StartJsonCatalog(self, side, batch):
+        # json_agg(q) keeps each row's columns in select-list order; the text cast lets our own decoder build the row tuples
+        parts = ["'%s', (SELECT json_agg(q) FROM (%s) q)" % (task.name, task.sql) for task in batch]
+        combined = self.SubmitQuery('jsoncatalog', side, "SELECT json_build_object(%s)::text" % ', '.join(parts))
+        t = threading.Thread(target=self.JsonCatalogWorker, args=(side, batch, combined))
+        t.daemon = True
+        t.start()
+        self.batchthreads.append(t)
+
+    def JsonCatalogWorker(self, side, batch, combined):
+        # runs in its own thread: split the document back into the batch's tasks, or run them one by one if it failed
+        label = 'Source' if side == 'S' else 'Target'
+        tasks = self.queueS if side == 'S' else self.queueT
+        self.WaitQuery(combined)
+        doc = None
+        if combined.error is None:
+            try:
+                # a row object becomes a tuple straight from its (column, value) pairs, duplicate column names included
+                doc = json.loads(combined.rows[0][0], object_pairs_hook=lambda pairs: tuple(v for k, v in pairs))
+            except Exception as error:
+                combined.error = error
+        if doc is None:
+            self.logit(WARN, "%s json catalog error, running the catalog queries one by one *** %s" % (label, combined.error))
+            for task in batch:
+                tasks.put(task)
+            return
+        for task, rows in zip(batch, doc):
+            task.rows = list(rows or [])
+            task.done.set()
+
+    #################################################################
+    # Pipeline transport (--pipeline, psycopg 3): all prefetched    #
+    # catalog queries of a side go out in one libpq pipeline on a   #
+    # connection of their own, sharing a single round trip.         #
+    #################################################################
+    def StartPipeline(self, side, batch):
+        t = threading.Thread(target=self.PipelineWorker, args=(side, batch))
+        t.daemon = True
+        t.start()
+        self.batchthreads.append(t)
+
+    def PipelineWorker(self, side, batch):
+        # runs in its own thread.  Any query the pipeline could not answer (connect error, a failed query
+        # aborting the rest of the pipeline) is handed to the psycopg2 workers of that side instead.
+        label = 'Source' if side == 'S' else 'Target'
+        tasks = self.queueS if side == 'S' else self.queueT
+        conn = None
+        curs = []
+        batchsecs = 0.0
+        try:
+            # psycopg 3 returns text as bytes when the client encoding is SQL_ASCII; UTF8 gives the str rows psycopg2 does.
+            # In autocommit mode psycopg does not wait for an implicit BEGIN, so with the BEGIN of snapshot mode sent
+            # in the pipeline too, the whole batch is a single round trip: leaving the pipeline block syncs it once.
+            conn = psycopg.connect(self.connstrS if side == 'S' else self.connstrT, client_encoding='UTF8', autocommit=True)
+            started = time.time()
+            with conn.pipeline():
+                if self.snapshot:
+                    conn.execute("BEGIN ISOLATION LEVEL REPEATABLE READ")
+                    conn.execute("SET TRANSACTION SNAPSHOT '%s'" % self.snapshots[side])
+                for task in batch:
+                    curs.append(conn.execute(task.sql))
+            batchsecs = time.time() - started
+        except Exception as error:
+            self.logit(WARN, "%s pipeline error, using the psycopg2 connections instead *** %s" % (label, error))
+        for i, task in enumerate(batch):
+            try:
+                started = time.time()
+                task.rows = curs[i].fetchall()
+                if self.profiler is not None:
+                    # one round trip for the whole batch: each query gets an equal share of it as server time
+                    self.ProfileQuery(task.name, side, task.sql, task.phase, batchsecs / len(batch), time.time() - started,
+                                      len(task.rows), self.RowBytes(task.rows))
+                task.done.set()
+            except Exception:
+                tasks.put(task)
+        if conn is not None:
+            try:
+                conn.rollback()
+                conn.close()
+            except Exception:
+                pass
+
+    #################################################################
+    # Schema snapshot files: everything the catalog queries extract #
+    # for the target side, as gzip'd columnar JSON.  --export       #
+    # writes one, --Tsnapshot compares the source against one.      #
+    #################################################################
+    def WriteSchemaSnapshot(self):
+        queries = {}
+        for qname, phase, label in CATALOG_QUERIES:
+            task = self.tasks.pop((qname, 'T'), None)
+            if task is None:
+                continue
+            self.WaitQuery(task)
+            if task.error is not None:
+                msg="Target %s Error %s *** %s" % (label, type(task.error), task.error)
+                self.logit(ERR, msg)
+                return RC_ERR
+            # one list per column: no per-row keys in the file, and loading is a single zip per query
+            queries[qname] = {'nrows': len(task.rows), 'columns': [list(col) for col in zip(*task.rows)]}
+
+        meta = {'host': self.Thost, 'port': self.Tport, 'db': self.Tdb, 'schema': self.Tschema, 'pg_version_num': self.pg_version_numT,
+                'prokind': self.prokindT, 'created': datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), 'program': '%s %.1f' % (PROGNAME, VERSION)}
+        try:
+            f = gzip.open(self.Export, 'wb')
+            f.write(json.dumps({'format': SNAPSHOTFORMAT, 'meta': meta, 'queries': queries}, default=str, separators=(',', ':')).encode('utf-8'))
+            f.close()
         except Exception as error:
-            msg="Target Schema Validation Error %s *** %s" % (type(error), error)
+            msg="Schema Snapshot Write Error %s *** %s" % (type(error), error)
             self.logit(ERR, msg)
             return RC_ERR
-        arow = self.curT.fetchone()
-        if len(arow) == 0:
-            msg="Target schema Validation Count Error: No rows returned."
+        self.logit(INFO, "Schema snapshot of %s.%s written to %s" % (self.Tdb, self.Tschema, self.Export))
+        return RC_OK
+
+    def LoadSchemaSnapshot(self):
+        try:
+            f = gzip.open(self.Tsnapshot, 'rb')
+            snap = json.loads(f.read().decode('utf-8'))
+            f.close()
+        except Exception as error:
+            msg="Target Schema Snapshot Read Error %s *** %s" % (type(error), error)
             self.logit(ERR, msg)
-            return RC_ERR    
-        if arow[0] == 0:
-            msg="Target schema (%s) not found." % self.Tschema
+            return RC_ERR
+        if not isinstance(snap, dict) or snap.get('format') != SNAPSHOTFORMAT:
+            msg="Target schema snapshot %s: not a %s schema snapshot file." % (self.Tsnapshot, PROGNAME)
             self.logit(ERR, msg)
-            return RC_ERR                
-        
+            return RC_ERR
 
+        meta = snap['meta']
+        self.Thost, self.Tport, self.Tdb, self.Tschema = meta['host'], meta['port'], meta['db'], meta['schema']
+        self.pg_version_numT = meta['pg_version_num']
+        self.prokindT        = meta['prokind']
+        self.schemasnap      = snap
+        self.logit(INFO, "Target schema %s.%s loaded from snapshot %s taken %s" % (self.Tdb, self.Tschema, self.Tsnapshot, meta['created']))
         return RC_OK
 
+    def SnapshotRows(self, qname):
+        query = self.schemasnap['queries'].get(qname)
+        if query is None:
+            return []
+        return list(zip(*query['columns']))
+
+    #################################################################
+    # Incremental mode: the state file keeps per-object change      #
+    # markers and the rows of the per-object catalog queries from   #
+    # the last run.  Only objects whose markers moved are fetched   #
+    # again; the rest are carried forward and everything is diffed  #
+    # as usual, in memory.                                          #
+    #################################################################
+    def IncrementalMarkerSQL(self, aschema, version):
+        # one marker per table/view and per function: the xmin of every catalog row that describes it, plus those its
+        # rendered definitions name: the table and columns each foreign key references, and each argument type
+        sql = "SELECT 'table', c.relname, md5(concat_ws('/', c.xmin, " \
+              "(SELECT string_agg(a.xmin::text, ',' ORDER BY a.attnum) FROM pg_attribute a WHERE a.attrelid = c.oid), " \
+              "(SELECT string_agg(ad.xmin::text, ',' ORDER BY ad.adnum) FROM pg_attrdef ad WHERE ad.adrelid = c.oid), " \
+              "(SELECT string_agg(x.xmin || ':' || i.xmin, ',' ORDER BY x.indexrelid) FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid WHERE x.indrelid = c.oid), " \
+              "(SELECT string_agg(co.xmin::text, ',' ORDER BY co.oid) FROM pg_constraint co WHERE co.conrelid = c.oid), " \
+              "(SELECT string_agg(r.xmin || ':' || (SELECT string_agg(ra.xmin::text, ',' ORDER BY ra.attnum) FROM pg_attribute ra WHERE ra.attrelid = co.confrelid AND ra.attnum = ANY (co.confkey)), " \
+              "',' ORDER BY co.oid) FROM pg_constraint co JOIN pg_class r ON r.oid = co.confrelid WHERE co.conrelid = c.oid AND co.contype = 'f'))) " \
+              "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = '%s' AND c.relkind IN ('r','p','v','m','f','c')" % aschema
+        if version >= 110000:
+            # same object key as the funcs query
+            sql = sql + " UNION ALL SELECT 'func', format('%%s:%%I(%%s)', CASE p.prokind WHEN 'p' THEN 'PROCEDURE' WHEN 'a' THEN 'AGGREGATE FUNCTION' WHEN 'w' THEN 'WINDOW FUNCTION' WHEN 'f' THEN 'FUNCTION' ELSE '' END, " \
+                        "p.proname, oidvectortypes(p.proargtypes)), md5(concat_ws('/', p.xmin, (SELECT string_agg(t.xmin::text, ',' ORDER BY t.oid) FROM pg_type t " \
+                        "WHERE t.oid = ANY (p.proargtypes::oid[])))) FROM pg_proc p JOIN pg_namespace ns ON ns.oid = p.pronamespace WHERE ns.nspname = '%s'" % aschema
+        return sql + " ORDER BY 1, 2"
+
+    def IncrementalIdent(self, side):
+        if side == 'S':
+            return "%s|%d|%s|%s" % (self.Shost, self.Sport, self.Sdb, self.Sschema)
+        return "%s|%d|%s|%s" % (self.Thost, self.Tport, self.Tdb, self.Tschema)
+
+    def LoadIncrementalState(self):
+        # marker queries for the connected sides run first; a missing or unreadable state file just means a full run
+        tasks = []
+        if self.connS is not None:
+            tasks.append(('S', self.SubmitQuery('markers', 'S', self.IncrementalMarkerSQL(self.Sschema, self.pg_version_numS))))
+        if self.connT is not None:
+            tasks.append(('T', self.SubmitQuery('markers', 'T', self.IncrementalMarkerSQL(self.Tschema, self.pg_version_numT))))
+        for side, task in tasks:
+            self.WaitQuery(task)
+            if task.error is not None:
+                self.logit(WARN, "Incremental mode bypassed: marker query failed *** %s" % task.error)
+                self.incmarkers = {}
+                return
+            self.incmarkers[side] = task.rows
+
+        state = {}
+        if os.path.exists(self.Incremental):
+            try:
+                f = gzip.open(self.Incremental, 'rb')
+                state = json.loads(f.read().decode('utf-8'))
+                f.close()
+            except Exception as error:
+                msg="Incremental state file %s ignored: %s *** %s" % (self.Incremental, type(error), error)
+                self.logit(WARN, msg)
+                state = {}
+            if state.get('format') != INCREMENTALFORMAT:
+                state = {}
+
+        for side, markers in self.incmarkers.items():
+            old = state.get('sides', {}).get(side)
+            if old is None or old['ident'] != self.IncrementalIdent(side):
+                continue
+            for qname, (kind, keycol, orderby) in INCREMENTAL_QUERIES.items():
+                query = old['queries'].get(qname)
+                if query is None or query['sql'] != hashlib.md5(self.CatalogSQL(qname, side).encode('utf-8')).hexdigest():
+                    continue
+                order   = [arow[1] for arow in markers if arow[0] == kind]
+                changed = set([arow[1] for arow in markers if arow[0] == kind and old['markers'].get(kind + '|' + arow[1]) != arow[2]])
+                carried = dict((key, [tuple(r) for r in rows]) for key, rows in query['rows'].items())
+                self.incplans[(qname, side)] = (order, changed, carried)
+
+    def IncrementalQuery(self, qname, side, sql):
+        # the full query restricted to the changed objects, or the carried rows when nothing moved
+        order, changed, carried = self.incplans[(qname, side)]
+        label = 'Source' if side == 'S' else 'Target'
+        self.logit(DEBUG, "%s %s: %d of %d objects changed since the last run." % (label, qname, len(changed), len(order)))
+        if len(changed) == 0:
+            return self.CompletedQuery(qname, side, sql, [])
+        kind, keycol, orderby = INCREMENTAL_QUERIES[qname]
+        keys = ','.join(["'%s'" % key.replace("'", "''") for key in sorted(changed)])
+        return self.QueueCatalogQuery(qname, side, "SELECT * FROM (%s) q WHERE q.%s IN (%s) ORDER BY %s" % (sql, keycol, keys, orderby))
+
+    def IncrementalMerge(self, qname, side, rows):
+        # put fetched rows of changed objects and carried rows of the others back in the full query's order
+        if self.Incremental == '' or qname not in INCREMENTAL_QUERIES or side not in self.incmarkers:
+            return rows
+        plan = self.incplans.pop((qname, side), None)
+        fresh = {}
+        for arow in rows:
+            fresh.setdefault(arow[0], []).append(arow)
+        if plan is not None:
+            order, changed, carried = plan
+            rows = []
+            for key in order:
+                rows.extend(fresh.pop(key, []) if key in changed else carried.get(key, []))
+            # objects without a marker of their own, if any, go last
+            for key in sorted(fresh):
+                rows.extend(fresh[key])
+            fresh = {}
+            for arow in rows:
+                fresh.setdefault(arow[0], []).append(arow)
+        self.incresults.setdefault(side, {})[qname] = fresh
+        return rows
+
+    def SaveIncrementalState(self):
+        sides = {}
+        for side, markers in self.incmarkers.items():
+            queries = {}
+            for qname, fresh in self.incresults.get(side, {}).items():
+                queries[qname] = {'sql': hashlib.md5(self.CatalogSQL(qname, side).encode('utf-8')).hexdigest(), 'rows': fresh}
+            sides[side] = {'ident': self.IncrementalIdent(side), 'markers': dict((arow[0] + '|' + arow[1], arow[2]) for arow in markers), 'queries': queries}
+        try:
+            f = gzip.open(self.Incremental, 'wb')
+            f.write(json.dumps({'format': INCREMENTALFORMAT, 'sides': sides}, default=str, separators=(',', ':')).encode('utf-8'))
+            f.close()
+        except Exception as error:
+            msg="Incremental state file %s not saved: %s *** %s" % (self.Incremental, type(error), error)
+            self.logit(WARN, msg)
+
+    #################################################################
+    # Catalog cache: Phase 1-5 results of each side kept in a local #
+    # SQLite file, keyed by host/port/db/schema, a fingerprint of   #
+    # the schema's catalog rows, and the query text.                #
+    #################################################################
+    def CatalogFingerprintSQL(self, aschema):
+        # row count and xmin sum of every catalog the Phase 1-5 queries read for this schema.  Any DDL
+        # inserts, deletes or rewrites (new xmin) at least one of these rows, so the fingerprint changes.
+        # Descriptions: those of everything the comments query reads, the schema itself, relations, columns,
+        # procs, types and domains, collations and policies.
+        return "WITH ns AS (SELECT oid FROM pg_namespace WHERE nspname IN ('%s', 'public')), " \
+               "rels AS (SELECT c.oid, c.xmin FROM pg_class c WHERE c.relnamespace IN (SELECT oid FROM ns)), " \
+               "procs AS (SELECT p.oid, p.xmin FROM pg_proc p WHERE p.pronamespace IN (SELECT oid FROM ns)), " \
+               "fp(k, x) AS (SELECT 'class', xmin FROM rels " \
+               "UNION ALL SELECT 'attribute', a.xmin FROM pg_attribute a WHERE a.attrelid IN (SELECT oid FROM rels) " \
+               "UNION ALL SELECT 'constraint', co.xmin FROM pg_constraint co WHERE co.connamespace IN (SELECT oid FROM ns) " \
+               "UNION ALL SELECT 'index', i.xmin FROM pg_index i WHERE i.indrelid IN (SELECT oid FROM rels) " \
+               "UNION ALL SELECT 'proc', xmin FROM procs " \
+               "UNION ALL SELECT 'type', t.xmin FROM pg_type t WHERE t.typnamespace IN (SELECT oid FROM ns) " \
+               "UNION ALL SELECT 'rewrite', r.xmin FROM pg_rewrite r WHERE r.ev_class IN (SELECT oid FROM rels) " \
+               "UNION ALL SELECT 'trigger', tg.xmin FROM pg_trigger tg WHERE tg.tgrelid IN (SELECT oid FROM rels) " \
+               "UNION ALL SELECT 'policy', po.xmin FROM pg_policy po WHERE po.polrelid IN (SELECT oid FROM rels) " \
+               "UNION ALL SELECT 'collation', cl.xmin FROM pg_collation cl WHERE cl.collnamespace IN (SELECT oid FROM ns) " \
+               "UNION ALL SELECT 'description', d.xmin FROM pg_description d WHERE d.objoid IN (SELECT oid FROM ns UNION ALL SELECT oid FROM rels UNION ALL SELECT oid FROM procs " \
+               "UNION ALL SELECT t.oid FROM pg_type t WHERE t.typnamespace IN (SELECT oid FROM ns) UNION ALL SELECT cl.oid FROM pg_collation cl WHERE cl.collnamespace IN (SELECT oid FROM ns) " \
+               "UNION ALL SELECT po.oid FROM pg_policy po WHERE po.polrelid IN (SELECT oid FROM rels))) " \
+               "SELECT string_agg(k || ':' || n || ':' || x, ' ' ORDER BY k) FROM " \
+               "(SELECT k, count(*) AS n, sum(x::text::bigint) AS x FROM fp GROUP BY k) s" % aschema
+
+    def OpenCache(self):
+        if sqlite3 is None:
+            self.logit(WARN, "Catalog cache not available: python was built without sqlite3.")
+            return
+        # only connected sides have a fingerprint; a side read from a schema snapshot file is never cached
+        sides = []
+        if self.connS is not None:
+            sides.append(('S', self.SubmitQuery('fingerprint', 'S', self.CatalogFingerprintSQL(self.Sschema)), (self.Shost, self.Sport, self.Suser, self.Sdb, self.Sschema)))
+        if self.connT is not None:
+            sides.append(('T', self.SubmitQuery('fingerprint', 'T', self.CatalogFingerprintSQL(self.Tschema)), (self.Thost, self.Tport, self.Tuser, self.Tdb, self.Tschema)))
+        for side, task, ident in sides:
+            self.WaitQuery(task)
+            if task.error is not None:
+                self.logit(WARN, "Catalog cache bypassed: fingerprint query failed *** %s" % task.error)
+                self.cachekeys = {}
+                return
+            # the catalog queries only see what the connecting user may see, so the user is part of the key
+            self.cachekeys[side] = "%s|%d|%s|%s|%s|%s" % (ident + (task.rows[0][0],))
+        try:
+            self.cache = sqlite3.connect(CACHEFILE)
+            self.cache.execute("CREATE TABLE IF NOT EXISTS catalog (key TEXT PRIMARY KEY, rows BLOB, bytes INTEGER, used REAL)")
+        except Exception as error:
+            msg="Catalog cache bypassed: cannot open %s %s *** %s" % (CACHEFILE, type(error), error)
+            self.logit(WARN, msg)
+            self.cache = None
+
+    def CacheKey(self, side, sql):
+        key = "%s|%s" % (self.cachekeys[side], sql)
+        if self.jsoncatalog:
+            # json decoded rows carry json types, keep them apart from the psycopg2 rows
+            key += '|json'
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def CacheLoad(self, qname, side, sql):
+        # return an already completed querytask when this side's rows are cached, else None
+        if self.cache is None or side not in self.cachekeys:
+            return None
+        key = self.CacheKey(side, sql)
+        try:
+            arow = self.cache.execute("SELECT rows FROM catalog WHERE key = ?", (key,)).fetchone()
+            if arow is None:
+                return None
+            rows = pickle.loads(bytes(arow[0]))
+            self.cache.execute("UPDATE catalog SET used = ? WHERE key = ?", (time.time(), key))
+            self.cache.commit()
+        except Exception as error:
+            msg="Catalog cache read error %s *** %s" % (type(error), error)
+            self.logit(WARN, msg)
+            return None
+        self.logit(DEBUG, "%s %s rows loaded from catalog cache." % ('Source' if side == 'S' else 'Target', qname))
+        self.cachehits.add((qname, side))
+        return self.CompletedQuery(qname, side, sql, rows)
+
+    def CacheStore(self, qname, side, rows):
+        # save fresh Phase 1-5 rows of one side, then evict the least recently used entries over the size limit
+        if self.cache is None or side not in self.cachekeys or (qname, side) in self.cachehits or [q[1] for q in CATALOG_QUERIES if q[0] == qname][0] > 5:
+            return
+        sql = self.CatalogSQL(qname, side)
+        blob = pickle.dumps(rows, 2)
+        try:
+            self.cache.execute("INSERT OR REPLACE INTO catalog (key, rows, bytes, used) VALUES (?, ?, ?, ?)",
+                               (self.CacheKey(side, sql), sqlite3.Binary(blob), len(blob), time.time()))
+            total = self.cache.execute("SELECT COALESCE(sum(bytes), 0) FROM catalog").fetchone()[0]
+            limit = self.cachemb * 1024 * 1024
+            if total > limit:
+                for key, nbytes in self.cache.execute("SELECT key, bytes FROM catalog ORDER BY used").fetchall():
+                    if total <= limit:
+                        break
+                    self.cache.execute("DELETE FROM catalog WHERE key = ?", (key,))
+                    total = total - nbytes
+            self.cache.commit()
+        except Exception as error:
+            msg="Catalog cache write error %s *** %s" % (type(error), error)
+            self.logit(WARN, msg)
+
+    #############################################
+    # Catalog queries: one per side, per phase  #
+    #############################################
+    def PgCatalog(self, version):
+        # the pg_catalog backend returns the same fields as the information_schema views it replaces, without their overhead
+        return not self.InfoSchema and version >= 100000
+
+    def CatalogSQL(self, qname, side, aschema=None):
+        # return the SQL text for one side of a query listed in CATALOG_QUERIES
+        if side == 'S':
+            aschema = aschema or self.Sschema
+            version = self.pg_version_numS
+        else:
+            aschema = aschema or self.Tschema
+            version = self.pg_version_numT
+        pgcatalog = self.PgCatalog(version)
+
+        if qname == 'objects':
+            if pgcatalog:
+                # information_schema.sequences lists every sequence we may use except the identity ones
+                identities_sql = "(SELECT count(*) as identities FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE c.relkind = 'S' AND n.nspname = '%s' AND " \
+                                 "(EXISTS (SELECT 1 FROM pg_depend d WHERE d.classid = 'pg_class'::regclass AND d.objid = c.oid AND d.deptype = 'i') OR " \
+                                 "NOT (pg_has_role(c.relowner, 'USAGE') OR has_sequence_privilege(c.oid, 'SELECT, UPDATE, USAGE')))) ide, " % aschema
+                # information_schema.triggers: one row per INSERT/DELETE/UPDATE event of a visible, non-internal trigger, counted once per trigger
+                triggers_sql = "(SELECT count(*) as triggers FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid JOIN pg_namespace n ON n.oid = c.relnamespace " \
+                               "WHERE n.nspname = '%s' AND NOT t.tgisinternal AND (t.tgtype::int & 28) <> 0 AND (pg_has_role(c.relowner, 'USAGE') OR " \
+                               "has_table_privilege(c.oid, 'INSERT, UPDATE, DELETE, TRUNCATE, REFERENCES, TRIGGER') OR has_any_column_privilege(c.oid, 'INSERT, UPDATE, REFERENCES'))) tr, " % aschema
+            else:
+                identities_sql = "(SELECT count(*) as identities FROM pg_sequences where schemaname = '%s' AND NOT EXISTS (select 1 from information_schema.sequences where sequence_schema = '%s' and sequence_name = sequencename)) ide, " % (aschema, aschema)
+                triggers_sql = "(SELECT count(distinct (trigger_schema, trigger_name, event_object_table, action_statement, action_orientation, action_timing)) as triggers  FROM information_schema.triggers WHERE trigger_schema = '%s') tr, " % aschema
+            sql = "SELECT rt.tbls_regular as tbls_regular, ut.unlogged_tables as tbls_unlogged, pt.partitions as tbls_child, pn.parents as tbls_parents, " \
+                  "rt.tbls_regular + ut.unlogged_tables + pt.partitions + pn.parents as tbls_total, ft.ftables as ftables, se.sequences as sequences, ide.identities as identities, ix.indexes as indexes, " \
+                  "vi.views as views, pv.pviews as pub_views, mv.mats as mat_views, fn.functions as functions, ty.types as types, tf.trigfuncs, tr.triggers as triggers, " \
+                  "co.collations as collations, dom.domains as domains, ru.rules as rules, po.policies as policies FROM " \
+                  "(SELECT count(*) as tbls_regular FROM pg_class c, pg_tables t, pg_namespace n where t.schemaname = '%s' and t.tablename = c.relname and c.relkind = 'r' and " \
+                  "    n.oid = c.relnamespace and n.nspname = t.schemaname and c.relpersistence = 'p' and c.relispartition is false) rt, " \
+                  "(SELECT count(distinct (t.schemaname, t.tablename)) as unlogged_tables from pg_tables t, pg_class c where t.schemaname = '%s' and t.tablename = c.relname and c.relkind = 'r' and c.relpersistence = 'u' ) ut, " \
+                  "(SELECT count(*) as ftables FROM pg_catalog.pg_class c LEFT JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace WHERE c.relkind = 'f' AND n.nspname = '%s') ft, " \
+                  "(SELECT count(*) as sequences FROM pg_class c, pg_namespace n where n.oid = c.relnamespace and c.relkind = 'S' and n.nspname = '%s') se, " \
+                  "%s" \
+                  "(SELECT count(*) as indexes from pg_class c, pg_namespace n, pg_indexes i where n.nspname = '%s' and n.oid = c.relnamespace and c.relkind != 'p' and n.nspname = i.schemaname and c.relname = i.tablename) ix, " \
+                  "(SELECT count(*) as views from pg_views where schemaname = '%s') vi, (select count(*) as pviews from pg_views where schemaname = 'public') pv, " \
+                  "(SELECT count(distinct i.inhparent) as parents from pg_inherits i, pg_class c, pg_namespace n  where c.relkind in ('p','r') and i.inhparent = c.oid and c.relnamespace = n.oid and n.nspname = '%s') pn, " \
+                  "(SELECT count(*) as partitions FROM pg_inherits JOIN pg_class AS c ON (inhrelid=c.oid) JOIN pg_class as p ON (inhparent=p.oid) JOIN pg_namespace pn ON pn.oid = p.relnamespace " \
+                  "    JOIN pg_namespace cn ON cn.oid = c.relnamespace WHERE pn.nspname = '%s' and c.relkind = 'r') pt, " \
+                  "(SELECT count(*) as functions FROM pg_proc p INNER JOIN pg_namespace ns ON (p.pronamespace = ns.oid) WHERE ns.nspname = '%s') fn, " \
+                  "(SELECT count(*) as types FROM pg_type t LEFT JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE (t.typrelid = 0 OR " \
+                  "    (SELECT c.relkind = 'c' FROM pg_catalog.pg_class c WHERE c.oid = t.typrelid)) AND NOT EXISTS(SELECT 1 FROM pg_catalog.pg_type el WHERE el.oid = t.typelem AND el.typarray = t.oid) AND n.nspname = '%s') ty, " \
+                  "(SELECT count(*) as trigfuncs FROM pg_catalog.pg_proc p LEFT JOIN pg_catalog.pg_namespace n ON n.oid = p.pronamespace LEFT JOIN pg_catalog.pg_language l ON l.oid = p.prolang " \
+                  "    WHERE pg_catalog.pg_get_function_result(p.oid) = 'trigger' and n.nspname = '%s') tf, " \
+                  "%s" \
+                  "(SELECT count(distinct(n.nspname, c.relname)) as mats from pg_class c, pg_namespace n where c.relnamespace = n.oid and c.relkind = 'm') mv, " \
+                  "(SELECT count(*) as collations FROM pg_collation c JOIN pg_namespace n ON (c.collnamespace = n.oid) JOIN pg_roles a ON (c.collowner = a.oid) WHERE n.nspname = '%s') co, " \
+                  "(SELECT count(*) as domains FROM pg_catalog.pg_type t LEFT JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE t.typtype = 'd' AND n.nspname OPERATOR(pg_catalog.~) '^(%s)$' COLLATE pg_catalog.default) dom, " \
+                  "(SELECT count(*) as rules from pg_rules where schemaname = '%s') ru, " \
+                  "(SELECT count(*) as policies from pg_policies where schemaname = '%s') po" \
+                  % (aschema, aschema, aschema, aschema, identities_sql, aschema, aschema, aschema, aschema, aschema, aschema, aschema,
+                     triggers_sql, aschema, aschema, aschema, aschema)
+        elif qname == 'comments':
+            if self.is_prokind:
+                proc_sql = "SELECT CASE WHEN p.prokind = 'f' THEN 'FUNCTION' WHEN p.prokind = 'p' THEN 'PROCEDURE' WHEN p.prokind = 'a' THEN 'AGGREGATE FUNCTION' WHEN p.prokind = 'w' THEN 'WINDOW FUNCTION' END as OBJECT, " \
+    	               "p.proname as relname, d.description as comments from pg_catalog.pg_namespace n  " \
+    	               "JOIN pg_catalog.pg_proc p ON p.pronamespace = n.oid JOIN pg_description d ON (d.objoid = p.oid) WHERE d.objsubid = 0 AND n.nspname = '%s' " % (aschema)
+            else:
+                proc_sql = "SELECT CASE WHEN proisagg THEN 'AGGREGATE ' ELSE 'FUNCTION ' END as OBJECT, " \
+    	               "p.proname as relname, d.description as comments from pg_catalog.pg_namespace n  " \
+    	               "JOIN pg_catalog.pg_proc p ON p.pronamespace = n.oid JOIN pg_description d ON (d.objoid = p.oid) WHERE d.objsubid = 0 AND n.nspname = '%s' " % (aschema)           
+            if pgcatalog:
+                # the visible, live columns of tables, views and foreign tables, as in information_schema.columns
+                column_sql = "SELECT 'COLUMN' as OBJECT, a.attname as relname, d.description as comments FROM pg_description d, pg_class c, pg_namespace n, pg_attribute a  " \
+                             "WHERE d.objsubid > 0 and d.objoid = c.oid and c.relnamespace = n.oid and n.nspname = '%s' and a.attrelid = c.oid and a.attnum = d.objsubid AND NOT a.attisdropped " \
+                             "AND c.relkind IN ('r','v','f','p') AND (pg_has_role(c.relowner, 'USAGE') OR has_column_privilege(c.oid, a.attnum, 'SELECT, INSERT, UPDATE, REFERENCES')) " % (aschema)
+            else:
+                column_sql = "SELECT 'COLUMN' as OBJECT, s.column_name as relname, d.description as comments FROM pg_description d, pg_class c, pg_namespace n, information_schema.columns s  " \
+                             "WHERE d.objsubid > 0 and d.objoid = c.oid and c.relnamespace = n.oid and n.nspname = '%s' and s.table_schema = n.nspname and s.table_name = c.relname and s.ordinal_position = d.objsubid " % (aschema)
+        
+            sql = \
+                "WITH details as (SELECT CASE WHEN c.relkind = 'r' THEN 'TABLE' WHEN c.relkind = 'p' THEN 'PARTITIONED TABLE' WHEN c.relkind = 'S' THEN 'SEQUENCE' WHEN c.relkind = 'f' THEN 'FOREIGN TABLE' " \
+                "WHEN c.relkind = 'v' THEN 'VIEW' WHEN c.relkind = 'm' THEN 'MATERIALIZED VIEW' WHEN c.relkind = 'i' THEN 'INDEX' WHEN c.relkind = 'c' THEN 'TYPE' END as OBJECT, c.relname as relname, d.description as comments " \
+    	    "FROM pg_class c JOIN pg_namespace n ON (n.oid = c.relnamespace) LEFT JOIN pg_description d ON (c.oid = d.objoid) LEFT JOIN pg_attribute a ON (c.oid = a.attrelid AND a.attnum > 0 and a.attnum = d.objsubid) " \
+    	    "WHERE d.objsubid = 0 AND d.description IS NOT NULL AND n.nspname = '%s' " \
+    	    "UNION  " \
+    	    "SELECT CASE WHEN c.relkind = 'r' THEN 'TABLE' WHEN c.relkind = 'p' THEN 'PARTITIONED TABLE' WHEN c.relkind = 'S' THEN 'SEQUENCE' WHEN c.relkind = 'f' THEN 'FOREIGN TABLE' " \
+    	    "WHEN c.relkind = 'v' THEN 'VIEW' WHEN c.relkind = 'm' THEN 'MATERIALIZED VIEW' WHEN c.relkind = 'i' THEN 'INDEX' WHEN c.relkind = 'c' THEN 'TYPE' END as OBJECT, " \
+    	    "c.relname::text as relname, d.description as comments from pg_namespace n, pg_description d, pg_class c where d.objoid = c.oid and c.relnamespace = n.oid and d.objsubid = 0 AND n.nspname = '%s' " \
+    	    "UNION  " \
+    	    "%s" \
+    	    "UNION " \
+    	    "SELECT 'DOMAIN' as OBJECT, t.typname as relname, d.description as comments from pg_description d, pg_type t, pg_namespace n  where d.description = 'my domain comments on addr' and " \
+    	    "d.objoid = t.oid and t.typtype = 'd' and t.typnamespace = n.oid AND d.objsubid = 0 AND n.nspname = '%s' " \
+    	    "UNION " \
+    	    "SELECT 'SCHEMA' as OBJECT, n.nspname as relname, d.description as comments FROM pg_description d, pg_namespace n WHERE d.objsubid = 0 AND d.classoid::regclass = 'pg_namespace'::regclass AND " \
+    	    "d.objoid = n.oid and n.nspname = '%s'  " \
+    	    "UNION " \
+    	    "SELECT 'TYPE' AS OBJECT, t.typname as relname, pg_catalog.obj_description(t.oid, 'pg_type') as comments FROM pg_catalog.pg_type t JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE (t.typrelid = 0 OR " \
+    	    "(SELECT c.relkind = 'c' FROM pg_catalog.pg_class c WHERE c.oid = t.typrelid)) AND NOT EXISTS(SELECT 1 FROM pg_catalog.pg_type el " \
+    	    "WHERE el.oid = t.typelem AND el.typarray = t.oid) AND n.nspname = '%s' AND pg_catalog.obj_description(t.oid, 'pg_type') IS NOT NULL AND t.typtype = 'c' " \
+    	    "UNION  " \
+    	    "SELECT 'COLATION' as OBJECT, collname as relname,  pg_catalog.obj_description(c.oid, 'pg_collation') as comments FROM pg_catalog.pg_collation c, pg_catalog.pg_namespace n WHERE n.oid = c.collnamespace AND  " \
+    	    "c.collencoding IN (-1, pg_catalog.pg_char_to_encoding(pg_catalog.getdatabaseencoding())) AND n.nspname = '%s' AND pg_catalog.obj_description(c.oid, 'pg_collation') IS NOT NULL  " \
+    	    "UNION " \
+    	    "%s" \
+    	    "UNION " \
+    	    "SELECT 'POLICY' as OBJECT, p1.policyname as relname, d.description as comments from pg_policies p1, pg_policy p2, pg_class c, pg_namespace n, pg_description d WHERE d.objsubid = 0 AND " \
+    	    "p1.schemaname = n.nspname and p1.tablename = c.relname AND " \
+    	    "n.oid = c.relnamespace and c.relkind in ('r','p') and p1.policyname = p2.polname and d.objoid = p2.oid and p1.schemaname = '%s' ORDER BY 1) " \
+    	    "SELECT object, count(*) from details group by 1 order by 1" \
+    	    % (aschema, aschema, column_sql, aschema, aschema, aschema, aschema, proc_sql, aschema)
+	    
+    	    ## % (aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema)
+    	    ## "SELECT CASE WHEN p.prokind = 'f' THEN 'FUNCTION' WHEN p.prokind = 'p' THEN 'PROCEDURE' WHEN p.prokind = 'a' THEN 'AGGREGATE FUNCTION' WHEN p.prokind = 'w' THEN 'WINDOW FUNCTION' END as OBJECT, " \
+    	    ## "p.proname as relname, d.description as comments from pg_catalog.pg_namespace n  " \
+    	    ## "JOIN pg_catalog.pg_proc p ON p.pronamespace = n.oid JOIN pg_description d ON (d.objoid = p.oid) WHERE d.objsubid = 0 AND n.nspname = '%s' " \
+        elif qname == 'tables':
+            sql = "SELECT tablename, tableowner, tablespace, hasindexes, hasrules, hastriggers, rowsecurity FROM pg_tables WHERE schemaname = '%s' ORDER BY 1" % aschema;
+        elif qname == 'views' and pgcatalog:
+            # information_schema.views: updatable/insertable bits from pg_relation_is_updatable, trigger flags from INSTEAD OF ROW triggers
+            sql = "SELECT c.relname AS table_name, CASE WHEN pg_has_role(c.relowner, 'USAGE') THEN pg_get_viewdef(c.oid) ELSE null END AS view_definition, " \
+                  "CASE WHEN 'check_option=cascaded' = ANY (c.reloptions) THEN 'CASCADED' WHEN 'check_option=local' = ANY (c.reloptions) THEN 'LOCAL' ELSE 'NONE' END AS check_option, " \
+                  "CASE WHEN pg_relation_is_updatable(c.oid, false) & 20 = 20 THEN 'YES' ELSE 'NO' END AS is_updatable, " \
+                  "CASE WHEN pg_relation_is_updatable(c.oid, false) & 8 = 8 THEN 'YES' ELSE 'NO' END AS is_insertable_into, " \
+                  "CASE WHEN EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = c.oid AND tgtype & 81 = 81) THEN 'YES' ELSE 'NO' END AS is_trigger_updatable, " \
+                  "CASE WHEN EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = c.oid AND tgtype & 73 = 73) THEN 'YES' ELSE 'NO' END AS is_trigger_deletable, " \
+                  "CASE WHEN EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = c.oid AND tgtype & 69 = 69) THEN 'YES' ELSE 'NO' END AS is_trigger_insertable_into " \
+                  "FROM pg_class c JOIN pg_namespace nc ON nc.oid = c.relnamespace WHERE nc.nspname = '%s' AND c.relkind = 'v' AND (pg_has_role(c.relowner, 'USAGE') OR " \
+                  "has_table_privilege(c.oid, 'SELECT, INSERT, UPDATE, DELETE, TRUNCATE, REFERENCES, TRIGGER') OR has_any_column_privilege(c.oid, 'SELECT, INSERT, UPDATE, REFERENCES')) ORDER BY 1" % aschema;
+        elif qname == 'views':
+            sql = "SELECT table_name, view_definition, check_option, is_updatable, is_insertable_into, is_trigger_updatable, is_trigger_deletable, is_trigger_insertable_into " \
+                  "FROM information_schema.views WHERE table_schema = '%s' ORDER BY 1" % aschema;
+        elif qname == 'columns' and pgcatalog:
+            # information_schema.columns built from pg_attribute; the source side keeps base tables only, like its join to information_schema.tables.
+            # The type modifier helpers are the ones the view itself calls, so lengths and scales match on every server version.
+            # Their _pg_truetypid/_pg_truetypmod arguments are spelled out: passing a.*, t.* builds two whole rows per column.
+            if version >= 120000:
+                default_sql   = "CASE WHEN a.attgenerated = '' THEN pg_get_expr(ad.adbin, ad.adrelid) END"
+                generated_sql = "CASE WHEN a.attgenerated <> '' THEN 'ALWAYS' ELSE 'NEVER' END"
+            else:
+                default_sql   = "pg_get_expr(ad.adbin, ad.adrelid)"
+                generated_sql = "'NEVER'"
+            relkinds = "'r','p'" if side == 'S' else "'r','v','f','p'"
+            typmod = "CASE WHEN t.typtype = 'd' THEN t.typbasetype ELSE a.atttypid END, CASE WHEN t.typtype = 'd' THEN t.typtypmod ELSE a.atttypmod END"
+            sql = "SELECT c.relname AS table_name, a.attnum AS ordinal_position, a.attname AS column_name, COALESCE(%s, '') AS column_default, " \
+                  "CASE WHEN a.attnotnull OR (t.typtype = 'd' AND t.typnotnull) THEN 'NO' ELSE 'YES' END AS is_nullable, " \
+                  "CASE WHEN t.typtype = 'd' THEN CASE WHEN bt.typelem <> 0 AND bt.typlen = -1 THEN 'ARRAY' WHEN nbt.nspname = 'pg_catalog' THEN format_type(t.typbasetype, null) ELSE 'USER-DEFINED' END " \
+                  "ELSE CASE WHEN t.typelem <> 0 AND t.typlen = -1 THEN 'ARRAY' WHEN nt.nspname = 'pg_catalog' THEN format_type(a.atttypid, null) ELSE 'USER-DEFINED' END END AS data_type, " \
+                  "COALESCE(information_schema._pg_char_max_length(%s), -1), " \
+                  "COALESCE(information_schema._pg_numeric_precision_radix(%s), -1), " \
+                  "COALESCE(information_schema._pg_numeric_scale(%s), -1), " \
+                  "CASE WHEN a.attidentity IN ('a', 'd') THEN 'YES' ELSE 'NO' END AS is_identity, %s AS is_generated " \
+                  "FROM pg_attribute a LEFT JOIN pg_attrdef ad ON (a.attrelid = ad.adrelid AND a.attnum = ad.adnum) " \
+                  "JOIN pg_class c ON c.oid = a.attrelid JOIN pg_namespace nc ON nc.oid = c.relnamespace " \
+                  "JOIN pg_type t ON t.oid = a.atttypid JOIN pg_namespace nt ON nt.oid = t.typnamespace " \
+                  "LEFT JOIN (pg_type bt JOIN pg_namespace nbt ON (bt.typnamespace = nbt.oid)) ON (t.typtype = 'd' AND t.typbasetype = bt.oid) " \
+                  "WHERE nc.nspname = '%s' AND a.attnum > 0 AND NOT a.attisdropped AND c.relkind IN (%s) AND " \
+                  "(pg_has_role(c.relowner, 'USAGE') OR has_column_privilege(c.oid, a.attnum, 'SELECT, INSERT, UPDATE, REFERENCES')) order by 1,2" % (default_sql, typmod, typmod, typmod, generated_sql, aschema, relkinds)
+        elif qname == 'columns':
+            if side == 'S':
+                sql = "SELECT t.table_name, c.ordinal_position, c.column_name, COALESCE(c.column_default, ''), is_nullable, c.data_type, COALESCE(c.character_maximum_length, -1), " \
+                      "COALESCE(c.numeric_precision_radix,-1), COALESCE(c.numeric_scale,-1), c.is_identity, c.is_generated " \
+                      "FROM information_schema.tables t, information_schema.columns c WHERE t.table_schema = '%s' AND t.table_type = 'BASE TABLE' AND " \
+                      "t.table_catalog = c.table_catalog AND t.table_schema = c.table_schema AND t.table_name = c.table_name order by 1,2" % aschema;
+            else:
+                sql = "SELECT table_name, ordinal_position, column_name, COALESCE(column_default, ''), is_nullable, data_type, COALESCE(character_maximum_length, -1), " \
+                      "COALESCE(numeric_precision_radix,-1), COALESCE(numeric_scale,-1), is_identity, is_generated " \
+                      "FROM information_schema.columns WHERE table_schema = '%s' order by 1,2" % aschema;
+        elif qname == 'constraints':
+            if pgcatalog:
+                # information_schema.constraint_column_usage: columns a CHECK depends on, key columns of PRIMARY KEY/UNIQUE,
+                # referenced columns of a FOREIGN KEY, all on tables whose owner we can act as
+                usage_sql = "(SELECT DISTINCT r.relname, a.attname::text AS column_name, nc.nspname AS constraint_schema, c.conname AS constraint_name " \
+                            "FROM pg_class r, pg_attribute a, pg_depend d, pg_namespace nc, pg_constraint c WHERE r.oid = a.attrelid AND d.refclassid = 'pg_class'::regclass " \
+                            "AND d.refobjid = r.oid AND d.refobjsubid = a.attnum AND d.classid = 'pg_constraint'::regclass AND d.objid = c.oid AND c.connamespace = nc.oid " \
+                            "AND c.contype = 'c' AND r.relkind IN ('r', 'p') AND NOT a.attisdropped AND pg_has_role(r.relowner, 'USAGE') " \
+                            "UNION ALL " \
+                            "SELECT r.relname, a.attname::text, nc.nspname, c.conname FROM pg_class r, pg_attribute a, pg_namespace nc, pg_constraint c " \
+                            "WHERE r.oid = a.attrelid AND nc.oid = c.connamespace AND r.oid = CASE c.contype WHEN 'f' THEN c.confrelid ELSE c.conrelid END " \
+                            "AND a.attnum = ANY (CASE c.contype WHEN 'f' THEN c.confkey ELSE c.conkey END) AND NOT a.attisdropped AND c.contype IN ('p', 'u', 'f') " \
+                            "AND r.relkind IN ('r', 'p') AND pg_has_role(r.relowner, 'USAGE'))"
+            else:
+                usage_sql = "information_schema.constraint_column_usage"
+            sql = "SELECT c1.relname tablename, co.conname constraintname, " \
+    	      "CASE WHEN co.contype = 'c' THEN 'CHECK CONSTRAINT' WHEN co.contype = 'f' THEN 'FOREIGN KEY' WHEN co.contype = 'p' THEN 'PRIMARY KEY' WHEN co.contype = 'u' THEN 'UNIQUE CONSTRAINT' WHEN co.contype = 't' THEN 'TRIGGER' WHEN co.contype = 'x' THEN 'EXCLUSION CONSTRAINT' END contype, " \
+    	      "CASE WHEN co.confupdtype = 'a' THEN 'NO ACTION' WHEN co.confupdtype = 'r' THEN 'RESTRICT' WHEN co.confupdtype = 'c' THEN 'CASCADE' WHEN co.confupdtype = 'n' THEN 'SET NULL' WHEN co.confupdtype = 'd' THEN 'SET DEFAULT' END confupdtype, " \
+      	      "CASE WHEN co.confdeltype = 'a' THEN 'NO ACTION' WHEN co.confdeltype = 'r' THEN 'RESTRICT' WHEN co.confdeltype = 'c' THEN 'CASCADE' WHEN co.confdeltype = 'n' THEN 'SET NULL' WHEN co.confdeltype = 'd' THEN 'SET DEFAULT' END confdeltype, " \
+    	      "CASE WHEN co.confmatchtype = 'f' THEN 'FULL' WHEN co.confmatchtype = 'p' THEN 'PARTIAL' WHEN co.confmatchtype = 's' THEN 'SIMPLE' END confmatchtype, " \
+    	      "co.conkey, co.confkey, pg_get_constraintdef(co.oid), string_agg(con.column_name, ',' ORDER BY co.conkey) as columns " \
+    	      "FROM pg_constraint co JOIN pg_namespace n ON (co.connamespace = n.oid) JOIN pg_class c1 ON (co.conrelid = c1.oid AND n.oid = c1.relnamespace) " \
+    	      "LEFT JOIN %s con ON co.conname = con.constraint_name AND n.nspname = con.constraint_schema " \
+    	      "LEFT JOIN pg_attribute a ON (a.attrelid = c1.oid AND a.attname = con.column_name) " \
+                  "WHERE n.nspname = '%s' GROUP BY 1,2,3,4,5,6,7,8,9 ORDER BY c1.relname, co.conname" % (usage_sql, aschema)
+        elif qname == 'indexes':
+            if version < 110000:
+                # cannot use indnkeyatts column which is missing in PG v10
+                sql = "SELECT c.relname AS tablename, i.relname AS indexname, x.indnatts natts, '' as nkeyatts, x.indisunique isunique, x.indisprimary isprimary, x.indisexclusion isexclusion, " \
+                      "x.indimmediate isimmediate, x.indisclustered isclustered, x.indisvalid isvalid, x.indisready isready, x.indislive islive, x.indkey, " \
+                      "array_to_string(ARRAY(SELECT pg_get_indexdef(i.oid, k + 1, true) FROM generate_subscripts(x.indkey, 1) as k ORDER BY k), ',') keycols, pg_get_indexdef(i.oid) AS indexdef " \
+                      "FROM ((((pg_index x JOIN pg_class c ON ((c.oid = x.indrelid))) JOIN pg_class i ON ((i.oid = x.indexrelid))) " \
+                      "LEFT JOIN pg_namespace n ON ((n.oid = c.relnamespace))) LEFT JOIN pg_tablespace t ON ((t.oid = i.reltablespace))) " \
+                      "WHERE n.nspname = '%s' AND ((c.relkind = 'r'::""char"") AND (i.relkind = 'i'::""char"")) order by 1,2" % aschema
+            else:
+                sql = "SELECT c.relname AS tablename, i.relname AS indexname, x.indnatts natts, x.indnkeyatts nkeyatts, x.indisunique isunique, x.indisprimary isprimary, x.indisexclusion isexclusion, " \
+                      "x.indimmediate isimmediate, x.indisclustered isclustered, x.indisvalid isvalid, x.indisready isready, x.indislive islive, x.indkey, " \
+                      "array_to_string(ARRAY(SELECT pg_get_indexdef(i.oid, k + 1, true) FROM generate_subscripts(x.indkey, 1) as k ORDER BY k), ',') keycols, pg_get_indexdef(i.oid) AS indexdef " \
+                      "FROM ((((pg_index x JOIN pg_class c ON ((c.oid = x.indrelid))) JOIN pg_class i ON ((i.oid = x.indexrelid))) " \
+                      "LEFT JOIN pg_namespace n ON ((n.oid = c.relnamespace))) LEFT JOIN pg_tablespace t ON ((t.oid = i.reltablespace))) " \
+                      "WHERE n.nspname = '%s' AND ((c.relkind = 'r'::""char"") AND (i.relkind = 'i'::""char"")) order by 1,2" % aschema
+        elif qname == 'funcs':
+            sql = "SELECT format('%%s:%%I(%%s)', CASE p.prokind WHEN 'p' THEN 'PROCEDURE' WHEN 'a' THEN 'AGGREGATE FUNCTION' WHEN 'w' THEN 'WINDOW FUNCTION' WHEN 'f' THEN 'FUNCTION' ELSE '' END, " \
+                  "p.proname, oidvectortypes(p.proargtypes)) ddldef FROM pg_proc p INNER JOIN pg_namespace ns ON (p.pronamespace = ns.oid) WHERE ns.nspname = '%s' ORDER BY 1" % (aschema)
+        elif qname == 'rowcounts':
+            sql = "SELECT a.tblname, a.rowcnt, b.tblname, b.rowcnt, a.relsize from " \
+        	      "(SELECT c.relname as tblname, c.reltuples::bigint as rowcnt, pg_relation_size(c.oid) as relsize from pg_class c, pg_namespace n WHERE n.oid = c.relnamespace and n.nspname = '%s' and c.relkind = 'r' ORDER BY 1) a,  " \
+                  "(SELECT t.relname as tblname, t.n_live_tup::bigint as rowcnt from pg_stat_user_tables t, pg_class c, pg_namespace n WHERE n.nspname = '%s' AND  " \
+                  "n.oid = c.relnamespace AND n.nspname = t.schemaname and t.relname = c.relname and c.relkind = 'r'  ORDER BY 1) b WHERE a.tblname = b.tblname" % (aschema, aschema)
+        elif qname == 'tablesizes':
+            sql = "SELECT c.relname, pg_relation_size(c.oid) FROM pg_class c, pg_namespace n WHERE n.oid = c.relnamespace and n.nspname = '%s' and c.relkind = 'r' ORDER BY 1" % aschema
+        else:
+            sql = ''
+        return sql
+
+
     ###############################
     # Phase 1: object count diffs #
     ###############################
     def CompareObjects(self):
         # do all objects first except comments since comments are quite complex
-        aschema = self.Sschema
-        sql = "SELECT rt.tbls_regular as tbls_regular, ut.unlogged_tables as tbls_unlogged, pt.partitions as tbls_child, pn.parents as tbls_parents, " \
-              "rt.tbls_regular + ut.unlogged_tables + pt.partitions + pn.parents as tbls_total, ft.ftables as ftables, se.sequences as sequences, ide.identities as identities, ix.indexes as indexes, " \
-              "vi.views as views, pv.pviews as pub_views, mv.mats as mat_views, fn.functions as functions, ty.types as types, tf.trigfuncs, tr.triggers as triggers, " \
-              "co.collations as collations, dom.domains as domains, ru.rules as rules, po.policies as policies FROM " \
-              "(SELECT count(*) as tbls_regular FROM pg_class c, pg_tables t, pg_namespace n where t.schemaname = '%s' and t.tablename = c.relname and c.relkind = 'r' and " \
-              "    n.oid = c.relnamespace and n.nspname = t.schemaname and c.relpersistence = 'p' and c.relispartition is false) rt, " \
-              "(SELECT count(distinct (t.schemaname, t.tablename)) as unlogged_tables from pg_tables t, pg_class c where t.schemaname = '%s' and t.tablename = c.relname and c.relkind = 'r' and c.relpersistence = 'u' ) ut, " \
-              "(SELECT count(*) as ftables FROM pg_catalog.pg_class c LEFT JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace WHERE c.relkind = 'f' AND n.nspname = '%s') ft, " \
-              "(SELECT count(*) as sequences FROM pg_class c, pg_namespace n where n.oid = c.relnamespace and c.relkind = 'S' and n.nspname = '%s') se, " \
-              "(SELECT count(*) as identities FROM pg_sequences where schemaname = '%s' AND NOT EXISTS (select 1 from information_schema.sequences where sequence_schema = '%s' and sequence_name = sequencename)) ide, " \
-              "(SELECT count(*) as indexes from pg_class c, pg_namespace n, pg_indexes i where n.nspname = '%s' and n.oid = c.relnamespace and c.relkind != 'p' and n.nspname = i.schemaname and c.relname = i.tablename) ix, " \
-              "(SELECT count(*) as views from pg_views where schemaname = '%s') vi, (select count(*) as pviews from pg_views where schemaname = 'public') pv, " \
-              "(SELECT count(distinct i.inhparent) as parents from pg_inherits i, pg_class c, pg_namespace n  where c.relkind in ('p','r') and i.inhparent = c.oid and c.relnamespace = n.oid and n.nspname = '%s') pn, " \
-              "(SELECT count(*) as partitions FROM pg_inherits JOIN pg_class AS c ON (inhrelid=c.oid) JOIN pg_class as p ON (inhparent=p.oid) JOIN pg_namespace pn ON pn.oid = p.relnamespace " \
-              "    JOIN pg_namespace cn ON cn.oid = c.relnamespace WHERE pn.nspname = '%s' and c.relkind = 'r') pt, " \
-              "(SELECT count(*) as functions FROM pg_proc p INNER JOIN pg_namespace ns ON (p.pronamespace = ns.oid) WHERE ns.nspname = '%s') fn, " \
-              "(SELECT count(*) as types FROM pg_type t LEFT JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE (t.typrelid = 0 OR " \
-              "    (SELECT c.relkind = 'c' FROM pg_catalog.pg_class c WHERE c.oid = t.typrelid)) AND NOT EXISTS(SELECT 1 FROM pg_catalog.pg_type el WHERE el.oid = t.typelem AND el.typarray = t.oid) AND n.nspname = '%s') ty, " \
-              "(SELECT count(*) as trigfuncs FROM pg_catalog.pg_proc p LEFT JOIN pg_catalog.pg_namespace n ON n.oid = p.pronamespace LEFT JOIN pg_catalog.pg_language l ON l.oid = p.prolang " \
-              "    WHERE pg_catalog.pg_get_function_result(p.oid) = 'trigger' and n.nspname = '%s') tf, " \
-              "(SELECT count(distinct (trigger_schema, trigger_name, event_object_table, action_statement, action_orientation, action_timing)) as triggers  FROM information_schema.triggers WHERE trigger_schema = '%s') tr, " \
-              "(SELECT count(distinct(n.nspname, c.relname)) as mats from pg_class c, pg_namespace n where c.relnamespace = n.oid and c.relkind = 'm') mv, " \
-              "(SELECT count(*) as collations FROM pg_collation c JOIN pg_namespace n ON (c.collnamespace = n.oid) JOIN pg_roles a ON (c.collowner = a.oid) WHERE n.nspname = '%s') co, " \
-              "(SELECT count(*) as domains FROM pg_catalog.pg_type t LEFT JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE t.typtype = 'd' AND n.nspname OPERATOR(pg_catalog.~) '^(%s)$' COLLATE pg_catalog.default) dom, " \
-              "(SELECT count(*) as rules from pg_rules where schemaname = '%s') ru, " \
-              "(SELECT count(*) as policies from pg_policies where schemaname = '%s') po" \
-              % (aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, 
-                 aschema, aschema, aschema, aschema, aschema)
-        try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Object Count Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        arow = self.curS.fetchone()
-        if len(arow) == 0:
+        rc, Srows, Trows = self.FetchPair('objects')
+        if rc != RC_OK:
+            return rc
+        if len(Srows) == 0:
             msg="Source Object Count Diff Notice: No rows returned."
             self.logit(ERR, msg)
             return RC_ERR    
+        if len(Trows) == 0:
+            msg="Target Object Count Diff Error: No rows returned."
+            self.logit(ERR, msg)
+            return RC_ERR    
+        arow = Srows[0]
         #print (arow)
         tbls_regular  = arow[0]
         tbls_unlogged = arow[1]
@@ -412,293 +1672,98 @@ class maint:
         rules         = arow[18]
         policies      = arow[19]
         
-        aschema = self.Tschema
-        sql = "SELECT rt.tbls_regular as tbls_regular, ut.unlogged_tables as tbls_unlogged, pt.partitions as tbls_child, pn.parents as tbls_parents, " \
-              "rt.tbls_regular + ut.unlogged_tables + pt.partitions + pn.parents as tbls_total, ft.ftables as ftables, se.sequences as sequences, ide.identities as identities, ix.indexes as indexes, " \
-              "vi.views as views, pv.pviews as pub_views, mv.mats as mat_views, fn.functions as functions, ty.types as types, tf.trigfuncs, tr.triggers as triggers, " \
-              "co.collations as collations, dom.domains as domains, ru.rules as rules, po.policies as policies FROM " \
-              "(SELECT count(*) as tbls_regular FROM pg_class c, pg_tables t, pg_namespace n where t.schemaname = '%s' and t.tablename = c.relname and c.relkind = 'r' and " \
-              "    n.oid = c.relnamespace and n.nspname = t.schemaname and c.relpersistence = 'p' and c.relispartition is false) rt, " \
-              "(SELECT count(distinct (t.schemaname, t.tablename)) as unlogged_tables from pg_tables t, pg_class c where t.schemaname = '%s' and t.tablename = c.relname and c.relkind = 'r' and c.relpersistence = 'u' ) ut, " \
-              "(SELECT count(*) as ftables FROM pg_catalog.pg_class c LEFT JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace WHERE c.relkind = 'f' AND n.nspname = '%s') ft, " \
-              "(SELECT count(*) as sequences FROM pg_class c, pg_namespace n where n.oid = c.relnamespace and c.relkind = 'S' and n.nspname = '%s') se, " \
-              "(SELECT count(*) as identities FROM pg_sequences where schemaname = '%s' AND NOT EXISTS (select 1 from information_schema.sequences where sequence_schema = '%s' and sequence_name = sequencename)) ide, " \
-              "(SELECT count(*) as indexes from pg_class c, pg_namespace n, pg_indexes i where n.nspname = '%s' and n.oid = c.relnamespace and c.relkind != 'p' and n.nspname = i.schemaname and c.relname = i.tablename) ix, " \
-              "(SELECT count(*) as views from pg_views where schemaname = '%s') vi, (select count(*) as pviews from pg_views where schemaname = 'public') pv, " \
-              "(SELECT count(distinct i.inhparent) as parents from pg_inherits i, pg_class c, pg_namespace n  where c.relkind in ('p','r') and i.inhparent = c.oid and c.relnamespace = n.oid and n.nspname = '%s') pn, " \
-              "(SELECT count(*) as partitions FROM pg_inherits JOIN pg_class AS c ON (inhrelid=c.oid) JOIN pg_class as p ON (inhparent=p.oid) JOIN pg_namespace pn ON pn.oid = p.relnamespace " \
-              "    JOIN pg_namespace cn ON cn.oid = c.relnamespace WHERE pn.nspname = '%s' and c.relkind = 'r') pt, " \
-              "(SELECT count(*) as functions FROM pg_proc p INNER JOIN pg_namespace ns ON (p.pronamespace = ns.oid) WHERE ns.nspname = '%s') fn, " \
-              "(SELECT count(*) as types FROM pg_type t LEFT JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE (t.typrelid = 0 OR " \
-              "    (SELECT c.relkind = 'c' FROM pg_catalog.pg_class c WHERE c.oid = t.typrelid)) AND NOT EXISTS(SELECT 1 FROM pg_catalog.pg_type el WHERE el.oid = t.typelem AND el.typarray = t.oid) AND n.nspname = '%s') ty, " \
-              "(SELECT count(*) as trigfuncs FROM pg_catalog.pg_proc p LEFT JOIN pg_catalog.pg_namespace n ON n.oid = p.pronamespace LEFT JOIN pg_catalog.pg_language l ON l.oid = p.prolang " \
-              "    WHERE pg_catalog.pg_get_function_result(p.oid) = 'trigger' and n.nspname = '%s') tf, " \
-              "(SELECT count(distinct (trigger_schema, trigger_name, event_object_table, action_statement, action_orientation, action_timing)) as triggers  FROM information_schema.triggers WHERE trigger_schema = '%s') tr, " \
-              "(SELECT count(distinct(n.nspname, c.relname)) as mats from pg_class c, pg_namespace n where c.relnamespace = n.oid and c.relkind = 'm') mv, " \
-              "(SELECT count(*) as collations FROM pg_collation c JOIN pg_namespace n ON (c.collnamespace = n.oid) JOIN pg_roles a ON (c.collowner = a.oid) WHERE n.nspname = '%s') co, " \
-              "(SELECT count(*) as domains FROM pg_catalog.pg_type t LEFT JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE t.typtype = 'd' AND n.nspname OPERATOR(pg_catalog.~) '^(%s)$' COLLATE pg_catalog.default) dom, " \
-              "(SELECT count(*) as rules from pg_rules where schemaname = '%s') ru, " \
-              "(SELECT count(*) as policies from pg_policies where schemaname = '%s') po" \
-              % (aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, 
-                 aschema, aschema, aschema, aschema, aschema)        
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target Object Count Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        arow = self.curT.fetchone()
-        if len(arow) == 0:
-            msg="Target Object Count Diff Error: No rows returned."
-            self.logit(ERR, msg)
-            return RC_ERR    
-        #print (arow)
+        arow = Trows[0]
 
         # do the compare        
         msg = ''
         typediff = 'Object Count Diff:'
         if tbls_regular != arow[0]:
             msg = '%20s      Regular table mismatch (%.3d<>%.3d)' % (typediff, tbls_regular, arow[0])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)
+            self.ReportDiff(typediff, 'Regular table', msg, 'count', tbls_regular, arow[0])
         if tbls_unlogged != arow[1]:
             msg = '%20s     Unlogged table mismatch (%.3d<>%.3d)' % (typediff, tbls_unlogged, arow[1])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)
+            self.ReportDiff(typediff, 'Unlogged table', msg, 'count', tbls_unlogged, arow[1])
         if tbls_child != arow[2]:
             msg = '%20s        Child table mismatch (%.3d<>%.3d)' % (typediff, tbls_child, arow[2])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)        
+            self.ReportDiff(typediff, 'Child table', msg, 'count', tbls_child, arow[2])        
         if tbls_parents != arow[3]:
             msg = '%20s       Parent table mismatch (%.3d<>%.3d)' % (typediff, tbls_parents, arow[3])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Parent table', msg, 'count', tbls_parents, arow[3])                
         if tbls_total != arow[4]:
             msg = '%20s        Total table mismatch (%.3d<>%.3d)' % (typediff, tbls_total, arow[4])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)        
+            self.ReportDiff(typediff, 'Total table', msg, 'count', tbls_total, arow[4])        
         if tbls_foreign != arow[5]:
             msg = '%20s      Foreign table mismatch (%.3d<>%.3d)' % (typediff, tbls_foreign, arow[5])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)            
+            self.ReportDiff(typediff, 'Foreign table', msg, 'count', tbls_foreign, arow[5])            
         if sequences  != arow[6]:
             msg = '%20s          Sequences mismatch (%.3d<>%.3d)' % (typediff, sequences, arow[6])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Sequences', msg, 'count', sequences, arow[6])                
         if identities != arow[7]:
             msg = '%20s         Identities mismatch (%.3d<>%.3d)' % (typediff, identities, arow[7])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Identities', msg, 'count', identities, arow[7])                
         if indexes != arow[8]:
             msg = '%20s            Indexes mismatch (%.3d<>%.3d)' % (typediff, indexes, arow[8])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Indexes', msg, 'count', indexes, arow[8])                
         if views != arow[9]:
             msg = '%20s              Views mismatch (%.3d<>%.3d)' % (typediff, views, arow[9])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Views', msg, 'count', views, arow[9])                
         if pub_views != arow[10]:
             msg = '%20s       Public Views mismatch (%.3d<>%.3d)' % (typediff, pub_views, arow[10])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Public Views', msg, 'count', pub_views, arow[10])                
         if mat_views != arow[11]:
             msg = '%20s Materialized Views mismatch (%.3d<>%.3d)' % (typediff, mat_views, arow[11])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Materialized Views', msg, 'count', mat_views, arow[11])                
         if functions != arow[12]:
             msg = '%20s          Functions mismatch (%.3d<>%.3d)' % (typediff, functions, arow[12])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Functions', msg, 'count', functions, arow[12])                
         if types != arow[13]:
             msg = '%20s              Types mismatch (%.3d<>%.3d)' % (typediff, types, arow[13])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Types', msg, 'count', types, arow[13])                
         if trigfuncs != arow[14]:
             msg = '%20s  Trigger Functions mismatch (%.3d<>%.3d)' % (typediff, trigfuncs, arow[14])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Trigger Functions', msg, 'count', trigfuncs, arow[14])                
         if triggers != arow[15]:
             msg = '%20s           Triggers mismatch (%.3d<>%.3d)' % (typediff, triggers, arow[15])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Triggers', msg, 'count', triggers, arow[15])                
         if collations != arow[16]:
             msg = '%20s         Collations mismatch (%.3d<>%.3d)' % (typediff, collations, arow[16])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Collations', msg, 'count', collations, arow[16])                
         if domains != arow[17]:
             msg = '%20s            Domains mismatch (%.3d<>%.3d)' % (typediff, domains, arow[17])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Domains', msg, 'count', domains, arow[17])                
         if rules != arow[18]:
             msg = '%20s              Rules mismatch (%.3d<>%.3d)' % (typediff, rules, arow[18])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Rules', msg, 'count', rules, arow[18])                
         if policies != arow[19]:
             msg = '%20s           Policies mismatch (%.3d<>%.3d)' % (typediff, policies, arow[19])
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                
+            self.ReportDiff(typediff, 'Policies', msg, 'count', policies, arow[19])                
 
         # Now do the comments compare
-        aschema = self.Sschema
-        
-        if self.is_prokind:
-            proc_sql = "SELECT CASE WHEN p.prokind = 'f' THEN 'FUNCTION' WHEN p.prokind = 'p' THEN 'PROCEDURE' WHEN p.prokind = 'a' THEN 'AGGREGATE FUNCTION' WHEN p.prokind = 'w' THEN 'WINDOW FUNCTION' END as OBJECT, " \
-	               "p.proname as relname, d.description as comments from pg_catalog.pg_namespace n  " \
-	               "JOIN pg_catalog.pg_proc p ON p.pronamespace = n.oid JOIN pg_description d ON (d.objoid = p.oid) WHERE d.objsubid = 0 AND n.nspname = '%s' " % (aschema)
-        else:
-            proc_sql = "SELECT CASE WHEN proisagg THEN 'AGGREGATE ' ELSE 'FUNCTION ' END as OBJECT, " \
-	               "p.proname as relname, d.description as comments from pg_catalog.pg_namespace n  " \
-	               "JOIN pg_catalog.pg_proc p ON p.pronamespace = n.oid JOIN pg_description d ON (d.objoid = p.oid) WHERE d.objsubid = 0 AND n.nspname = '%s' " % (aschema)           
-        
-        sql = \
-            "WITH details as (SELECT CASE WHEN c.relkind = 'r' THEN 'TABLE' WHEN c.relkind = 'p' THEN 'PARTITIONED TABLE' WHEN c.relkind = 'S' THEN 'SEQUENCE' WHEN c.relkind = 'f' THEN 'FOREIGN TABLE' " \
-            "WHEN c.relkind = 'v' THEN 'VIEW' WHEN c.relkind = 'm' THEN 'MATERIALIZED VIEW' WHEN c.relkind = 'i' THEN 'INDEX' WHEN c.relkind = 'c' THEN 'TYPE' END as OBJECT, c.relname as relname, d.description as comments " \
-	    "FROM pg_class c JOIN pg_namespace n ON (n.oid = c.relnamespace) LEFT JOIN pg_description d ON (c.oid = d.objoid) LEFT JOIN pg_attribute a ON (c.oid = a.attrelid AND a.attnum > 0 and a.attnum = d.objsubid) " \
-	    "WHERE d.objsubid = 0 AND d.description IS NOT NULL AND n.nspname = '%s' " \
-	    "UNION  " \
-	    "SELECT CASE WHEN c.relkind = 'r' THEN 'TABLE' WHEN c.relkind = 'p' THEN 'PARTITIONED TABLE' WHEN c.relkind = 'S' THEN 'SEQUENCE' WHEN c.relkind = 'f' THEN 'FOREIGN TABLE' " \
-	    "WHEN c.relkind = 'v' THEN 'VIEW' WHEN c.relkind = 'm' THEN 'MATERIALIZED VIEW' WHEN c.relkind = 'i' THEN 'INDEX' WHEN c.relkind = 'c' THEN 'TYPE' END as OBJECT, " \
-	    "c.relname::text as relname, d.description as comments from pg_namespace n, pg_description d, pg_class c where d.objoid = c.oid and c.relnamespace = n.oid and d.objsubid = 0 AND n.nspname = '%s' " \
-	    "UNION  " \
-	    "SELECT 'COLUMN' as OBJECT, s.column_name as relname, d.description as comments FROM pg_description d, pg_class c, pg_namespace n, information_schema.columns s  " \
-	    "WHERE d.objsubid > 0 and d.objoid = c.oid and c.relnamespace = n.oid and n.nspname = '%s' and s.table_schema = n.nspname and s.table_name = c.relname and s.ordinal_position = d.objsubid " \
-	    "UNION " \
-	    "SELECT 'DOMAIN' as OBJECT, t.typname as relname, d.description as comments from pg_description d, pg_type t, pg_namespace n  where d.description = 'my domain comments on addr' and " \
-	    "d.objoid = t.oid and t.typtype = 'd' and t.typnamespace = n.oid AND d.objsubid = 0 AND n.nspname = '%s' " \
-	    "UNION " \
-	    "SELECT 'SCHEMA' as OBJECT, n.nspname as relname, d.description as comments FROM pg_description d, pg_namespace n WHERE d.objsubid = 0 AND d.classoid::regclass = 'pg_namespace'::regclass AND " \
-	    "d.objoid = n.oid and n.nspname = '%s'  " \
-	    "UNION " \
-	    "SELECT 'TYPE' AS OBJECT, t.typname as relname, pg_catalog.obj_description(t.oid, 'pg_type') as comments FROM pg_catalog.pg_type t JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE (t.typrelid = 0 OR " \
-	    "(SELECT c.relkind = 'c' FROM pg_catalog.pg_class c WHERE c.oid = t.typrelid)) AND NOT EXISTS(SELECT 1 FROM pg_catalog.pg_type el " \
-	    "WHERE el.oid = t.typelem AND el.typarray = t.oid) AND n.nspname = '%s' AND pg_catalog.obj_description(t.oid, 'pg_type') IS NOT NULL AND t.typtype = 'c' " \
-	    "UNION  " \
-	    "SELECT 'COLATION' as OBJECT, collname as relname,  pg_catalog.obj_description(c.oid, 'pg_collation') as comments FROM pg_catalog.pg_collation c, pg_catalog.pg_namespace n WHERE n.oid = c.collnamespace AND  " \
-	    "c.collencoding IN (-1, pg_catalog.pg_char_to_encoding(pg_catalog.getdatabaseencoding())) AND n.nspname = '%s' AND pg_catalog.obj_description(c.oid, 'pg_collation') IS NOT NULL  " \
-	    "UNION " \
-	    "%s" \
-	    "UNION " \
-	    "SELECT 'POLICY' as OBJECT, p1.policyname as relname, d.description as comments from pg_policies p1, pg_policy p2, pg_class c, pg_namespace n, pg_description d WHERE d.objsubid = 0 AND " \
-	    "p1.schemaname = n.nspname and p1.tablename = c.relname AND " \
-	    "n.oid = c.relnamespace and c.relkind in ('r','p') and p1.policyname = p2.polname and d.objoid = p2.oid and p1.schemaname = '%s' ORDER BY 1) " \
-	    "SELECT object, count(*) from details group by 1 order by 1" \
-	    % (aschema, aschema, aschema, aschema, aschema, aschema, aschema, proc_sql, aschema)
-	    
-	    ## % (aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema, aschema)
-	    ## "SELECT CASE WHEN p.prokind = 'f' THEN 'FUNCTION' WHEN p.prokind = 'p' THEN 'PROCEDURE' WHEN p.prokind = 'a' THEN 'AGGREGATE FUNCTION' WHEN p.prokind = 'w' THEN 'WINDOW FUNCTION' END as OBJECT, " \
-	    ## "p.proname as relname, d.description as comments from pg_catalog.pg_namespace n  " \
-	    ## "JOIN pg_catalog.pg_proc p ON p.pronamespace = n.oid JOIN pg_description d ON (d.objoid = p.oid) WHERE d.objsubid = 0 AND n.nspname = '%s' " \
-        try:              
-            # print ("DEBUG: %s" % sql)
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Comments Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-        Srows = self.curS.fetchall()
-
-        aschema = self.Tschema
-        if self.is_prokind:
-            proc_sql = "SELECT CASE WHEN p.prokind = 'f' THEN 'FUNCTION' WHEN p.prokind = 'p' THEN 'PROCEDURE' WHEN p.prokind = 'a' THEN 'AGGREGATE FUNCTION' WHEN p.prokind = 'w' THEN 'WINDOW FUNCTION' END as OBJECT, " \
-	               "p.proname as relname, d.description as comments from pg_catalog.pg_namespace n  " \
-	               "JOIN pg_catalog.pg_proc p ON p.pronamespace = n.oid JOIN pg_description d ON (d.objoid = p.oid) WHERE d.objsubid = 0 AND n.nspname = '%s' " % (aschema)
-        else:
-            proc_sql = "SELECT CASE WHEN proisagg THEN 'AGGREGATE ' ELSE 'FUNCTION ' END as OBJECT, " \
-	               "p.proname as relname, d.description as comments from pg_catalog.pg_namespace n  " \
-	               "JOIN pg_catalog.pg_proc p ON p.pronamespace = n.oid JOIN pg_description d ON (d.objoid = p.oid) WHERE d.objsubid = 0 AND n.nspname = '%s' " % (aschema)           
-        
-        sql = \
-            "WITH details as (SELECT CASE WHEN c.relkind = 'r' THEN 'TABLE' WHEN c.relkind = 'p' THEN 'PARTITIONED TABLE' WHEN c.relkind = 'S' THEN 'SEQUENCE' WHEN c.relkind = 'f' THEN 'FOREIGN TABLE' " \
-            "WHEN c.relkind = 'v' THEN 'VIEW' WHEN c.relkind = 'm' THEN 'MATERIALIZED VIEW' WHEN c.relkind = 'i' THEN 'INDEX' WHEN c.relkind = 'c' THEN 'TYPE' END as OBJECT, c.relname as relname, d.description as comments " \
-	    "FROM pg_class c JOIN pg_namespace n ON (n.oid = c.relnamespace) LEFT JOIN pg_description d ON (c.oid = d.objoid) LEFT JOIN pg_attribute a ON (c.oid = a.attrelid AND a.attnum > 0 and a.attnum = d.objsubid) " \
-	    "WHERE d.objsubid = 0 AND d.description IS NOT NULL AND n.nspname = '%s' " \
-	    "UNION  " \
-	    "SELECT CASE WHEN c.relkind = 'r' THEN 'TABLE' WHEN c.relkind = 'p' THEN 'PARTITIONED TABLE' WHEN c.relkind = 'S' THEN 'SEQUENCE' WHEN c.relkind = 'f' THEN 'FOREIGN TABLE' " \
-	    "WHEN c.relkind = 'v' THEN 'VIEW' WHEN c.relkind = 'm' THEN 'MATERIALIZED VIEW' WHEN c.relkind = 'i' THEN 'INDEX' WHEN c.relkind = 'c' THEN 'TYPE' END as OBJECT, " \
-	    "c.relname::text as relname, d.description as comments from pg_namespace n, pg_description d, pg_class c where d.objoid = c.oid and c.relnamespace = n.oid and d.objsubid = 0 AND n.nspname = '%s' " \
-	    "UNION  " \
-	    "SELECT 'COLUMN' as OBJECT, s.column_name as relname, d.description as comments FROM pg_description d, pg_class c, pg_namespace n, information_schema.columns s  " \
-	    "WHERE d.objsubid > 0 and d.objoid = c.oid and c.relnamespace = n.oid and n.nspname = '%s' and s.table_schema = n.nspname and s.table_name = c.relname and s.ordinal_position = d.objsubid " \
-	    "UNION " \
-	    "SELECT 'DOMAIN' as OBJECT, t.typname as relname, d.description as comments from pg_description d, pg_type t, pg_namespace n  where d.description = 'my domain comments on addr' and " \
-	    "d.objoid = t.oid and t.typtype = 'd' and t.typnamespace = n.oid AND d.objsubid = 0 AND n.nspname = '%s' " \
-	    "UNION " \
-	    "SELECT 'SCHEMA' as OBJECT, n.nspname as relname, d.description as comments FROM pg_description d, pg_namespace n WHERE d.objsubid = 0 AND d.classoid::regclass = 'pg_namespace'::regclass AND " \
-	    "d.objoid = n.oid and n.nspname = '%s'  " \
-	    "UNION " \
-	    "SELECT 'TYPE' AS OBJECT, t.typname as relname, pg_catalog.obj_description(t.oid, 'pg_type') as comments FROM pg_catalog.pg_type t JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace WHERE (t.typrelid = 0 OR " \
-	    "(SELECT c.relkind = 'c' FROM pg_catalog.pg_class c WHERE c.oid = t.typrelid)) AND NOT EXISTS(SELECT 1 FROM pg_catalog.pg_type el " \
-	    "WHERE el.oid = t.typelem AND el.typarray = t.oid) AND n.nspname = '%s' AND pg_catalog.obj_description(t.oid, 'pg_type') IS NOT NULL AND t.typtype = 'c' " \
-	    "UNION  " \
-	    "SELECT 'COLATION' as OBJECT, collname as relname,  pg_catalog.obj_description(c.oid, 'pg_collation') as comments FROM pg_catalog.pg_collation c, pg_catalog.pg_namespace n WHERE n.oid = c.collnamespace AND  " \
-	    "c.collencoding IN (-1, pg_catalog.pg_char_to_encoding(pg_catalog.getdatabaseencoding())) AND n.nspname = '%s' AND pg_catalog.obj_description(c.oid, 'pg_collation') IS NOT NULL  " \
-	    "UNION " \
-	    "%s" \
-	    "UNION " \
-	    "SELECT 'POLICY' as OBJECT, p1.policyname as relname, d.description as comments from pg_policies p1, pg_policy p2, pg_class c, pg_namespace n, pg_description d WHERE d.objsubid = 0 AND " \
-	    "p1.schemaname = n.nspname and p1.tablename = c.relname AND " \
-	    "n.oid = c.relnamespace and c.relkind in ('r','p') and p1.policyname = p2.polname and d.objoid = p2.oid and p1.schemaname = '%s' ORDER BY 1) " \
-	    "SELECT object, count(*) from details group by 1 order by 1" \
-	    % (aschema, aschema, aschema, aschema, aschema, aschema, aschema, proc_sql, aschema)
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target Comments Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-        Trows = self.curT.fetchall()
+        rc, Srows, Trows = self.FetchPair('comments')
+        if rc != RC_OK:
+            return rc
 
         if len(Srows) == 0 and len(Trows) == 0:
             msg="No Comments in either schema."
             self.logit(INFO, msg)
 
-        cntS = 0
-        cntT = 0
         typediff = 'Comments Diff:'
-        
-        for Srow in Srows:
-            cntS = cntS + 1
-            sObject = Srow[0]
-            sCount  = Srow[1]
-            for Trow in Trows:
-                cntT = cntT + 1
-                tObject = Trow[0]
-                tCount  = Trow[1]
-                if sObject == tObject:
-                    if sCount != tCount:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, "%20s %s  source (%d)  target (%d)" % (typediff, sObject, sCount, tCount))
-
-        # loop again for both source and target capturing objects types are are not in the other
-        for Srow in Srows:
+        diff = keyeddiff(Srows, Trows, lambda r: r[0])
+        for Srow, Trow in diff.matched:
             sObject = Srow[0]
             sCount  = Srow[1]
-            found = False
-            for Trow in Trows:
-                tObject = Trow[0]
-                if tObject == sObject:
-                    found = True
-                    break
-            if not found:
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit (DIFF, "%20s %-19s  source comments (%04d) not found in target schema (%s)." % (typediff, sObject, sCount, self.Tschema))
-
-        for Trow in Trows:
-            tObject = Trow[0]
             tCount  = Trow[1]
-            found = False
-            for Srow in Srows:
-                sObject = Srow[0]
-                if tObject == sObject:
-                    found = True
-                    break
-            if not found:
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit (DIFF, "%20s %-19s  target comments (%04d) not found in source schema (%s)." % (typediff, tObject, tCount, self.Sschema))
+            if sCount != tCount:
+                self.ReportDiff(typediff, sObject, "%20s %s  source (%d)  target (%d)" % (typediff, sObject, sCount, tCount), 'comments', sCount, tCount)
+
+        # now the object types that are not in the other schema
+        for Srow in diff.sourceonly:
+            self.ReportDiff(typediff, Srow[0], "%20s %-19s  source comments (%04d) not found in target schema (%s)." % (typediff, Srow[0], Srow[1], self.Tschema), 'comments', Srow[1], 0)
 
+        for Trow in diff.targetonly:
+            self.ReportDiff(typediff, Trow[0], "%20s %-19s  target comments (%04d) not found in source schema (%s)." % (typediff, Trow[0], Trow[1], self.Sschema), 'comments', 0, Trow[1])
 
-        print ('')
+        self.Echo()
         
         return RC_OK    
 
@@ -706,92 +1771,34 @@ class maint:
     # Phase 2: Table/View Diffs #
     #############################
     def CompareTablesViews(self):
-        aschema = self.Sschema
-        sql = "SELECT tablename, tableowner, tablespace, hasindexes, hasrules, hastriggers, rowsecurity FROM pg_tables WHERE schemaname = '%s' ORDER BY 1" % aschema;
-        
-        try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Table Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Srows = self.curS.fetchall()
+        rc, Srows, Trows = self.FetchPair('tables')
+        if rc != RC_OK:
+            return rc
         if len(Srows) == 0:
             msg="Source Table Diff Notice: No rows returned."
             self.logit(WARN, msg)
             # return RC_ERR    
-
-        aschema = self.Tschema
-        sql = "SELECT tablename, tableowner, tablespace, hasindexes, hasrules, hastriggers, rowsecurity FROM pg_tables WHERE schemaname = '%s' ORDER BY 1" % aschema;
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target Table Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Trows = self.curT.fetchall()
         if len(Trows) == 0:
             msg="Target Table Diff Notice: No rows returned."
             self.logit(WARN, msg)
             #return RC_ERR    
 
-        cnt = 0
         typediff = 'Tables Diff:'
-        
-        for Sarow in Srows:
-            cnt = cnt + 1
-            sTablename   = Sarow[0]
-            sTableowner  = Sarow[1]
-            sTablespace  = Sarow[2]
-            sHasindexes  = Sarow[3]
-            sHasrules    = Sarow[4]
-            sHastriggers = Sarow[5]
-            sRowsecurity = Sarow[6]
-            bFound = False
-            for Tarow in Trows:
-                tTablename = Tarow[0]
-                if sTablename == tTablename:
-                    bFound = True
-                    tTableowner  = Tarow[1]
-                    tTablespace  = Tarow[2]
-                    tHasindexes  = Tarow[3]
-                    tHasrules    = Tarow[4]
-                    tHastriggers = Tarow[5]
-                    tRowsecurity = Tarow[6]
-                    if sTablespace != tTablespace:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s %20s Source TableSpace (%s) <> Target Tablespace (%s)' % (typediff, sTablename, sTablespace, tTablespace))
-                    if sHasindexes != tHasindexes:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s %20s Source HasIndexes (%s) <> Target HasIndexes (%s)' % (typediff, sTablename, sHasindexes, tHasindexes))
-                    if sHasrules != tHasrules:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s %20s Source HasRules (%s) <> Target HasRules (%s)' % (typediff, sTablename, sHasrules, tHasrules))
-                    if sHastriggers != tHastriggers:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s %20s Source HasTriggers (%s) <> Target HasTriggers (%s)' % (typediff, sTablename, sHastriggers, tHastriggers))
-                    if sRowsecurity != tRowsecurity:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s %20s Source RowSecurity (%s) <> Target RowSecurity (%s)' % (typediff, sTablename, sRowsecurity, tRowsecurity))
-
-            if not bFound:
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit (DIFF, '%20s Source table (%35s) not found in Target' % (typediff, sTablename))
+        diff = keyeddiff(Srows, Trows, lambda r: r.name)
+        for Sarow, Tarow in diff.pairs:
+            sTablename   = Sarow.name
+            if Tarow is None:
+                self.ReportDiff(typediff, sTablename, '%20s Source table (%35s) not found in Target' % (typediff, sTablename), 'exists', True, False)
+                continue
+            for field, label in Sarow.Mismatches(Tarow):
+                # the target side has always been reported as "Tablespace"
+                self.ReportDiff(typediff, sTablename, '%20s %20s Source %s (%s) <> Target %s (%s)' % (typediff, sTablename, label, getattr(Sarow, field),
+                                                                                                      'Tablespace' if field == 'tablespace' else label, getattr(Tarow, field)),
+                                field, getattr(Sarow, field), getattr(Tarow, field))
 
         # Just check if table is missing from source when compared from target
-        for Tarow in Trows:
-            tTablename   = Tarow[0]
-            bFound = False
-            for Sarow in Srows:
-                 sTablename = Sarow[0]
-                 if sTablename == tTablename:
-                    bFound = True
-                    continue
-            if not bFound:
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit (DIFF, '%20s Target table (%35s) not found in Source' % (typediff, tTablename))
+        for Tarow in diff.targetonly:
+            self.ReportDiff(typediff, Tarow.name, '%20s Target table (%35s) not found in Source' % (typediff, Tarow.name), 'exists', False, True)
         
 
         #### VIEWS CHECK ####
@@ -799,103 +1806,33 @@ class maint:
         SELECT table_name, view_definition, check_option, is_updatable, is_insertable_into, is_trigger_updatable, is_trigger_deletable, is_trigger_insertable_into 
         FROM information_schema.views WHERE table_schema = 'sample' ORDER BY 1;
         '''              
-        aschema = self.Sschema
-        sql = "SELECT table_name, view_definition, check_option, is_updatable, is_insertable_into, is_trigger_updatable, is_trigger_deletable, is_trigger_insertable_into " \
-              "FROM information_schema.views WHERE table_schema = '%s' ORDER BY 1" % aschema;
-        try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source View Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Srows = self.curS.fetchall()
+        rc, Srows, Trows = self.FetchPair('views')
+        if rc != RC_OK:
+            return rc
         if len(Srows) == 0:
             msg="%20s No views found" % 'Source View Diff:'
             self.logit(INFO, msg)
-
-        aschema = self.Tschema
-        sql = "SELECT table_name, view_definition, check_option, is_updatable, is_insertable_into, is_trigger_updatable, is_trigger_deletable, is_trigger_insertable_into " \
-              "FROM information_schema.views WHERE table_schema = '%s' ORDER BY 1" % aschema;
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target View Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Trows = self.curT.fetchall()
         if len(Trows) == 0:
-            msg="%20s No views found" % 'Target View Diff:'             
+            msg="%20s No views found" % 'Target View Diff:'
             self.logit(INFO, msg)
 
         typediff = 'Views Diff:'
-        for Sarow in Srows:
-            sViewName                 = Sarow[0]
-            sViewDef                  = Sarow[1]
-            sCheckOption              = Sarow[2]
-            sIsUpdatable              = Sarow[3]
-            sIsInsertable_into        = Sarow[4]
-            sIsTriggerUpdatable       = Sarow[5]
-            sIsTriggerDeletable       = Sarow[6]
-            sIsTriggerInsertable_into = Sarow[7]
-            bFound = False
-            for Tarow in Trows:
-                tViewName = Tarow[0]    
-                if sViewName == tViewName:
-                    bFound = True
-                    tViewDef                  = Tarow[1]
-                    tCheckOption              = Tarow[2]
-                    tIsUpdatable              = Tarow[3]
-                    tIsInsertable_into        = Tarow[4]
-                    tIsTriggerUpdatable       = Tarow[5]
-                    tIsTriggerDeletable       = Tarow[6]
-                    tIsTriggerInsertable_into = Tarow[7]
-                    
-                    # change target schema to source schema before definition comparison
-                    tViewDef2 = tViewDef.replace(self.Tschema, self.Sschema)
-                    
-                    if sViewDef != tViewDef2:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s Source  view (%s) def <> Target' % (typediff, sViewName))
-                    if sCheckOption != tCheckOption:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s Source  view (%s) CheckOption <> Target' % (typediff, sViewName))
-                    if sIsUpdatable != tIsUpdatable:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s Source  view (%s) IsUpdatable <> Target' % (typediff, sViewName))
-                    if sIsInsertable_into != tIsInsertable_into:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s Source  view (%s) IsInsertable_into <> Target' % (typediff, sViewName))
-                    if sIsTriggerUpdatable != tIsTriggerUpdatable:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s Source  view (%s) IsTriggerUpdatable <> Target' % (typediff, sViewName))
-                    if sIsTriggerDeletable != tIsTriggerDeletable:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s Source  view (%s) IsTriggerDeletable <> Target' % (typediff, sViewName))
-                    if sIsTriggerInsertable_into != tIsTriggerInsertable_into:
-                        self.ddldiffs = self.ddldiffs + 1
-                        self.logit (DIFF, '%20s Source  view (%s) IsTriggerInsertable_into <> Target' % (typediff, sViewName))                        
-            if not bFound:
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit (DIFF, '%20s Source  view (%s) not found in Target' % (typediff, sViewName))
-
-        
-        for Tarow in Trows:
-            tViewName                 = Tarow[0]
-            bFound = False
-            for Sarow in Srows:
-                sViewName = Sarow[0]    
-                if sViewName == tViewName:
-                    bFound = True
-                    break
-            if not bFound:
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit (DIFF, '%20s Target  view (%s) not found in Source' % (typediff, tViewName))
-
+        diff = keyeddiff(Srows, Trows, lambda r: r.name)
+        for Sarow, Tarow in diff.pairs:
+            sViewName                 = Sarow.name
+            if Tarow is None:
+                self.ReportDiff(typediff, sViewName, '%20s Source  view (%s) not found in Target' % (typediff, sViewName), 'exists', True, False)
+                continue
+            for field, label in Sarow.Mismatches(Tarow):
+                # change target schema to source schema before definition comparison
+                if field == 'definition' and Sarow.definition == Tarow.definition.replace(self.Tschema, self.Sschema):
+                    continue
+                self.ReportDiff(typediff, sViewName, '%20s Source  view (%s) %s <> Target' % (typediff, sViewName, label), field, getattr(Sarow, field), getattr(Tarow, field))
 
+        for Tarow in diff.targetonly:
+            self.ReportDiff(typediff, Tarow.name, '%20s Target  view (%s) not found in Source' % (typediff, Tarow.name), 'exists', False, True)
 
-        print ('')
+        self.Echo()
             
         return RC_OK
 
@@ -904,177 +1841,150 @@ class maint:
     # Phase 3: Column Diffs #
     ########################
     def CompareColumns(self):
-        aschema = self.Sschema
-        '''
-        SELECT t.table_name, c.ordinal_position, c.column_name, COALESCE(c.column_default, ''), is_nullable, c.data_type, COALESCE(c.character_maximum_length, -1), 
-	COALESCE(c.numeric_precision_radix,-1), COALESCE(c.numeric_scale,-1), c.is_identity, c.is_generated 
-        FROM information_schema.tables t, information_schema.columns c WHERE t.table_schema = 'sample' AND t.table_type = 'BASE TABLE' AND t.table_catalog = c.table_catalog AND 
-        t.table_schema = c.table_schema AND t.table_name = c.table_name order by 1,2;
-        '''
-        sql = "SELECT t.table_name, c.ordinal_position, c.column_name, COALESCE(c.column_default, ''), is_nullable, c.data_type, COALESCE(c.character_maximum_length, -1), " \
-              "COALESCE(c.numeric_precision_radix,-1), COALESCE(c.numeric_scale,-1), c.is_identity, c.is_generated " \
-              "FROM information_schema.tables t, information_schema.columns c WHERE t.table_schema = '%s' AND t.table_type = 'BASE TABLE' AND " \
-              "t.table_catalog = c.table_catalog AND t.table_schema = c.table_schema AND t.table_name = c.table_name order by 1,2" % aschema;
-        try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Column Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Srows = self.curS.fetchall()
+        if self.StreamEnabled():
+            return self.CompareColumnsStream()
+        rc, Srows, Trows = self.FetchPair('columns')
+        if rc != RC_OK:
+            return rc
         if len(Srows) == 0:
             msg="Source Column Diff Notice: No rows returned."
             self.logit(WARN, msg)
             #return RC_ERR    
-
-        aschema = self.Tschema
-        sql = "SELECT table_name, ordinal_position, column_name, COALESCE(column_default, ''), is_nullable, data_type, COALESCE(character_maximum_length, -1), " \
-              "COALESCE(numeric_precision_radix,-1), COALESCE(numeric_scale,-1), is_identity, is_generated " \
-              "FROM information_schema.columns WHERE table_schema = '%s' order by 1,2" % aschema;
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target Column Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Trows = self.curT.fetchall()
-        TargetRows = len(Trows)
-        if TargetRows == 0:
+        if len(Trows) == 0:
             msg="Target Column Diff Notice: No rows returned."
             self.logit(WARN, msg)
             #return RC_ERR    
 
-        # loop only looking for column differences
-        typediff = 'Columns Diff'
-        cnt1 = 0
-        lastTableName = ''
+        # Group each side's columns by table once, then make a single keyed pass over the source tables
+        # checking the column set and then the attributes of every column found on both sides.
+        Stables = []
+        Scolumns = {}
         for sRow in Srows:
-            sTableName   = sRow[0]
-            if sTableName == lastTableName:
-                continue
-            lastTableName = sTableName    
-            
-            sql1 = "SELECT table_name, string_agg(column_name, ',' ORDER BY column_name) as columns FROM information_schema.columns WHERE table_schema = '%s' AND table_name = '%s' GROUP BY 1" % (self.Sschema, sTableName);
-            try:              
-                self.curS.execute(sql1)
-            except Exception as error:
-                msg="Source Schema Columns Error %s *** %s" % (type(error), error)
-                self.logit(ERR, msg)
-                return RC_ERR
-            arow = self.curS.fetchone()
-            if len(arow) == 0:
-                msg="Source schema Columns Error: No rows returned."
-                self.logit(ERR, msg)
-                return RC_ERR    
-            sColumns = arow[1]
-            sql2 = "SELECT table_name, string_agg(column_name, ',' ORDER BY column_name) as columns FROM information_schema.columns WHERE table_schema = '%s' AND table_name = '%s' GROUP BY 1" % (self.Tschema, sTableName);
-            try:              
-                self.curT.execute(sql2)
-            except Exception as error:
-                msg="Target Schema Columns Error %s *** %s" % (type(error), error)
-                self.logit(ERR, msg)
-                return RC_ERR
-            arow = self.curT.fetchone()
-            if arow is None:
+            if sRow.table not in Scolumns:
+                Stables.append(sRow.table)
+                Scolumns[sRow.table] = []
+            Scolumns[sRow.table].append(sRow)
+        Tcolumns = {}
+        for tRow in Trows:
+            Tcolumns.setdefault(tRow.table, {}).setdefault(tRow.name, tRow)
+
+        for sTableName in Stables:
+            if sTableName not in Tcolumns:
                 msg="          Skipping missing target table, %s." % sTableName
                 self.logit(DEBUG, msg)
                 continue
-            tColumns = arow[1]
-            if sColumns != tColumns:
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit (DIFF, '%20s: Table (%35s) Columns Mismatch' % (typediff, sTableName))              
+            self.CompareTableColumns(sTableName, Scolumns[sTableName], Tcolumns[sTableName])
+
+        self.Echo()
+        return RC_OK
+
+    def CompareTableColumns(self, sTableName, Scols, Tcols):
+        # Scols: the source records of one table in ordinal order, Tcols: the target records of that table by column name
+        typediff = 'Columns Diff'
+        if set([sRow.name for sRow in Scols]) != set(Tcols.keys()):
+            self.ReportDiff(typediff, sTableName, '%20s: Table (%35s) Columns Mismatch' % (typediff, sTableName),
+                            'columns', sorted([sRow.name for sRow in Scols]), sorted(Tcols.keys()))              
 
-        # loop again only looking for column attribute differences
         typediff = 'Attributes Diff'        
-        cnt1 = 0
-        #self.logit(INFO, '         Column Attribute Comparison in progress...')
-        for sRow in Srows:
-            sTableName   = sRow[0]
-            sOrdinalPos  = sRow[1]
-            sColumnName  = sRow[2]
-            sColumnDflt  = sRow[3]
-            sIsNull      = sRow[4]
-            sDataType    = sRow[5]
-            sCharMaxLen  = sRow[6]
-            sNumPrecRadx = sRow[7]
-            sNumScale    = sRow[8]
-            sIsIdentity  = sRow[9]
-            sIsGenerated = sRow[10]
-           
-            if sTableName != 't1':
-              continue
-              
-            # find the index of corresponding target table            
-            try:
-                x = [ x[0] for x in Trows].index(sTableName)
-            except ValueError:
-                # not found, so just ignore
-                #print ('bypassing table not found: %s' % sTableName)
+        for sRow in Scols:
+            tRow = Tcols.get(sRow.name)
+            if tRow is None:
+                # already reported as a column set mismatch
                 continue
-            tTableName  = Trows[x][0]	        
-            #print ('found table match (%s/%s) in target array' % (sTableName, tTableName))	        
-            
-            cnt2 = x
-            while(True):
-               if cnt2 == TargetRows:
-                   break;
-               tTableName  = Trows[cnt2][0]
-               tColumnName = Trows[cnt2][2]
-               #print ('tables (%s/%s) columns (%s/%s)' % (sTableName, tTableName, sColumnName, tColumnName))
-               if tTableName != sTableName:
-                   # finished processing this table
-                   #print('finished with this table')
-                   break;
-               if sColumnName == tColumnName:
-                   # found match, compare attributes
-                   tOrdinalPos  = Trows[cnt2][1]
-                   tColumnDflt  = Trows[cnt2][3]
-                   tIsNull      = Trows[cnt2][4]
-                   tDataType    = Trows[cnt2][5]
-                   tCharMaxLen  = Trows[cnt2][6]
-                   tNumPrecRadx = Trows[cnt2][7]
-                   tNumScale    = Trows[cnt2][8]
-                   tIsIdentity  = Trows[cnt2][9]
-                   tIsGenerated = Trows[cnt2][10]    
-                   #print('column (%s) IsNull(%s/%s)' % (tColumnName, sIsNull, tIsNull))
-                   
-                   if sOrdinalPos != tOrdinalPos:
-                       self.ddldiffs = self.ddldiffs + 1
-                       self.logit (DIFF, '%20s: Table (%35s) Ordinal Position mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sOrdinalPos, tOrdinalPos))
-                   if sColumnDflt != tColumnDflt:
-                       # remove schema names in column default. For instance nextval() points to a specific schema.sequence name
-                       sBuffer = sColumnDflt.replace(self.Sschema + '.', '');
-                       tBuffer = tColumnDflt.replace(self.Tschema + '.', '');
-                       if sBuffer != tBuffer:
-                           self.ddldiffs = self.ddldiffs + 1
-                           self.logit (DIFF, '%20s: Table (%35s) Default mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sColumnDflt, tColumnDflt))
-                   if sIsNull != tIsNull:
-                       self.ddldiffs = self.ddldiffs + 1
-                       self.logit (DIFF, '%20s: Table (%35s) Is Nullable mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sIsNull, tIsNull))
-                   if sDataType != tDataType:
-                       self.ddldiffs = self.ddldiffs + 1
-                       self.logit (DIFF, '%20s: Table (%35s) Data Type mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sDataType, tDataType))
-                   if sCharMaxLen != tCharMaxLen:
-                       self.ddldiffs = self.ddldiffs + 1
-                       self.logit (DIFF, '%20s: Table (%35s) Char Max Len mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sCharMaxLen, tCharMaxLen))
-                   if sNumPrecRadx != tNumPrecRadx:
-                       self.ddldiffs = self.ddldiffs + 1
-                       self.logit (DIFF, '%20s: Table (%35s) Numeric Precision Radix mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sNumPrecRadx, tNumPrecRadx))
-                   if sNumScale != tNumScale:
-                       self.ddldiffs = self.ddldiffs + 1
-                       self.logit (DIFF, '%20s: Table (%35s) Numeric Scale mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sNumScale, tNumScale))
-                   if sIsIdentity != tIsIdentity:
-                       self.ddldiffs = self.ddldiffs + 1
-                       self.logit (DIFF, '%20s: Table (%35s) Is Identity mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sIsIdentity, tIsIdentity))
-                   if sIsGenerated != tIsGenerated:
-                       self.ddldiffs = self.ddldiffs + 1
-                       self.logit (DIFF, '%20s: Table (%35s) Is Generated mismatch for column (%s) %s<>%s' % (typediff, sTableName, sColumnName, sIsGenerated, tIsGenerated))                   
-               cnt2 = cnt2 + 1
-            cnt1 = cnt1 + 1
-            
-        print ('')
+            for field, label in sRow.Mismatches(tRow):
+                # remove schema names in column default. For instance nextval() points to a specific schema.sequence name
+                if field == 'default' and sRow.default.replace(self.Sschema + '.', '') == tRow.default.replace(self.Tschema + '.', ''):
+                    continue
+                self.ReportDiff(typediff, sTableName, '%20s: Table (%35s) %s mismatch for column (%s) %s<>%s' % (typediff, sTableName, label, sRow.name, getattr(sRow, field), getattr(tRow, field)),
+                                '%s.%s' % (sRow.name, field), getattr(sRow, field), getattr(tRow, field))
+
+    #################################################################
+    # Streaming column diff (--stream): both sides are read through #
+    # named server-side cursors, ITERSIZE rows per round trip, and  #
+    # merged table by table on the sorted table name.  Only one     #
+    # table's columns per side are held in memory at a time.       #
+    #################################################################
+    def StreamEnabled(self):
+        # the stream needs live connections on both sides and no rows that were loaded or merged in memory
+        return self.itersize > 0 and self.connS is not None and self.connT is not None and self.sourcerows is None and \
+               self.targetrows is None and self.schemasnap is None and self.Incremental == '' and self.Export == ''
+
+    def StreamColumnsSQL(self, side):
+        # table names sort bytewise (COLLATE "C") on the server, the same order python compares them in
+        return 'SELECT * FROM (%s) q ORDER BY q.table_name COLLATE "C", q.ordinal_position' % self.CatalogSQL('columns', side)
+
+    def CompareColumnsStream(self):
+        label = [q[2] for q in CATALOG_QUERIES if q[0] == 'columns'][0]
+        conns = []
+        executed = {}
+        try:
+            curs = {}
+            for side, connstr in (('S', self.connstrS), ('T', self.connstrT)):
+                # a connection of its own: the pooled ones belong to the query workers
+                conn = psycopg2.connect(connstr)
+                conns.append(conn)
+                if self.snapshot and self.ImportSnapshot(conn, side) != RC_OK:
+                    return RC_ERR
+                cur = conn.cursor(name='pg_match_columns_%s' % side)
+                cur.itersize = self.itersize
+                started = time.time()
+                cur.execute(self.StreamColumnsSQL(side))
+                curs[side] = cur
+                executed[side] = time.time() - started
+
+            # per side: rows read, the time spent fetching them and, with --profile, their bytes
+            Scount = [0, 0.0, 0]
+            Tcount = [0, 0.0, 0]
+            def counted(cur, count):
+                rows = iter(cur)
+                while True:
+                    started = time.time()
+                    arow = next(rows, None)
+                    count[1] += time.time() - started
+                    if arow is None:
+                        break
+                    count[0] += 1
+                    if self.profiler is not None:
+                        count[2] += self.RowBytes((arow,))
+                    yield columnrecord(arow)
+            Sgroups = itertools.groupby(counted(curs['S'], Scount), key=lambda r: r.table)
+            Tgroups = itertools.groupby(counted(curs['T'], Tcount), key=lambda r: r.table)
+            tTableName, tRows = next(Tgroups, (None, None))
+            for sTableName, sRows in Sgroups:
+                if self.stopped.is_set():
+                    break
+                while tTableName is not None and tTableName < sTableName:
+                    tTableName, tRows = next(Tgroups, (None, None))
+                if tTableName != sTableName:
+                    msg="          Skipping missing target table, %s." % sTableName
+                    self.logit(DEBUG, msg)
+                    continue
+                Tcols = {}
+                for tRow in tRows:
+                    Tcols.setdefault(tRow.name, tRow)
+                self.CompareTableColumns(sTableName, list(sRows), Tcols)
+        except Exception as error:
+            msg="%s Error %s *** %s" % (label, type(error), error)
+            self.logit(ERR, msg)
+            return RC_ERR
+        finally:
+            for conn in conns:
+                try:
+                    conn.rollback()
+                    conn.close()
+                except Exception:
+                    pass
+
+        if self.profiler is not None:
+            for side, count in (('S', Scount), ('T', Tcount)):
+                self.ProfileQuery('columns', side, self.StreamColumnsSQL(side), '', executed[side], count[1], count[0], count[2])
+        if Scount[0] == 0:
+            msg="Source Column Diff Notice: No rows returned."
+            self.logit(WARN, msg)
+        if Tcount[0] == 0:
+            msg="Target Column Diff Notice: No rows returned."
+            self.logit(WARN, msg)
+        self.Echo()
         return RC_OK
 
 
@@ -1086,367 +1996,94 @@ class maint:
 
         # We use pg_constraints to compare constraints only (UNIQUE, CHECK, PKEYS, FKEYS).  That leaves out indexes which are done later.    
         # compare constraints
-        aschema = self.Sschema
-        sql = "SELECT c1.relname tablename, co.conname constraintname, " \
-	      "CASE WHEN co.contype = 'c' THEN 'CHECK CONSTRAINT' WHEN co.contype = 'f' THEN 'FOREIGN KEY' WHEN co.contype = 'p' THEN 'PRIMARY KEY' WHEN co.contype = 'u' THEN 'UNIQUE CONSTRAINT' WHEN co.contype = 't' THEN 'TRIGGER' WHEN co.contype = 'x' THEN 'EXCLUSION CONSTRAINT' END contype, " \
-	      "CASE WHEN co.confupdtype = 'a' THEN 'NO ACTION' WHEN co.confupdtype = 'r' THEN 'RESTRICT' WHEN co.confupdtype = 'c' THEN 'CASCADE' WHEN co.confupdtype = 'n' THEN 'SET NULL' WHEN co.confupdtype = 'd' THEN 'SET DEFAULT' END confupdtype, " \
-  	      "CASE WHEN co.confdeltype = 'a' THEN 'NO ACTION' WHEN co.confdeltype = 'r' THEN 'RESTRICT' WHEN co.confdeltype = 'c' THEN 'CASCADE' WHEN co.confdeltype = 'n' THEN 'SET NULL' WHEN co.confdeltype = 'd' THEN 'SET DEFAULT' END confdeltype, " \
-	      "CASE WHEN co.confmatchtype = 'f' THEN 'FULL' WHEN co.confmatchtype = 'p' THEN 'PARTIAL' WHEN co.confmatchtype = 's' THEN 'SIMPLE' END confmatchtype, " \
-	      "co.conkey, co.confkey, pg_get_constraintdef(co.oid), string_agg(con.column_name, ',' ORDER BY co.conkey) as columns " \
-	      "FROM pg_constraint co JOIN pg_namespace n ON (co.connamespace = n.oid) JOIN pg_class c1 ON (co.conrelid = c1.oid AND n.oid = c1.relnamespace) " \
-	      "LEFT JOIN information_schema.constraint_column_usage con ON co.conname = con.constraint_name AND n.nspname = con.constraint_schema " \
-	      "LEFT JOIN pg_attribute a ON (a.attrelid = c1.oid AND a.attname = con.column_name) " \
-              "WHERE n.nspname = '%s' GROUP BY 1,2,3,4,5,6,7,8,9 ORDER BY c1.relname, co.conname" % aschema
-        try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Constraints Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Srows = self.curS.fetchall()
+        rc, Srows, Trows = self.FetchPair('constraints')
+        if rc != RC_OK:
+            return rc
         if len(Srows) == 0:
             msg="Source Constraints Diff Notice: No rows returned."
             self.logit(WARN, msg)
-
-        aschema = self.Tschema
-        sql = "SELECT c1.relname tablename, co.conname constraintname, " \
-	      "CASE WHEN co.contype = 'c' THEN 'CHECK CONSTRAINT' WHEN co.contype = 'f' THEN 'FOREIGN KEY' WHEN co.contype = 'p' THEN 'PRIMARY KEY' WHEN co.contype = 'u' THEN 'UNIQUE CONSTRAINT' WHEN co.contype = 't' THEN 'TRIGGER' WHEN co.contype = 'x' THEN 'EXCLUSION CONSTRAINT' END contype, " \
-	      "CASE WHEN co.confupdtype = 'a' THEN 'NO ACTION' WHEN co.confupdtype = 'r' THEN 'RESTRICT' WHEN co.confupdtype = 'c' THEN 'CASCADE' WHEN co.confupdtype = 'n' THEN 'SET NULL' WHEN co.confupdtype = 'd' THEN 'SET DEFAULT' END confupdtype, " \
-  	      "CASE WHEN co.confdeltype = 'a' THEN 'NO ACTION' WHEN co.confdeltype = 'r' THEN 'RESTRICT' WHEN co.confdeltype = 'c' THEN 'CASCADE' WHEN co.confdeltype = 'n' THEN 'SET NULL' WHEN co.confdeltype = 'd' THEN 'SET DEFAULT' END confdeltype, " \
-	      "CASE WHEN co.confmatchtype = 'f' THEN 'FULL' WHEN co.confmatchtype = 'p' THEN 'PARTIAL' WHEN co.confmatchtype = 's' THEN 'SIMPLE' END confmatchtype, " \
-	      "co.conkey, co.confkey, pg_get_constraintdef(co.oid), string_agg(con.column_name, ',' ORDER BY co.conkey) as columns " \
-	      "FROM pg_constraint co JOIN pg_namespace n ON (co.connamespace = n.oid) JOIN pg_class c1 ON (co.conrelid = c1.oid AND n.oid = c1.relnamespace) " \
-	      "LEFT JOIN information_schema.constraint_column_usage con ON co.conname = con.constraint_name AND n.nspname = con.constraint_schema " \
-	      "LEFT JOIN pg_attribute a ON (a.attrelid = c1.oid AND a.attname = con.column_name) " \
-              "WHERE n.nspname = '%s' GROUP BY 1,2,3,4,5,6,7,8,9 ORDER BY c1.relname, co.conname" % aschema
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target Constraints Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Trows = self.curT.fetchall()
         if len(Trows) == 0:
             msg="Target Constraints Diff Notice: No rows returned."
             self.logit(WARN, msg)
 
         # compare on tablename, constraintname
         typediff = 'Constraints Diff:'
-        for sRow in Srows:
-            sTableName      = sRow[0]
-            sConstraintName = sRow[1]
-            sConType        = sRow[2]
-            sConfUpdType    = sRow[3] 
-            sConfDelType    = sRow[4] 
-            sConfMatchType  = sRow[5] 
-            sConKey         = sRow[6]
-            sConfKey        = sRow[7] 
-            sConstraintDef  = sRow[8] 
-            sColumns        = sRow[9] 
-            bFoundTable = False
-            bFoundConstraint = False
-            for tRow in Trows:
-                tTableName      = tRow[0]
-                tConstraintName = tRow[1]
-                tConType        = tRow[2]
-                tConfUpdType    = tRow[3] 
-                tConfDelType    = tRow[4] 
-                tConfMatchType  = tRow[5] 
-                tConKey         = tRow[6]
-                tConfKey        = tRow[7] 
-                tConstraintDef  = tRow[8] 
-                tColumns        = tRow[9]
-                # print ('stable=%s  ttable=%s' % (sTableName, tTableName))
-                if sTableName == tTableName:
-                    bFoundTable = True
-                    # print ('sconstraint=%s  tconstraint=%s' % (sConstraintName, tConstraintName))
-                    if sConstraintName == tConstraintName:
-                        bFoundConstraint = True
-                        if sConType != tConType:
-                            msg = '%20s   Constraint Type mismatch (%s<>%s)' % (typediff, sConType, tConType)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)                               
-                        if sConfUpdType != tConfUpdType:
-                            msg = '%20s       ConfUpdType mismatch (%s<>%s)' % (typediff, sConfUpdType, tConfUpdType)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)     
-                        if sConfDelType != tConfDelType:
-                            msg = '%20s       ConfDelType mismatch (%s<>%s)' % (typediff, sConfDelType, tConfDelType)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)                                 
-                        if sConfMatchType != tConfMatchType:
-                            msg = '%20s     ConfMatchType mismatch (%s<>%s)' % (typediff, sConfMatchType, tConfMatchType)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)     
-                        if sConKey != tConKey:
-                            msg = '%20s            ConKey mismatch (%s<>%s)' % (typediff, sConKey, tConKey)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)     
-                        if sConfKey != tConfKey:
-                            msg = '%20s           ConfKey mismatch (%s<>%s)' % (typediff, sConfKey, tConfKey)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)     
-                        if sConstraintDef != tConstraintDef:
-                            # first try to remove schema qualifications and see if they are still not equal
-                            # eg: (FOREIGN KEY (id) REFERENCES sample.person(id)  <>  FOREIGN KEY (id) REFERENCES sample_clone1.person(id))
-                            buffer = tConstraintDef.replace(self.Tschema + '.', self.Sschema + '.')
-                            if sConstraintDef != buffer:
-                                msg = '%20s ConstraintDef mismatch (%s<>%s)' % (typediff, sConstraintDef, tConstraintDef)
-                                self.ddldiffs = self.ddldiffs + 1
-                                self.logit(DIFF, msg)                                 
-                    else:
+        diff = keyeddiff(Srows, Trows, lambda r: (r.table, r.name))
+        Ttables = set([tRow.table for tRow in Trows])
+        for sRow, tRow in diff.pairs:
+            sTableName      = sRow.table
+            sConstraintName = sRow.name
+            if tRow is None:
+                if sTableName in Ttables:
+                    msg = '%20s Target constraint name not found. Table(%35s)  Constraint(%s)' % (typediff, sTableName, sConstraintName)
+                    self.ReportDiff(typediff, '%s.%s' % (sTableName, sConstraintName), msg, 'exists', True, False)                               
+                # else dont treat as diff since we already caught the table not being there in table compare
+                continue
+            for field, label in sRow.Mismatches(tRow):
+                if field == 'definition':
+                    # first try to remove schema qualifications and see if they are still not equal
+                    # eg: (FOREIGN KEY (id) REFERENCES sample.person(id)  <>  FOREIGN KEY (id) REFERENCES sample_clone1.person(id))
+                    if sRow.definition == tRow.definition.replace(self.Tschema + '.', self.Sschema + '.'):
                         continue
+                    msg = '%20s %s mismatch (%s<>%s)' % (typediff, label, sRow.definition, tRow.definition)
                 else:
-                    continue
-                if not bFoundConstraint:
-                    msg = '%20s Target constraint name not found. Table(%35s)  Constraint(%s)' % (typediff, sTableName, sConstraintName)
-                    self.ddldiffs = self.ddldiffs + 1
-                    self.logit(DIFF, msg)                               
-            if not bFoundTable:
-                # dont treat as diff since we already caught the table not being there in table compare
-                #msg =     '%20s Target constraint table not found. Table(%35s)  Missing at least one constraint:%s-%s' % (typediff, sTableName, sConType, sConstraintName)
-                #self.ddldiffs = self.ddldiffs + 1
-                #self.logit(DIFF, msg)                               
-                pass
+                    msg = '%20s %17s mismatch (%s<>%s)' % (typediff, label, getattr(sRow, field), getattr(tRow, field))
+                self.ReportDiff(typediff, '%s.%s' % (sTableName, sConstraintName), msg, field, getattr(sRow, field), getattr(tRow, field))                               
                 
         # Now just see if tablename/constraintname pairs are not found in source when compared from target.
-        for tRow in Trows:
-            tTableName      = tRow[0]
-            tConstraintName = tRow[1]  
-            tConType        = tRow[2]
-            bFoundTable = False
-            bFoundConstraint = False
-            for sRow in Srows:
-                sTableName      = sRow[0]
-                sConstraintName = sRow[1]
-                if bFoundTable and sTableName != tTableName:
-                    bFoundConstraint = False
-                    break                
-                if sTableName == tTableName:
-                    bFoundTable = True
-                    if sConstraintName == tConstraintName:
-                        bFoundConstraint = True
-                        break
-                    else:
-                        bFoundConstraint = False
-                        continue
-            if not bFoundConstraint:                
-                msg = '%20s  Source constraint name not found. Table(%35s)  Constraint(%s)' % (typediff, tTableName, tConstraintName)
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit(DIFF, msg)                                   
-            if not bFoundTable:
-                # dont treat as diff since we already caught the table not being there in table compare
-                #msg = '%20s Source constraint table not found. Table(%35s)  Missing at least one constraint:%s-%s' % (typediff, tTableName, tConType, tConstraintName)
-                #self.ddldiffs = self.ddldiffs + 1
-                #self.logit(DIFF, msg)
-                pass
+        for tRow in diff.targetonly:
+            msg = '%20s  Source constraint name not found. Table(%35s)  Constraint(%s)' % (typediff, tRow.table, tRow.name)
+            self.ReportDiff(typediff, '%s.%s' % (tRow.table, tRow.name), msg, 'exists', False, True)                                   
     
         # Now do INDEX checks
-        aschema = self.Sschema
-        if self.pg_version_numS < 110000:
-            # cannot use indnkeyatts column which is missing in PG v10
-            sql = "SELECT c.relname AS tablename, i.relname AS indexname, x.indnatts natts, '' as nkeyatts, x.indisunique isunique, x.indisprimary isprimary, x.indisexclusion isexclusion, " \
-                  "x.indimmediate isimmediate, x.indisclustered isclustered, x.indisvalid isvalid, x.indisready isready, x.indislive islive, x.indkey, " \
-                  "array_to_string(ARRAY(SELECT pg_get_indexdef(i.oid, k + 1, true) FROM generate_subscripts(x.indkey, 1) as k ORDER BY k), ',') keycols, pg_get_indexdef(i.oid) AS indexdef " \
-                  "FROM ((((pg_index x JOIN pg_class c ON ((c.oid = x.indrelid))) JOIN pg_class i ON ((i.oid = x.indexrelid))) " \
-                  "LEFT JOIN pg_namespace n ON ((n.oid = c.relnamespace))) LEFT JOIN pg_tablespace t ON ((t.oid = i.reltablespace))) " \
-                  "WHERE n.nspname = '%s' AND ((c.relkind = 'r'::""char"") AND (i.relkind = 'i'::""char"")) order by 1,2" % aschema
-        else:
-            sql = "SELECT c.relname AS tablename, i.relname AS indexname, x.indnatts natts, x.indnkeyatts nkeyatts, x.indisunique isunique, x.indisprimary isprimary, x.indisexclusion isexclusion, " \
-                  "x.indimmediate isimmediate, x.indisclustered isclustered, x.indisvalid isvalid, x.indisready isready, x.indislive islive, x.indkey, " \
-                  "array_to_string(ARRAY(SELECT pg_get_indexdef(i.oid, k + 1, true) FROM generate_subscripts(x.indkey, 1) as k ORDER BY k), ',') keycols, pg_get_indexdef(i.oid) AS indexdef " \
-                  "FROM ((((pg_index x JOIN pg_class c ON ((c.oid = x.indrelid))) JOIN pg_class i ON ((i.oid = x.indexrelid))) " \
-                  "LEFT JOIN pg_namespace n ON ((n.oid = c.relnamespace))) LEFT JOIN pg_tablespace t ON ((t.oid = i.reltablespace))) " \
-                  "WHERE n.nspname = '%s' AND ((c.relkind = 'r'::""char"") AND (i.relkind = 'i'::""char"")) order by 1,2" % aschema
-        try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Indexes Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Srows = self.curS.fetchall()
+        rc, Srows, Trows = self.FetchPair('indexes')
+        if rc != RC_OK:
+            return rc
         if len(Srows) == 0:
             msg="Source Indexes Diff Notice: No rows returned."
             self.logit(WARN, msg)
-
-        aschema = self.Tschema
-        if self.pg_version_numT < 110000:
-            # cannot use indnkeyatts column which is missing in PG v10
-            sql = "SELECT c.relname AS tablename, i.relname AS indexname, x.indnatts natts, '' as nkeyatts, x.indisunique isunique, x.indisprimary isprimary, x.indisexclusion isexclusion, " \
-                  "x.indimmediate isimmediate, x.indisclustered isclustered, x.indisvalid isvalid, x.indisready isready, x.indislive islive, x.indkey, " \
-                  "array_to_string(ARRAY(SELECT pg_get_indexdef(i.oid, k + 1, true) FROM generate_subscripts(x.indkey, 1) as k ORDER BY k), ',') keycols, pg_get_indexdef(i.oid) AS indexdef " \
-                  "FROM ((((pg_index x JOIN pg_class c ON ((c.oid = x.indrelid))) JOIN pg_class i ON ((i.oid = x.indexrelid))) " \
-                  "LEFT JOIN pg_namespace n ON ((n.oid = c.relnamespace))) LEFT JOIN pg_tablespace t ON ((t.oid = i.reltablespace))) " \
-                  "WHERE n.nspname = '%s' AND ((c.relkind = 'r'::""char"") AND (i.relkind = 'i'::""char"")) order by 1,2" % aschema
-        else:
-            sql = "SELECT c.relname AS tablename, i.relname AS indexname, x.indnatts natts, x.indnkeyatts nkeyatts, x.indisunique isunique, x.indisprimary isprimary, x.indisexclusion isexclusion, " \
-                  "x.indimmediate isimmediate, x.indisclustered isclustered, x.indisvalid isvalid, x.indisready isready, x.indislive islive, x.indkey, " \
-                  "array_to_string(ARRAY(SELECT pg_get_indexdef(i.oid, k + 1, true) FROM generate_subscripts(x.indkey, 1) as k ORDER BY k), ',') keycols, pg_get_indexdef(i.oid) AS indexdef " \
-                  "FROM ((((pg_index x JOIN pg_class c ON ((c.oid = x.indrelid))) JOIN pg_class i ON ((i.oid = x.indexrelid))) " \
-                  "LEFT JOIN pg_namespace n ON ((n.oid = c.relnamespace))) LEFT JOIN pg_tablespace t ON ((t.oid = i.reltablespace))) " \
-                  "WHERE n.nspname = '%s' AND ((c.relkind = 'r'::""char"") AND (i.relkind = 'i'::""char"")) order by 1,2" % aschema
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target Indexes Diff Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Trows = self.curT.fetchall()
         if len(Trows) == 0:
             msg="Target Indexes Diff Notice: No rows returned."
             self.logit(WARN, msg)
         
         # compare on tablename, indexname
         typediff = 'Indexes Diff:'
-        for sRow in Srows:
-            sTableName    = sRow[0]
-            sIndexName    = sRow[1]
-            sNatts        = sRow[2]
-
-            if self.pg_version_numS < 110000 or self.pg_version_numT < 110000:
-                sKeyAtts      = ''
-            else:
-                sKeyAtts      = sRow[3]
-            
-            sIsUnique     = sRow[4]
-            sIsPrimary    = sRow[5]
-            sIsExclusion  = sRow[6]
-            sIsImmediate  = sRow[7]
-            sIsClustered  = sRow[8]
-            sIsValid      = sRow[9]
-            sIsReady      = sRow[10]
-            sIsLive       = sRow[11]
-            sIndKey       = sRow[12]
-            sKeyCols      = sRow[13]
-            sIndexDef     = sRow[14]
-            bFoundTable   = False
-            bFoundIndex   = False
-            for tRow in Trows:
-                tTableName    = tRow[0]
-                tIndexName    = tRow[1]
-                tNatts        = tRow[2]
-                tKeyAtts      = tRow[3]
-
-                if self.pg_version_numS < 110000 or self.pg_version_numT < 110000:
-                    tKeyAtts      = ''
-                else:
-                    tKeyAtts      = sRow[3]
-
-                tIsUnique     = tRow[4]
-                tIsPrimary    = tRow[5]
-                tIsExclusion  = tRow[6]
-                tIsImmediate  = tRow[7]
-                tIsClustered  = tRow[8]
-                tIsValid      = tRow[9]
-                tIsReady      = tRow[10]
-                tIsLive       = tRow[11]
-                tIndKey       = tRow[12]
-                tKeyCols      = tRow[13]
-                tIndexDef     = tRow[14]
-                if sTableName == tTableName:
-                    bFoundTable = True
-                    # print ('sconstraint=%s  tconstraint=%s' % (sConstraintName, tConstraintName))
-                    if sIndexName == tIndexName:
-                        bFoundIndex = True                
-                        if sNatts != tNatts:
-                            msg = '%20s    Index IndNatts mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sNatts, tNatts)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sKeyAtts != tKeyAtts:
-                            msg = '%20s     Index KeyAtts mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sKeyAtts, tKeyAtts)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIsUnique != tIsUnique:
-                            msg = '%20s    Index IsUnique mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sIsUnique, tIsUnique)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIsPrimary != tIsPrimary:
-                            msg = '%20s   Index IsPrimary mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sIsPrimary, tIsPrimary)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIsExclusion != tIsExclusion:
-                            msg = '%20s Index IsExclusion mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, ssIsExclusion, tsIsExclusion)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIsClustered != tIsClustered:
-                            msg = '%20s Index IsClustered mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sIsClustered, tIsClustered)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIsValid != tIsValid:
-                            msg = '%20s     Index IsValid mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sIsValid, tIsValid)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIsReady != tIsReady:
-                            msg = '%20s     Index IsReady mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sIsReady, tIsReady)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIsLive != tIsLive:
-                            msg = '%20s      Index IsLive mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sIsLive, tIsLive)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIndKey != tIndKey:
-                            msg = '%20s      Index IndKey mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sIndKey, tIndKey)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sKeyCols != tKeyCols:
-                            msg = '%20s     Index KeyCols mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sKeyCols, tKeyCols)
-                            self.ddldiffs = self.ddldiffs + 1
-                            self.logit(DIFF, msg)
-                        if sIndexDef != tIndexDef:
-                            # first try to remove schema qualifications and see if they are still not equal
-                            buffer = tIndexDef.replace(self.Tschema + '.', self.Sschema + '.')                            
-                            if sIndexDef != buffer:
-                                msg = '%20s Index IndexDef mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sTableName, sIndexName, sIndexDef, tIndexDef)
-                                self.ddldiffs = self.ddldiffs + 1
-                                self.logit(DIFF, msg)
+        diff = keyeddiff(Srows, Trows, lambda r: (r.table, r.name))
+        Stables = set([sRow.table for sRow in Srows])
+        Ttables = set([tRow.table for tRow in Trows])
+        # indnkeyatts is missing in PG v10
+        skip = ('nkeyatts',) if self.pg_version_numS < 110000 or self.pg_version_numT < 110000 else ()
+        for sRow, tRow in diff.pairs:
+            sTableName    = sRow.table
+            sIndexName    = sRow.name
+            if tRow is None:
+                if sTableName in Ttables:
+                    msg = '%20s       Target index name not found. Table(%35s)  Index(%s)' % (typediff, sTableName, sIndexName)
                 else:
-                        continue
-            else:
+                    msg = '%20s          Target index table not found. Table(%35s).  Missing at least one index:%s' % (typediff, sTableName, sIndexName)
+                self.ReportDiff(typediff, '%s.%s' % (sTableName, sIndexName), msg, 'exists', True, False)
                 continue
-            if not bFoundIndex:
-                msg = '%20s       Target index name not found. Table(%35s)  Index(%s)' % (typediff, sTableName, sIndexName)
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit(DIFF, msg)                               
-        if not bFoundTable and len(Srows) > 0:
-            msg = '%20s          Target index table not found. Table(%35s).  Missing at least one index:%s' % (typediff, sTableName, sIndexName)
-            self.ddldiffs = self.ddldiffs + 1
-            self.logit(DIFF, msg)                                       
+            for field, label in sRow.Mismatches(tRow, skip):
+                if field == 'indexdef':
+                    # first try to remove schema qualifications and see if they are still not equal
+                    if sRow.indexdef == tRow.indexdef.replace(self.Tschema + '.', self.Sschema + '.'):
+                        continue
+                    msg = '%20s %s mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, label, sTableName, sIndexName, sRow.indexdef, tRow.indexdef)
+                else:
+                    msg = '%20s %17s mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, label, sTableName, sIndexName, getattr(sRow, field), getattr(tRow, field))
+                self.ReportDiff(typediff, '%s.%s' % (sTableName, sIndexName), msg, field, getattr(sRow, field), getattr(tRow, field))
         
         # Now just see if tablename/indexname pairs are not found in source when compared from target.        
-        LastTable = ''
-        for tRow in Trows:
-            tTableName = tRow[0]
-            tIndexName = tRow[1]        
-            bFoundTable = False
-            bFoundIndex = False
-            for sRow in Srows:
-                sTableName = sRow[0]
-                sIndexName = sRow[1]
-                if bFoundTable and sTableName != tTableName:
-                    bFoundIndex = False
-                    break
-                if sTableName == tTableName:
-                    bFoundTable = True
-                    if sIndexName == tIndexName:
-                        bFoundIndex = True
-                        break
-                    else:
-                        bFoundIndex = False
-                        continue
-            if not bFoundIndex and bFoundTable:                
+        for tRow in diff.targetonly:
+            tTableName = tRow.table
+            tIndexName = tRow.name        
+            if tTableName in Stables:
                 msg = '%20s       Source index name not found. Table(%35s)  Index(%s)' % (typediff, tTableName, tIndexName)
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit(DIFF, msg)                                   
-            if not bFoundTable:
+            else:
                 msg = '%20s      Source index table not found. Table(%35s)  Missing at least one index:%s' % (typediff, tTableName, tIndexName)
-                self.ddldiffs = self.ddldiffs + 1
-                self.logit(DIFF, msg)        
+            self.ReportDiff(typediff, '%s.%s' % (tTableName, tIndexName), msg, 'exists', False, True)        
     
-        print ('')
+        self.Echo()
         return RC_OK        
     
 
@@ -1455,77 +2092,30 @@ class maint:
     #####################################
     def CompareFuncsProcs(self):        
         # output --> FUNCTION:fn_verticalregions(character varying, character varying)
-        aschema = self.Sschema
-        sql = "SELECT format('%%s:%%I(%%s)', CASE p.prokind WHEN 'p' THEN 'PROCEDURE' WHEN 'a' THEN 'AGGREGATE FUNCTION' WHEN 'w' THEN 'WINDOW FUNCTION' WHEN 'f' THEN 'FUNCTION' ELSE '' END, " \
-              "p.proname, oidvectortypes(p.proargtypes)) ddldef FROM pg_proc p INNER JOIN pg_namespace ns ON (p.pronamespace = ns.oid) WHERE ns.nspname = '%s' ORDER BY 1" % (aschema)
-        try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Funcs/Procs Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Srows = self.curS.fetchall()
+        rc, Srows, Trows = self.FetchPair('funcs')
+        if rc != RC_OK:
+            return rc
         if len(Srows) == 0:
             msg="      Source Funcs/Procs Notification: No funcs/procs found."
             self.logit(INFO, msg)
-
-        aschema = self.Tschema
-        sql = "SELECT format('%%s:%%I(%%s)', CASE p.prokind WHEN 'p' THEN 'PROCEDURE' WHEN 'a' THEN 'AGGREGATE FUNCTION' WHEN 'w' THEN 'WINDOW FUNCTION' WHEN 'f' THEN 'FUNCTION' ELSE '' END, " \
-              "p.proname, oidvectortypes(p.proargtypes)) ddldef FROM pg_proc p INNER JOIN pg_namespace ns ON (p.pronamespace = ns.oid) WHERE ns.nspname = '%s' ORDER BY 1" % (aschema)
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target Funcs/Procs Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Trows = self.curT.fetchall()
         if len(Trows) == 0:
             msg="      Target Funcs/Procs Notification: No funcs/procs found."
             self.logit(INFO, msg)
-            print('')
+            self.Echo()
             return RC_OK
 
-        cnt1 = 0
-        diffs = 0
         typediff = 'Funcs/Procs Diff'
-        for sRow in Srows:
-            sobject = sRow[0]
-            
-            cnt2 = 0
-            bFound = False
-            for tRow in Trows:
-                tobject = tRow[0]
-                if tobject == sobject:
-                    bFound = True
-                    break
-                cnt2 = cnt2 + 1
-            if not bFound:
-                self.ddldiffs = self.ddldiffs + 1
-                msg = '%20s:       Missing in Target - %s', (sobject)
-                self.logit(DIFF, msg)                                   
-            cnt1 = cnt1 + 1
+        diff = keyeddiff(Srows, Trows, lambda r: r.ddldef)
+        for sRow in diff.sourceonly:
+            msg = '%20s:       Missing in Target - %s' % (typediff, sRow.ddldef)
+            self.ReportDiff(typediff, sRow.ddldef, msg, 'exists', True, False)                                   
             
         # do the reverse from target perspective
-        for tRow in Trows:
-            tobject = tRow[0]
-            
-            cnt2 = 0
-            bFound = False
-            for sRow in Srows:
-                sobject = sRow[0]
-                if tobject == sobject:
-                    bFound = True
-                    break
-                cnt2 = cnt2 + 1    
-            if not bFound:
-                self.ddldiffs = self.ddldiffs + 1
-                msg = '%20s:       Missing in Source - %s', (tobject)
-                self.logit(DIFF, msg)                                   
-            cnt1 = cnt1 + 1
+        for tRow in diff.targetonly:
+            msg = '%20s:       Missing in Source - %s' % (typediff, tRow.ddldef)
+            self.ReportDiff(typediff, tRow.ddldef, msg, 'exists', False, True)                                   
 
-        print ('')
+        self.Echo()
         return RC_OK    
     
     
@@ -1533,117 +2123,837 @@ class maint:
     # Phase 6: Row count diffs #
     ############################
     def CompareRowCounts(self):    
-        aschema = self.Sschema
-        sql = "SELECT a.tblname, a.rowcnt, b.tblname, b.rowcnt from " \
-    	      "(SELECT c.relname as tblname, c.reltuples::bigint as rowcnt from pg_class c, pg_namespace n WHERE n.oid = c.relnamespace and n.nspname = '%s' and c.relkind = 'r' ORDER BY 1) a,  " \
-              "(SELECT t.relname as tblname, t.n_live_tup::bigint as rowcnt from pg_stat_user_tables t, pg_class c, pg_namespace n WHERE n.nspname = '%s' AND  " \
-              "n.oid = c.relnamespace AND n.nspname = t.schemaname and t.relname = c.relname and c.relkind = 'r'  ORDER BY 1) b WHERE a.tblname = b.tblname" % (aschema, aschema)
-        try:              
-            self.curS.execute(sql)
-        except Exception as error:
-            msg="Source Table Row Counts Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-
-        Srows = self.curS.fetchall()
-        sTotalRows = len(Srows)
+        rc, Srows, Trows = self.FetchPair('rowcounts')
+        if rc != RC_OK:
+            return rc
         if len(Srows) == 0:
             msg="Source Row Counts Diff Notice: No rows returned."
             self.logit(ERR, msg)
             #return RC_ERR    
-            
-    
-        '''
-        SELECT a.tblname, a.rowcnt, b.tblname, b.rowcnt from 
-    	(SELECT c.relname as tblname, c.reltuples::bigint as rowcnt from pg_class c, pg_namespace n WHERE n.oid = c.relnamespace and n.nspname = 'sample_clone1' and c.relkind = 'r' ORDER BY 1) a, 
-        (SELECT t.relname as tblname, t.n_live_tup::bigint as rowcnt from pg_stat_user_tables t, pg_class c, pg_namespace n WHERE n.nspname = 'sample_clone1' AND 
-        n.oid = c.relnamespace AND n.nspname = t.schemaname and t.relname = c.relname and c.relkind = 'r'  ORDER BY 1) b 
-        WHERE a.tblname = b.tblname;
-        '''
-     
-        aschema = self.Tschema
-        sql = "SELECT a.tblname, a.rowcnt, b.tblname, b.rowcnt from " \
-    	      "(SELECT c.relname as tblname, c.reltuples::bigint as rowcnt from pg_class c, pg_namespace n WHERE n.oid = c.relnamespace and n.nspname = '%s' and c.relkind = 'r' ORDER BY 1) a,  " \
-              "(SELECT t.relname as tblname, t.n_live_tup::bigint as rowcnt from pg_stat_user_tables t, pg_class c, pg_namespace n WHERE n.nspname = '%s' AND  " \
-              "n.oid = c.relnamespace AND n.nspname = t.schemaname and t.relname = c.relname and c.relkind = 'r'  ORDER BY 1) b WHERE a.tblname = b.tblname" % (aschema, aschema)
-        try:              
-            self.curT.execute(sql)
-        except Exception as error:
-            msg="Target Table Row Counts Error %s *** %s" % (type(error), error)
-            self.logit(ERR, msg)
-            return RC_ERR
-    
-        Trows = self.curT.fetchall()
         if len(Trows) == 0:
             msg="Target Row Counts Diff Notice: No rows returned."
             self.logit(ERR, msg)
             #return RC_ERR    
 
-        cnt1 = 0
-        diffs = 0
-        typediff = 'Row Counts Diff:'
         for sRow in Srows:
-            cnt1 = cnt1 + 1
-                
-            sTable1      = sRow[0]
-            sCount1      = sRow[1]
-            sTable2      = sRow[2]
-            sCount2      = sRow[3]
-            if sTable1 != sTable2:
-                msg='Program Errror: unexpected table mismatch for source tables (%s, %s)' % (sTable1, sTable2)
+            if sRow.table != sRow.stattable:
+                msg='Program Errror: unexpected table mismatch for source tables (%s, %s)' % (sRow.table, sRow.stattable)
                 self.logit(ERR, msg)
                 return RC_ERR                
+        for tRow in Trows:
+            if tRow.table != tRow.stattable:
+                msg='Program Errror: unexpected table mismatch for target tables (%s, %s)' % (tRow.table, tRow.stattable)
+                self.logit(ERR, msg)
+                return RC_ERR     
 
-            cnt2 = 0
-            for tRow in Trows:
-                tTable1      = tRow[0]
-                tCount1      = tRow[1]
-                tTable2      = tRow[2]
-                tCount2      = tRow[3]
-                if tTable1 != tTable2:
-                    msg='Program Errror: unexpected table mismatch for target tables (%s, %s)' % (tTable1, tTable2)
-                    self.logit(ERR, msg)
-                    return RC_ERR     
-
-                if sTable1 == tTable1:
-                    # we are using pg_class.reltuples not pg_stat_user_tables.n_live_tup
-                    if sCount1 != tCount1:
-                        # Before giving up, do the real count if detailescan is indicated.
-                        if pg.scantype != 'detailedscan':
-                            diffs = diffs + 1
-                            self.rowcntdiffs = self.rowcntdiffs + 1
-                            self.logit (DIFF, '%20s %-35s rowcnts mismatch %09d<>%09d  diff=%09d' % (typediff, sTable1, sCount1, tCount1, abs(sCount1 - tCount1)))
-                        else:
-                            #if self.PythonVersion == 2:
-                            sys.stdout.write('\r>> Processing table %30s (%d/%d) diffs (%d)    ' % (sTable1, cnt1, sTotalRows, self.rowcntdiffs))
-                            sys.stdout.flush()
-
-                            aschema = self.Sschema
-                            sql = 'SELECT COUNT(*) from %s."%s"' % (aschema, sTable1)
-                            try:              
-                                self.curS.execute(sql)
-                            except Exception as error:
-                                msg="Source Table Real Row Counts Error %s *** %s" % (type(error), error)
-                                self.logit(ERR, msg)
-                                return RC_ERR
-                            Srow = self.curS.fetchone()
-                            aschema = self.Tschema
-                            sql = 'SELECT COUNT(*) from %s."%s"' % (aschema, tTable1)
-                            try:              
-                                self.curT.execute(sql)
-                            except Exception as error:
-                                msg="Target Table Real Row Counts Error %s *** %s" % (type(error), error)
-                                self.logit(ERR, msg)
-                                return RC_ERR
-                            Trow = self.curT.fetchone()
-                            if Srow[0] != Trow[0]:
-                                diffs = diffs + 1
-                                self.rowcntdiffs = self.rowcntdiffs + 1
-                                self.logit (DIFF, '%20s %-35s Real rowcnts mismatch %09d<>%09d  diff=$09d' % (typediff, sTable1, Srow[0], Trow[0], abs(Srow[0] - Trow[0])))
-                    break        
-        print ('')
+        diffs = 0
+        counted = []
+        typediff = 'Row Counts Diff:'
+        diff = keyeddiff(Srows, Trows, lambda r: r.table, firstmatch=True)
+        if self.scantype == 'samplescan':
+            # statistics may be stale on both sides, so every table is sampled, not just the mismatches
+            return self.SampleRowCounts(diff.matched)
+
+        # --partitions: leaf partitions are compared per partitioned table they roll up to, see RollupPartitions
+        parents = {}
+        if self.Partitions:
+            rc, parents = self.PartitionParents(diff.matched)
+            if rc != RC_OK:
+                return rc
+        rollups = {}
+        for sRow, tRow in diff.matched:
+            sTable1      = sRow.table
+            sCount1      = sRow.rowcnt
+            tCount1      = tRow.rowcnt
+            if sTable1 in parents:
+                rollups.setdefault(parents[sTable1], []).append((sRow, tRow))
+
+            # we are using pg_class.reltuples not pg_stat_user_tables.n_live_tup
+            if sCount1 != tCount1:
+                # Before giving up, do the real count if detailescan is indicated.
+                if self.scantype != 'detailedscan':
+                    if sTable1 in parents:
+                        continue
+                    diffs = diffs + 1
+                    self.ReportDiff(typediff, sTable1, '%20s %-35s rowcnts mismatch %09d<>%09d  diff=%09d' % (typediff, sTable1, sCount1, tCount1, abs(sCount1 - tCount1)),
+                                    'rowcnt', sCount1, tCount1, counter='rowcntdiffs')
+                else:
+                    counted.append((sRow, tRow))
+
+        # DetailedScan: queue the real counts for both sides at once, biggest tables (pg_relation_size) first,
+        # so the pooled workers of each side count in parallel and the long ones are not left for last.
+        # Each side of a table gets the count strategy its size and visibility map call for.
+        self.countedtables = len(counted)
+        plans = {'S': {}, 'T': {}}
+        if counted:
+            rc, Splans, Tplans = self.RunPair('countplans', 'Table Count Strategies', self.CountPlanSQL(self.Sschema), self.CountPlanSQL(self.Tschema))
+            if rc != RC_OK:
+                return rc
+            plans = {'S': dict([(arow[0], arow) for arow in Splans]), 'T': dict([(arow[0], arow) for arow in Tplans])}
+        tasks = {}
+        strategies = {}
+        for sRow, tRow in sorted(counted, key=lambda pair: pair[0].relsize, reverse=True):
+            sStrategy, sSettings = self.CountStrategy(plans['S'].get(sRow.table))
+            tStrategy, tSettings = self.CountStrategy(plans['T'].get(tRow.table))
+            sql1 = 'SELECT COUNT(*) from %s."%s"' % (self.Sschema, sRow.table)
+            sql2 = 'SELECT COUNT(*) from %s."%s"' % (self.Tschema, tRow.table)
+            tasks[sRow.table] = (self.SubmitQuery('realcount', 'S', sql1, sSettings), self.SubmitQuery('realcount', 'T', sql2, tSettings))
+            strategies[sRow.table] = (sStrategy, tStrategy)
+
+        cnt1 = 0
+        results = {}
+        for sRow, tRow in counted:
+            cnt1 = cnt1 + 1
+            sTable1 = sRow.table
+            #if self.PythonVersion == 2:
+            self.Progress('>> Processing table %30s (%d/%d) diffs (%d)    ' % (sTable1, cnt1, len(counted), self.rowcntdiffs))
+
+            taskS, taskT = tasks[sTable1]
+            self.WaitQuery(taskS)
+            self.WaitQuery(taskT)
+            if self.stopped.is_set():
+                return RC_DIFF
+            sCount, sStrategy = self.CountResult('Source', taskS, sRow, strategies[sTable1][0])
+            tCount, tStrategy = self.CountResult('Target', taskT, tRow, strategies[sTable1][1])
+            if sCount is None or tCount is None:
+                return RC_ERR
+            if sTable1 in parents:
+                # reported with its partitioned table once all counts are in
+                results[sTable1] = (sCount, tCount, sStrategy, tStrategy)
+            elif sCount != tCount:
+                diffs = diffs + 1
+                # a side that timed out compares its estimate, so the line says estimate, not real
+                kind = 'rowcnts' if 'estimate' in (sStrategy, tStrategy) else 'Real rowcnts'
+                self.ReportDiff(typediff, sTable1, '%20s %-35s %s mismatch %09d<>%09d  diff=%09d  (%s/%s)' % (typediff, sTable1, kind, sCount, tCount, abs(sCount - tCount), sStrategy, tStrategy),
+                                'count', sCount, tCount, {'strategy': {'source': sStrategy, 'target': tStrategy}}, counter='rowcntdiffs')
+        self.RollupPartitions(typediff, rollups, results)
+        self.Echo()
         return RC_OK    
 
+    def PartitionSQL(self, schema, version):
+        # every leaf partition of each top-level partitioned table (relkind 'p') in the schema, through any
+        # number of sub-partition levels; declarative partitioning (and relispartition) came with PostgreSQL 10
+        if version < 100000:
+            return "SELECT NULL::name, NULL::name WHERE false"
+        return "WITH RECURSIVE tree AS (SELECT p.oid AS root, p.oid AS relid FROM pg_class p, pg_namespace n WHERE n.oid = p.relnamespace AND n.nspname = '%s' " \
+               "AND p.relkind = 'p' AND NOT p.relispartition UNION ALL SELECT t.root, i.inhrelid FROM tree t, pg_inherits i WHERE i.inhparent = t.relid) " \
+               "SELECT c.relname, r.relname FROM tree t, pg_class r, pg_class c WHERE r.oid = t.root AND c.oid = t.relid AND c.relkind = 'r' " \
+               "AND c.relnamespace = r.relnamespace ORDER BY 1" % schema
+
+    def PartitionParents(self, matched):
+        # maps each matched table that is a leaf partition of the same partitioned table on both sides to that table.
+        # A partition attached to different parents on the two sides is compared on its own; the DDL phases report the rest.
+        rc, Srows, Trows = self.RunPair('partitions', 'Table Partitions', self.PartitionSQL(self.Sschema, self.pg_version_numS),
+                                        self.PartitionSQL(self.Tschema, self.pg_version_numT))
+        if rc != RC_OK:
+            return rc, None
+        Sparents = dict([(arow[0], arow[1]) for arow in Srows])
+        Tparents = dict([(arow[0], arow[1]) for arow in Trows])
+        parents = {}
+        for sRow, tRow in matched:
+            parent = Sparents.get(sRow.table)
+            if parent is not None and parent == Tparents.get(tRow.table):
+                parents[sRow.table] = parent
+        return RC_OK, parents
+
+    def RollupPartitions(self, typediff, rollups, results):
+        # one diff per partitioned table whose partitions differ, totalled over all its partitions, then a drill-down
+        # line per differing partition.  Partitions whose estimates match were not counted and add their estimate.
+        for parent in sorted(rollups):
+            sTotal = 0
+            tTotal = 0
+            differing = []
+            for sRow, tRow in rollups[parent]:
+                sCount, tCount, sStrategy, tStrategy = results.get(sRow.table, (sRow.rowcnt, tRow.rowcnt, 'estimate', 'estimate'))
+                sTotal = sTotal + sCount
+                tTotal = tTotal + tCount
+                if sCount != tCount:
+                    differing.append({'partition': sRow.table, 'source_value': sCount, 'target_value': tCount,
+                                      'strategy': {'source': sStrategy, 'target': tStrategy}})
+            if not differing:
+                continue
+            estimated = [p for p in differing if 'estimate' in p['strategy'].values()]
+            kind = 'rowcnts' if estimated else 'Real rowcnts'
+            self.ReportDiff(typediff, parent, '%20s %-35s Partitioned %s mismatch %09d<>%09d  diff=%09d  (%d of %d partitions differ)' %
+                            (typediff, parent, kind, sTotal, tTotal, abs(sTotal - tTotal), len(differing), len(rollups[parent])),
+                            'count' if self.scantype == 'detailedscan' else 'rowcnt', sTotal, tTotal, {'objtype': 'partitioned table', 'partitions': differing},
+                            counter='rowcntdiffs')
+            for p in differing:
+                msg = '%20s %-35s   partition %-30s %09d<>%09d  diff=%09d' % (typediff, parent, p['partition'], p['source_value'], p['target_value'],
+                                                                              abs(p['source_value'] - p['target_value']))
+                if self.scantype == 'detailedscan':
+                    msg = msg + '  (%s/%s)' % (p['strategy']['source'], p['strategy']['target'])
+                self.logit(DIFF, msg)
+
+    def CountPlanSQL(self, schema):
+        # what the count strategy of each table depends on: heap pages, all-visible pages and a valid primary key
+        return "SELECT c.relname, c.relpages, c.relallvisible, EXISTS (SELECT 1 FROM pg_index i WHERE i.indrelid = c.oid AND i.indisprimary AND i.indisvalid) " \
+               "FROM pg_class c, pg_namespace n WHERE n.oid = c.relnamespace AND n.nspname = '%s' AND c.relkind = 'r'" % schema
+
+    def CountStrategy(self, plan):
+        # returns (strategy, settings) for counting one side of a table.  An index-only scan of the primary key
+        # reads far less than the heap when the visibility map says most pages are all-visible; a big heap
+        # otherwise gets a parallel seq scan.  --count_timeout caps every count, the caller falls back to the estimate.
+        settings = []
+        if self.counttimeout > 0:
+            settings.append(('statement_timeout', "'%ds'" % self.counttimeout))
+        if plan is not None:
+            relname, relpages, allvisible, haspkey = plan
+            if haspkey and relpages > 0 and allvisible >= COUNTALLVISIBLE * relpages:
+                return 'indexonly', settings + [('enable_seqscan', 'off'), ('enable_bitmapscan', 'off')]
+            if relpages * BLOCKSIZE >= COUNTPARALLELMB * 1024 * 1024:
+                return 'parallel', settings + [('max_parallel_workers_per_gather', str(COUNTPARALLEL)), ('parallel_setup_cost', '0')]
+        return 'seqscan', settings
+
+    def CountResult(self, label, task, row, strategy):
+        # (count, strategy) of one side; a count cancelled by the statement timeout becomes the pg_class estimate
+        if task.error is None:
+            return task.rows[0][0], strategy
+        if self.counttimeout > 0 and isinstance(task.error, psycopg2.extensions.QueryCanceledError):
+            self.logit(WARN, "%s count of %s timed out after %d seconds (%s), using the estimate." % (label, row.table, self.counttimeout, strategy))
+            return row.rowcnt, 'estimate'
+        msg="%s Table Real Row Counts Error %s *** %s" % (label, type(task.error), task.error)
+        self.logit(ERR, msg)
+        return None, strategy
+
+    ###################################################
+    # Phase 6: SampleScan row count estimates         #
+    ###################################################
+    def SampleRowCounts(self, matched):
+        # TABLESAMPLE SYSTEM keeps each page with probability q, so with n_i live rows on sampled page i
+        # the Horvitz-Thompson estimate is N = sum(n_i)/q with standard error sqrt((1-q) * sum(n_i^2))/q.
+        # Tables with too few pages to sample meaningfully at this rate are counted exactly instead.
+        q = self.samplepct / 100.0
+        sqlsample = 'SELECT COALESCE(sum(n), 0), COALESCE(sum(n * n), 0) FROM (SELECT (ctid::text::point)[0] AS blk, count(*) AS n ' \
+                    'FROM %s."%s" TABLESAMPLE SYSTEM (%s) GROUP BY 1) s'
+        sqlexact  = 'SELECT COUNT(*), NULL from %s."%s"'
+
+        def sampleSQL(schema, table, relsize):
+            if q >= 1.0 or (relsize // BLOCKSIZE) * q < MINSAMPLEPAGES:
+                return sqlexact % (schema, table)
+            return sqlsample % (schema, table, repr(self.samplepct))
+
+        def estimate(row):
+            # returns (estimate, standard error); exact counts have no error
+            if row[1] is None:
+                return float(row[0]), 0.0
+            return float(row[0]) / q, math.sqrt((1.0 - q) * float(row[1])) / q
+
+        tasks = {}
+        for sRow, tRow in sorted(matched, key=lambda pair: pair[0].relsize, reverse=True):
+            tasks[sRow.table] = (self.SubmitQuery('samplecount', 'S', sampleSQL(self.Sschema, sRow.table, sRow.relsize)),
+                                 self.SubmitQuery('samplecount', 'T', sampleSQL(self.Tschema, tRow.table, tRow.relsize)))
+
+        cnt1 = 0
+        typediff = 'Row Counts Diff:'
+        for sRow, tRow in matched:
+            cnt1 = cnt1 + 1
+            sTable1 = sRow.table
+            self.Progress('>> Sampling table %30s (%d/%d) diffs (%d)    ' % (sTable1, cnt1, len(matched), self.rowcntdiffs))
+
+            taskS, taskT = tasks[sTable1]
+            rc, Ssample, Tsample = self.WaitPair('Table Sample Row Counts', taskS, taskT)
+            if rc != RC_OK:
+                return rc
+            sEst, sErr = estimate(Ssample[0])
+            tEst, tErr = estimate(Tsample[0])
+            sLow, sHigh = max(0.0, sEst - Z95 * sErr), sEst + Z95 * sErr
+            tLow, tHigh = max(0.0, tEst - Z95 * tErr), tEst + Z95 * tErr
+            msg = '%20s %-35s sampled rowcnts %d [%d-%d] <> %d [%d-%d] (95%% CI)' % (typediff, sTable1, sEst, sLow, sHigh, tEst, tLow, tHigh)
+            # only intervals that do not overlap count as drift
+            if sHigh < tLow or tHigh < sLow:
+                self.ReportDiff(typediff, sTable1, msg, 'sampled_rowcnt', int(sEst), int(tEst), counter='rowcntdiffs')
+            else:
+                self.logit (DEBUG, msg)
+        self.Echo()
+        return RC_OK
+
+
+    ##################################
+    # Phase 7: Table checksum diffs  #
+    ##################################
+    def CompareChecksums(self):
+        rc, Srows, Trows = self.FetchPair('tablesizes')
+        if rc != RC_OK:
+            return rc
+        if len(Srows) == 0:
+            msg="Source Checksums Diff Notice: No tables found."
+            self.logit(INFO, msg)
+
+        # Each row hashes to the first 64 bits of md5(row::text); the sum of those is independent of row order,
+        # needs no primary key, and only the row count and the sum come back over the network.
+        # ROW(t.*), not a bare t, which would be a column of that name if the table has one.
+        sqlfmt = "SELECT count(*), COALESCE(sum(('x' || substr(md5(ROW(t.*)::text), 1, 16))::bit(64)::bigint::numeric), 0)::text FROM %s.\"%s\" t"
+
+        # Text output settings are pinned so both servers render the same values the same way, with SET LOCAL for
+        # each checksum alone so the pooled connections keep their own settings.  Floats: extra_float_digits > 0
+        # is the shortest exact form from PostgreSQL 12 on but 17 significant digits before, so a pair across
+        # that line uses 0, the 15 digits every version renders the same.
+        floatdigits = '3'
+        if (self.pg_version_numS >= 120000) != (self.pg_version_numT >= 120000):
+            floatdigits = '0'
+            self.logit(WARN, "Checksums: source and target are on either side of PostgreSQL 12, floats are compared to 15 significant digits.")
+        settings = [('TimeZone', "'UTC'"), ('DateStyle', "'ISO, YMD'"), ('IntervalStyle', 'postgres'), ('extra_float_digits', floatdigits), ('bytea_output', 'hex')]
+
+        # only tables in both schemas, biggest first so the long ones are not left for last
+        diff = keyeddiff(Srows, Trows, lambda r: r[0])
+        tasks = {}
+        for sRow, tRow in sorted(diff.matched, key=lambda pair: pair[0][1], reverse=True):
+            tasks[sRow[0]] = (self.SubmitQuery('checksum', 'S', sqlfmt % (self.Sschema, sRow[0]), settings),
+                              self.SubmitQuery('checksum', 'T', sqlfmt % (self.Tschema, tRow[0]), settings))
+
+        cnt1 = 0
+        typediff = 'Checksums Diff:'
+        for sRow, tRow in diff.matched:
+            cnt1 = cnt1 + 1
+            sTable = sRow[0]
+            self.Progress('>> Checksumming table %30s (%d/%d) diffs (%d)    ' % (sTable, cnt1, len(diff.matched), self.datadiffs))
+
+            taskS, taskT = tasks[sTable]
+            rc, Ssum, Tsum = self.WaitPair('Table Checksum', taskS, taskT)
+            if rc != RC_OK:
+                return rc
+            if Ssum[0] != Tsum[0]:
+                self.ReportDiff(typediff, sTable, '%20s %-35s checksum mismatch  rows %09d<>%09d' % (typediff, sTable, Ssum[0][0], Tsum[0][0]),
+                                'checksum', list(Ssum[0]), list(Tsum[0]), counter='datadiffs')
+        self.Echo()
+        return RC_OK
+
+    #################################################################
+    # Fan-out mode: one source against many targets.  The source    #
+    # catalog is extracted once; each target gets its own maint     #
+    # (connections, workers, counters, report) fed those same rows, #
+    # and all targets run at once from an asyncio event loop.       #
+    #################################################################
+    def LoadTargets(self):
+        # one target per line as libpq keywords (host, port, user, dbname) plus schema; -h/-p/-u/-d/-s fill in the rest
+        try:
+            f = open(self.Targets, 'r')
+            lines = f.readlines()
+            f.close()
+        except Exception as error:
+            msg="Targets File Error %s *** %s" % (type(error), error)
+            self.logit(ERR, msg)
+            return None
+        targets = []
+        for line in lines:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            try:
+                parms = dict(item.split('=', 1) for item in line.split())
+                target = {'host': parms.get('host', self.Thost), 'port': int(parms.get('port', self.Tport)), 'user': parms.get('user', self.Tuser),
+                          'dbname': parms.get('dbname', self.Tdb), 'schema': parms.get('schema', self.Tschema)}
+            except ValueError:
+                target = {}
+            if not target or '' in (target['user'], target['dbname'], target['schema']):
+                msg="Targets File Error: invalid target (%s). Expected host=.. port=.. user=.. dbname=.. schema=.." % line
+                self.logit(ERR, msg)
+                return None
+            targets.append(target)
+        if len(targets) == 0:
+            self.logit(ERR, "Targets File Error: no targets in %s" % self.Targets)
+            return None
+        return targets
+
+    def FanOut(self, targets):
+        # the prefetched source queries are all this maint runs
+        srcrows = {}
+        for (qname, side), task in list(self.tasks.items()):
+            self.WaitQuery(task)
+            if task.error is not None:
+                msg="Source %s Error %s *** %s" % (qname, type(task.error), task.error)
+                self.logit(ERR, msg)
+                return RC_ERR
+            srcrows[qname] = task.rows
+        self.tasks = {}
+
+        runs = []
+        for target in targets:
+            t = maint()
+            for attr in FANOUT_SETTINGS:
+                setattr(t, attr, getattr(self, attr))
+            t.Thost, t.Tport, t.Tuser, t.Tdb, t.Tschema = target['host'], target['port'], target['user'], target['dbname'], target['schema']
+            t.sourcerows      = srcrows
+            t.prokindS        = self.prokindS
+            t.pg_version_numS = self.pg_version_numS
+            t.report          = []
+            if self.profiler is not None:
+                # --metrics labels the queries of each target with that target; the profile report ranks them all
+                t.profiler    = profiledata()
+            runs.append(t)
+        self.runs = runs
+
+        # psycopg2 blocks, so each target's compare runs in an executor thread; the loop only fans out and gathers.
+        # One thread per target: the default executor has min(32, cpus + 4) threads and would queue the rest.
+        self.logit(INFO, "Comparing source %s.%s against %d targets..." % (self.Sdb, self.Sschema, len(runs)))
+        loop = asyncio.new_event_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(runs))
+        try:
+            results = loop.run_until_complete(asyncio.gather(*[loop.run_in_executor(executor, t.CompareTarget) for t in runs]))
+        finally:
+            executor.shutdown(wait=True)
+            loop.close()
+        if self.profiler is not None:
+            for t in runs:
+                self.profiler.phases.extend(t.profiler.phases)
+                self.profiler.queries.extend(t.profiler.queries)
+
+        # one combined report per target, in the order of the targets file
+        failed = 0
+        for i, (t, rc) in enumerate(zip(runs, results)):
+            self.logit(INFO, "========== Target T%d: %s:%d/%s schema %s ==========" % (i + 1, t.Thost, t.Tport, t.Tdb, t.Tschema))
+            for line in t.report:
+                self.Echo(line)
+            if rc not in (RC_OK, RC_DIFF):
+                failed = failed + 1
+
+        # drift matrix: which targets differ from the source on which objects (? = target failed)
+        objects = sorted(set().union(*[t.diffobjects for t in runs]))
+        self.logit(INFO, "========== Drift matrix: %d objects x %d targets ==========" % (len(objects), len(runs)))
+        self.logit(INFO, "%-70s %s" % ('', ' '.join(['T%-3d' % (i + 1) for i in range(len(runs))])))
+        for typediff, objkey in objects:
+            cells = []
+            for t, rc in zip(runs, results):
+                cells.append('?' if rc not in (RC_OK, RC_DIFF) else ('X' if (typediff, objkey) in t.diffobjects else '.'))
+            self.logit(INFO, "%-70s %s" % (('%s: %s' % (typediff, objkey))[:70], ' '.join(['%-4s' % c for c in cells])))
+        drifted = len([t for t, rc in zip(runs, results) if rc in (RC_OK, RC_DIFF) and t.diffobjects])
+        self.logit(INFO, "Fan-out summary: %d targets, %d with differences, %d failed." % (len(runs), drifted, failed))
+        if failed:
+            return RC_ERR
+        # --max_diffs: RC_DIFF when any target used up its budget
+        return RC_DIFF if RC_DIFF in results else RC_OK
+
+    def CompareTarget(self):
+        # runs in an executor thread; everything it prints goes to self.report
+        dt_started = datetime.datetime.utcnow()
+        rc = self.ConnectAll()
+        if rc == RC_OK:
+            self.Prefetch()
+            rc = self.RunPhases()
+        self.runsecs = (datetime.datetime.utcnow() - dt_started).total_seconds()
+        if rc in (RC_OK, RC_DIFF):
+            self.Summary(round(self.runsecs))
+        self.CloseStuff(rc)
+        return rc
+
+    #################################################################
+    # Multi-schema mode: many source/target schema pairs of the two #
+    # databases.  Each catalog query runs once per side for all the #
+    # mapped schemas (LATERAL over the schema list), the rows are   #
+    # split by schema in memory, and every pair is diffed in turn.  #
+    #################################################################
+    def MapSchemas(self):
+        # returns [(source schema, target schema)] from the mapping file, or all schemas with identical names
+        sql = "SELECT nspname FROM pg_namespace WHERE nspname NOT IN ('pg_catalog', 'information_schema') AND nspname NOT LIKE 'pg_toast%%' AND nspname NOT LIKE 'pg_temp%%' ORDER BY 1"
+        rc, Srows, Trows = self.RunPair('schemas', 'Schema List', sql, sql)
+        if rc != RC_OK:
+            return None
+        Sschemas = [arow[0] for arow in Srows]
+        Tschemas = [arow[0] for arow in Trows]
+
+        typediff = 'Schema Diff:'
+        pairs = []
+        if self.SchemaMap == '':
+            diff = keyeddiff([(x,) for x in Sschemas], [(x,) for x in Tschemas], lambda r: r[0])
+            pairs = [(sRow[0], tRow[0]) for sRow, tRow in diff.matched]
+            for sRow in diff.sourceonly:
+                self.ReportDiff(typediff, sRow[0], '%20s Source schema (%s) not found in Target' % (typediff, sRow[0]), 'exists', True, False)
+            for tRow in diff.targetonly:
+                self.ReportDiff(typediff, tRow[0], '%20s Target schema (%s) not found in Source' % (typediff, tRow[0]), 'exists', False, True)
+            return pairs
+
+        try:
+            f = open(self.SchemaMap, 'r')
+            lines = f.readlines()
+            f.close()
+        except Exception as error:
+            msg="Schema Map File Error %s *** %s" % (type(error), error)
+            self.logit(ERR, msg)
+            return None
+        for line in lines:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            items = line.split()
+            if len(items) != 2:
+                msg="Schema Map File Error: invalid line (%s). Expected: <source schema> <target schema>" % line
+                self.logit(ERR, msg)
+                return None
+            if items[0] not in Sschemas:
+                self.ReportDiff(typediff, items[0], '%20s Source schema (%s) not found' % (typediff, items[0]), 'exists', False, None)
+            elif items[1] not in Tschemas:
+                self.ReportDiff(typediff, items[1], '%20s Target schema (%s) not found' % (typediff, items[1]), 'exists', None, False)
+            else:
+                pairs.append((items[0], items[1]))
+        return pairs
+
+    def SchemasSQL(self, qname, side, schemas):
+        # the single-schema query, run once per listed schema through LATERAL, with the schema name as first column
+        sql = self.CatalogSQL(qname, side, SCHEMATOKEN)
+        sql = sql.replace("'^(%s)$'" % SCHEMATOKEN, "('^(' || mschema.nspname || ')$')").replace("'%s'" % SCHEMATOKEN, 'mschema.nspname')
+        names = ','.join(["'%s'" % x.replace("'", "''") for x in schemas])
+        return "SELECT mschema.nspname, q.* FROM unnest(ARRAY[%s]::name[]) AS mschema(nspname) CROSS JOIN LATERAL (%s) q" % (names, sql)
+
+    def CompareSchemas(self):
+        pairs = self.MapSchemas()
+        if pairs is None:
+            return RC_ERR
+        if self.stopped.is_set():
+            # --max_diffs: the schema list alone used up the budget
+            return RC_DIFF
+        if len(pairs) == 0:
+            self.logit(WARN, "No schemas to compare.")
+            return RC_OK
+        self.logit(INFO, "Comparing %d schema pairs..." % len(pairs))
+
+        # one query per side per phase for all the schemas
+        for qname, phase, label in CATALOG_QUERIES:
+            if self.PhaseEnabled(phase):
+                self.tasks[(qname, 'S')] = self.SubmitQuery(qname, 'S', self.SchemasSQL(qname, 'S', sorted(set([p[0] for p in pairs]))))
+                self.tasks[(qname, 'T')] = self.SubmitQuery(qname, 'T', self.SchemasSQL(qname, 'T', sorted(set([p[1] for p in pairs]))))
+        byschema = {'S': {}, 'T': {}}
+        for qname, phase, label in CATALOG_QUERIES:
+            if not self.PhaseEnabled(phase):
+                continue
+            rc, Srows, Trows = self.RunPair(qname, label, '', '')
+            if rc != RC_OK:
+                return rc
+            for side, rows in (('S', Srows), ('T', Trows)):
+                for arow in rows:
+                    byschema[side].setdefault(arow[0], {}).setdefault(qname, []).append(tuple(arow[1:]))
+
+        # every pair gets its own maint over those rows; counts and checksums still go to the shared workers
+        for sschema, tschema in pairs:
+            self.logit(INFO, "========== Schema %s -> %s ==========" % (sschema, tschema))
+            started = time.time()
+            t = maint()
+            for attr in MULTISCHEMA_SETTINGS:
+                setattr(t, attr, getattr(self, attr))
+            t.Sschema, t.Tschema = sschema, tschema
+            t.sourcerows = byschema['S'].get(sschema, {})
+            t.targetrows = byschema['T'].get(tschema, {})
+            t.flog = self.flog
+            if self.maxdiffs > 0:
+                # --max_diffs: what is left of the budget after the pairs before this one
+                t.maxdiffs = self.maxdiffs - (self.ddldiffs + self.rowcntdiffs + self.datadiffs)
+            t.Prefetch()
+            rc = t.RunPhases()
+            if rc not in (RC_OK, RC_DIFF):
+                return rc
+            t.runsecs = time.time() - started
+            self.runs.append(t)
+            self.logit(INFO, "Schema %s -> %s: ddl (%d)  rowcnts (%d)  data (%d)" % (sschema, tschema, t.ddldiffs, t.rowcntdiffs, t.datadiffs))
+            self.ddldiffs    = self.ddldiffs + t.ddldiffs
+            self.rowcntdiffs = self.rowcntdiffs + t.rowcntdiffs
+            self.datadiffs   = self.datadiffs + t.datadiffs
+            self.diffobjects.update(set([(typediff, '%s.%s' % (sschema, objkey)) for typediff, objkey in t.diffobjects]))
+            if rc == RC_DIFF:
+                return rc
+        return RC_OK
+
+    ###################################################
+    # Phases 1-7 for the source/target pair, in order #
+    ###################################################
+    def RunPhases(self):
+        # Phase 1: Compare object counts
+        self.logit(INFO, "PHASE 1: Comparing Object Counts...")
+        rc = self.TimedPhase(self.CompareObjects)
+        if rc == RC_ERR:
+            # error has already been logged
+            self.logit(INFO, 'CompareObjects() Errror.')
+            return RC_ERR
+        if rc == RC_DIFF:
+            # --max_diffs: budget used up, the remaining phases are skipped
+            return rc
+
+        # Phase 2: Compare Tables/Views
+        self.logit(INFO, "PHASE 2: Comparing Tables/Views...")
+        rc = self.TimedPhase(self.CompareTablesViews)
+        if rc == RC_ERR:
+            # error has already been logged
+            self.logit(INFO, 'CompareTablesViews() Errror.')
+            return RC_ERR
+        if rc == RC_DIFF:
+            return rc
+
+        # Phase 3: Compare Columns
+        if self.IgnoreColumns:
+            self.logit(INFO, 'PHASE 4: Bypassing Column comparison...')
+            self.Echo()
+        else:
+            self.logit(INFO, "PHASE 3: Comparing Columns...")
+            rc = self.TimedPhase(self.CompareColumns)
+            if rc == RC_ERR:
+                # error has already been logged
+                self.logit(INFO, 'CompareColumns() Errror.')
+                return RC_ERR
+            if rc == RC_DIFF:
+                return rc
+
+        # Phase 4: Compare Key/Indexes
+        if self.IgnoreIndexes:
+            self.logit(INFO, 'PHASE 4: Bypassing Index comparison...')
+            self.Echo()
+        else:
+            self.logit(INFO, "PHASE 4: Comparing Constraints/Indexes...")
+            rc = self.TimedPhase(self.CompareKeysIndexes)
+            if rc == RC_ERR:
+                # error has already been logged
+                self.logit(INFO, 'CompareKeysIndexes Errror.')
+                return RC_ERR
+            if rc == RC_DIFF:
+                return rc
+
+        # Phase 5: Compare Funcs/Procs
+        if self.IgnoreFuncs:
+            self.logit(INFO, 'PHASE 5: Bypassing Func/Proc comparison...')
+            self.Echo()
+        else:
+            if self.pg_version_numS < 110000 or self.pg_version_numT < 110000:
+                self.logit(WARN, 'PHASE 5: Bypassing Func/Proc comparison due to incompatible PG Version, v10...')    
+                self.Echo()
+            else:    
+                self.logit(INFO, "PHASE 5: Comparing Funcs/Procs...")
+                rc = self.TimedPhase(self.CompareFuncsProcs)
+                if rc == RC_ERR:
+                    # error has already been logged
+                    self.logit(INFO, 'CompareFuncsProcs Errror.')
+                    return RC_ERR
+                if rc == RC_DIFF:
+                    return rc
+
+        # Phase 6: Compare Row Counts
+        if self.IgnoreRowCounts:
+            self.logit(INFO, 'PHASE 6: Bypassing Row Count comparison...')
+            self.Echo()
+        else:
+            self.logit(INFO, "PHASE 6: Comparing Row Counts...")
+            if self.scantype == 'simplescan':
+                self.logit(INFO, "PHASE 6: Comparing Row Counts...")
+                self.logit(WARN, '*** SimpleScan: Row Counts are statistically computed so make sure you run ANALYZE beforehand. ***')
+            elif self.scantype == 'samplescan':
+                self.logit(INFO, "PHASE 6: Estimating Row Counts from a %s%% page sample..." % self.samplepct)
+            else:
+                self.logit(INFO, "PHASE 6: Comparing Row Counts. This may take a long time...")
+            rc = self.TimedPhase(self.CompareRowCounts)
+            if rc == RC_ERR:
+                # error has already been logged
+                self.logit(INFO, 'CompareRowCounts() Errror.')
+                return RC_ERR
+            if rc == RC_DIFF:
+                return rc
+
+        # Phase 7: Compare Table Checksums
+        if self.Checksums:
+            self.logit(INFO, "PHASE 7: Comparing Table Checksums. This may take a long time...")
+            rc = self.TimedPhase(self.CompareChecksums)
+            if rc == RC_ERR:
+                # error has already been logged
+                self.logit(INFO, 'CompareChecksums() Errror.')
+                return RC_ERR
+            if rc == RC_DIFF:
+                return rc
+
+        # Incremental mode: record markers and rows for the next run, only after a complete run
+        if self.Incremental != '':
+            self.SaveIncrementalState()
+        return RC_OK
+
+    def TimedPhase(self, method):
+        # run one Compare* phase, keeping its wall time for --timings and, with --profile, its CPU time and peak traced memory.
+        # Both are process wide: the query worker threads fetching for later phases count too.
+        self.currentphase = method.__name__
+        if self.profiler is not None and tracemalloc is not None and hasattr(tracemalloc, 'reset_peak'):
+            # python 3.9+: the peak of this phase alone, older versions report the peak so far
+            tracemalloc.reset_peak()
+        started = time.time()
+        cpustarted = process_time()
+        rc = method()
+        secs = time.time() - started
+        self.phasetimes.append((method.__name__, secs))
+        if self.stopped.is_set():
+            rc = RC_DIFF
+        if self.profiler is not None:
+            peakkb = tracemalloc.get_traced_memory()[1] // 1024 if tracemalloc is not None and tracemalloc.is_tracing() else None
+            self.profiler.phases.append({'phase': method.__name__, 'wall_secs': secs, 'cpu_secs': process_time() - cpustarted, 'peak_mem_kb': peakkb})
+        self.currentphase = 'Setup'
+        return rc
+
+    def WriteTimings(self, secs, runs=None):
+        # --timings: one json document per run with the phase wall times and the peak RSS of this process.
+        # In fan-out and multi-schema mode (runs: the maint of every target or schema pair) the phases and diffs are listed per pair.
+        peakrss = None
+        if resource is not None:
+            peakrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform == 'darwin':
+                # bytes there, kilobytes on linux
+                peakrss = peakrss // 1024
+        def pair(run):
+            return {'source': {'host': run.Shost, 'db': run.Sdb, 'schema': run.Sschema}, 'target': {'host': run.Thost, 'db': run.Tdb, 'schema': run.Tschema},
+                    'phases': [{'phase': name, 'secs': round(phsecs, 3)} for name, phsecs in run.phasetimes],
+                    'ddldiffs': run.ddldiffs, 'rowcntdiffs': run.rowcntdiffs, 'datadiffs': run.datadiffs}
+        timings = {'program': '%s %.1f' % (PROGNAME, VERSION), 'scantype': self.scantype, 'workers': self.workers, 'total_secs': round(secs, 3), 'peak_rss_kb': peakrss}
+        if runs is None:
+            timings.update(pair(self))
+        else:
+            timings['pairs'] = []
+            for run in runs:
+                timings['pairs'].append(pair(run))
+                timings['pairs'][-1]['total_secs'] = round(run.runsecs, 3)
+            # multi-schema: this maint holds the totals, schemas missing on one side included; fan-out: the targets hold them
+            for counter in ('ddldiffs', 'rowcntdiffs', 'datadiffs'):
+                timings[counter] = getattr(self, counter) if self.multischema else sum([getattr(run, counter) for run in runs])
+        try:
+            f = open(self.Timings, 'w')
+            f.write(json.dumps(timings, indent=1))
+            f.close()
+        except Exception as error:
+            msg="Timings Write Error %s *** %s" % (type(error), error)
+            self.logit(ERR, msg)
+            return RC_ERR
+        return RC_OK
+
+    def WriteMetrics(self, secs, runs=None):
+        # --metrics: an OpenMetrics textfile for the node exporter textfile collector, only written after a successful run,
+        # so last_success_timestamp_seconds keeps the time of the last good run when a later one fails.
+        # In fan-out and multi-schema mode runs holds the maint of every target or schema pair, each with its own samples.
+        # Queries run once for all of them (the fan-out source extract, the multi-schema catalog queries) are labeled
+        # with what the pairs have in common and empty values for the rest.
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        def labels(values):
+            return 'source_host="%s",source_db="%s",source_schema="%s",target_host="%s",target_db="%s",target_schema="%s"' % tuple([escape(x) for x in values])
+        def querycounts(queries):
+            counts = {}
+            for q in queries:
+                key = (q['phase'], 'source' if q['side'] == 'S' else 'target')
+                count = counts.setdefault(key, [0, 0])
+                count[0] += 1
+                count[1] += q['rows']
+            return sorted(counts.items())
+
+        if runs is None:
+            self.runsecs = secs
+            runs, shared = [self], []
+        elif self.multischema:
+            shared = [(labels((self.Shost, self.Sdb, '', self.Thost, self.Tdb, '')), self.profiler.queries)]
+        else:
+            # fan-out: this maint only queried the source, every target its own side
+            shared = [(labels((self.Shost, self.Sdb, self.Sschema, '', '', '')), [q for q in self.profiler.queries if q['side'] == 'S'])]
+        pairs = [(labels((r.Shost, r.Sdb, r.Sschema, r.Thost, r.Tdb, r.Tschema)), r) for r in runs]
+        querysets = shared + [(base, r.profiler.queries) for base, r in pairs if r.profiler is not self.profiler or not shared]
+        queries = [(base, key, count) for base, records in querysets for key, count in querycounts(records)]
+        diffs = [(base, r.ddldiffs, r.rowcntdiffs, r.datadiffs, r.diffcounts) for base, r in pairs]
+        if self.multischema and shared:
+            # multi-schema: the schemas found on one side only are the diffs of this maint itself
+            diffs.append((shared[0][0], self.ddldiffs - sum([r.ddldiffs for r in runs]), 0, 0, self.diffcounts))
+
+        # (name, help, [(labels, extra labels, value)])
+        metrics = [('pg_match_run_duration_seconds', 'Wall time of the run.', [(base, '', r.runsecs) for base, r in pairs]),
+                   ('pg_match_phase_duration_seconds', 'Wall time of each phase.', [(base, 'phase="%s"' % name, phsecs) for base, r in pairs for name, phsecs in r.phasetimes]),
+                   ('pg_match_queries', 'Queries executed per phase and side.', [(base, 'phase="%s",side="%s"' % key, count[0]) for base, key, count in queries]),
+                   ('pg_match_rows_fetched', 'Rows fetched per phase and side.', [(base, 'phase="%s",side="%s"' % key, count[1]) for base, key, count in queries]),
+                   ('pg_match_ddl_diffs', 'DDL differences found.', [(d[0], '', d[1]) for d in diffs]),
+                   ('pg_match_rowcnt_diffs', 'Row count differences found.', [(d[0], '', d[2]) for d in diffs]),
+                   ('pg_match_data_diffs', 'Checksum differences found.', [(d[0], '', d[3]) for d in diffs]),
+                   ('pg_match_diffs', 'Differences reported per diff category.',
+                    [(d[0], 'category="%s"' % escape(category), n) for d in diffs for category, n in sorted(d[4].items())])]
+        if self.scantype == 'detailedscan':
+            rates = []
+            for base, r in pairs:
+                rowcountsecs = sum([phsecs for name, phsecs in r.phasetimes if name == 'CompareRowCounts'])
+                if rowcountsecs > 0:
+                    rates.append((base, '', r.countedtables / rowcountsecs))
+            if rates:
+                metrics.append(('pg_match_detailedscan_tables_per_second', 'Tables counted per second by the DetailedScan real counts.', rates))
+        metrics.append(('pg_match_last_success_timestamp_seconds', 'Unix time the last successful run finished.', [(base, '', time.time()) for base, r in pairs]))
+
+        lines = []
+        for name, helptext, samples in metrics:
+            lines.append('# HELP %s %s' % (name, helptext))
+            lines.append('# TYPE %s gauge' % name)
+            for base, extra, value in samples:
+                lines.append('%s{%s} %s' % (name, base + (',' + extra if extra else ''), repr(float(value)) if isinstance(value, float) else value))
+        lines.append('# EOF')
+
+        # written aside and renamed, so the collector never reads a half written file
+        try:
+            f = open(self.Metrics + '.tmp', 'w')
+            f.write('\n'.join(lines) + '\n')
+            f.close()
+            getattr(os, 'replace', os.rename)(self.Metrics + '.tmp', self.Metrics)
+        except Exception as error:
+            msg="Metrics Write Error %s *** %s" % (type(error), error)
+            self.logit(ERR, msg)
+            return RC_ERR
+        return RC_OK
+
+    #################################################################
+    # Profiling (--profile): every query with its server and fetch  #
+    # time, rows and bytes, every phase with its wall and CPU time  #
+    # and peak memory, ranked at exit.                              #
+    #################################################################
+    def RowBytes(self, rows):
+        # the text size of the returned values, close to what came over the wire
+        nbytes = 0
+        for arow in rows:
+            for value in arow:
+                if value is not None:
+                    nbytes = nbytes + len(value if isinstance(value, (str, type(u''))) else str(value))
+        return nbytes
+
+    def ProfileQuery(self, name, side, sql, phase, serversecs, fetchsecs, nrows, nbytes):
+        # catalog queries count toward the phase that diffs them, whenever they ran
+        catalog = [PHASE_METHODS[q[1]] for q in CATALOG_QUERIES if q[0] == name]
+        # literals replaced, like pg_stat_statements: runs of the same query text with other values share a fingerprint
+        normalized = re.sub(r"\s+", ' ', re.sub(r"\b\d+\b", '?', re.sub(r"'(?:[^']|'')*'", '?', sql))).strip()
+        fingerprint = hashlib.md5(normalized if isinstance(normalized, bytes) else normalized.encode('utf-8')).hexdigest()[:12]
+        self.profiler.queries.append({'phase': catalog[0] if catalog else (phase or self.currentphase), 'side': side, 'name': name,
+                                      'fingerprint': fingerprint, 'sql': normalized[:200], 'server_secs': serversecs, 'fetch_secs': fetchsecs,
+                                      'rows': nrows, 'bytes': nbytes})
+
+    def ProfileReport(self):
+        # the phases and the slowest queries ranked by time, then the optional json file with every record
+        phases  = sorted(self.profiler.phases, key=lambda p: p['wall_secs'], reverse=True)
+        queries = sorted(self.profiler.queries, key=lambda q: q['server_secs'] + q['fetch_secs'], reverse=True)
+        self.logit(INFO, "========== Profile: %d phases by wall time ==========" % len(phases))
+        self.logit(INFO, "%-22s %10s %10s %12s" % ('Phase', 'Wall secs', 'CPU secs', 'Peak mem KB'))
+        for p in phases:
+            peak = '%12d' % p['peak_mem_kb'] if p['peak_mem_kb'] is not None else '%12s' % 'n/a'
+            self.logit(INFO, "%-22s %10.3f %10.3f %s" % (p['phase'], p['wall_secs'], p['cpu_secs'], peak))
+        self.logit(INFO, "========== Profile: slowest %d of %d queries ==========" % (min(PROFILETOP, len(queries)), len(queries)))
+        self.logit(INFO, "%-22s %-4s %-14s %-12s %10s %10s %9s %12s" % ('Phase', 'Side', 'Query', 'Fingerprint', 'Server', 'Fetch', 'Rows', 'Bytes'))
+        for q in queries[:PROFILETOP]:
+            self.logit(INFO, "%-22s %-4s %-14s %-12s %10.3f %10.3f %9d %12d" % (q['phase'], q['side'], q['name'], q['fingerprint'],
+                                                                                q['server_secs'], q['fetch_secs'], q['rows'], q['bytes']))
+        if self.ProfileJson == '':
+            return RC_OK
+
+        for record in self.profiler.phases + self.profiler.queries:
+            for key in record:
+                if key.endswith('_secs'):
+                    record[key] = round(record[key], 6)
+        profile = {'program': '%s %.1f' % (PROGNAME, VERSION), 'scantype': self.scantype, 'workers': self.workers,
+                   'phases': self.profiler.phases, 'queries': queries}
+        try:
+            f = open(self.ProfileJson, 'w')
+            f.write(json.dumps(profile, indent=1))
+            f.close()
+        except Exception as error:
+            msg="Profile Write Error %s *** %s" % (type(error), error)
+            self.logit(ERR, msg)
+            return RC_ERR
+        return RC_OK
+
+    def Summary(self, secs):
+        if self.ddldiffs == 0 and self.rowcntdiffs == 0 and self.datadiffs == 0:
+            self.logit(INFO,"Summary (%d seconds): No differences found." % secs)
+        elif self.Checksums:
+            self.logit(INFO,"Summary (%d seconds): Differences found: ddl (%d)  rowcnts (%d)  data (%d)" % (secs, self.ddldiffs, self.rowcntdiffs, self.datadiffs))
+        else:
+            self.logit(INFO,"Summary (%d seconds): Differences found: ddl (%d)  rowcnts (%d)" % (secs, self.ddldiffs, self.rowcntdiffs))
+
 
 def setupOptionParser():
     parser = OptionParser(add_help_option=False,   description=DESCRIPTION)
@@ -1659,7 +2969,7 @@ def setupOptionParser():
     parser.add_option("-d", "--Tdb",       dest="tdb",       help="Target database", default="",metavar="TARGETDB")
     parser.add_option("-s", "--Tschema",   dest="tschema",   help="Target schema",   default="",metavar="TARGETSCHEMA")    
 
-    parser.add_option("-t", "--scantype", dest="scantype",   help="scantype [SimpleScan | DetailedScan]", default="",metavar="SCANTYPE")
+    parser.add_option("-t", "--scantype", dest="scantype",   help="scantype [SimpleScan | DetailedScan | SampleScan]", default="",metavar="SCANTYPE")
     parser.add_option("-l", "--log",      dest="logging",    help="log diffs to output file",default=False, action="store_true")
     parser.add_option("-v", "--verbose", dest="verbose",     help="Verbose Output",default=False, action="store_true")
     
@@ -1667,6 +2977,30 @@ def setupOptionParser():
     parser.add_option("-i", "--ignore_indexes",   dest="ignore_indexes",    help="Ignore index diffs",default=False, action="store_true")
     parser.add_option("-f", "--ignore_funcs",     dest="ignore_funcs",      help="Ignore func/proc diffs",default=False, action="store_true")
     parser.add_option("-c", "--ignore_columns",   dest="ignore_columns",    help="Ignore column diffs",default=False, action="store_true")
+    parser.add_option("-k", "--checksums",        dest="checksums",         help="Compare table contents by checksum (Phase 7)",default=False, action="store_true")
+    parser.add_option("-a", "--sample_pct",       dest="samplepct",         help="SampleScan: percentage of table pages to sample (default 1)",default=1.0, type=float)
+    parser.add_option("-n", "--snapshot",         dest="snapshot",          help="Read each side from one exported snapshot shared by all its connections",default=False, action="store_true")
+    parser.add_option("-C", "--nocache",          dest="nocache",           help="Bypass the local catalog cache (%s)" % CACHEFILE,default=False, action="store_true")
+    parser.add_option("-M", "--cache_mb",         dest="cachemb",           help="Catalog cache size limit in MB (default %d)" % CACHEMB,default=CACHEMB, type=int)
+    parser.add_option("-E", "--export",           dest="export",            help="Write the target schema to a snapshot file instead of comparing",default="",metavar="FILE")
+    parser.add_option("-T", "--Tsnapshot",        dest="tsnapshot",         help="Compare the source against a target schema snapshot file",default="",metavar="FILE")
+    parser.add_option("-I", "--incremental",      dest="incremental",       help="State file for incremental runs: only objects changed since the last run are fetched again",default="",metavar="FILE")
+    parser.add_option("-F", "--targets",          dest="targets",           help="Compare the source against every target in FILE (one 'host=.. port=.. user=.. dbname=.. schema=..' per line)",default="",metavar="FILE")
+    parser.add_option("-A", "--all_schemas",      dest="all_schemas",       help="Compare every schema of the source database with the target schema of the same name",default=False, action="store_true")
+    parser.add_option("-G", "--schema_map",       dest="schema_map",        help="Compare the schema pairs listed in FILE (one '<source schema> <target schema>' per line)",default="",metavar="FILE")
+    parser.add_option("-L", "--pipeline",         dest="pipeline",          help="Send each side's catalog queries in one libpq pipeline (needs psycopg 3)",default=False, action="store_true")
+    parser.add_option("-J", "--json_catalog",     dest="jsoncatalog",       help="Fetch each side's catalog as one server-built json document in a single round trip",default=False, action="store_true")
+    parser.add_option("-m", "--stream",           dest="itersize",          help="Stream the column diff through server-side cursors, ITERSIZE rows per fetch (default 0: off)",default=0,metavar="ITERSIZE", type=int)
+    parser.add_option("-K", "--info_schema",      dest="infoschema",        help="Read columns, views, constraint columns, identities and triggers from information_schema instead of pg_catalog",default=False, action="store_true")
+    parser.add_option("-W", "--timings",          dest="timings",           help="Write per-phase wall times and peak RSS of the run to FILE as json",default="",metavar="FILE")
+    parser.add_option("-O", "--profile",          dest="profile",           help="Profile every query and phase, and list the slowest ones at exit",default=False, action="store_true")
+    parser.add_option("-Q", "--profile_json",     dest="profilejson",       help="With --profile, also write every query and phase record to FILE as json",default="",metavar="FILE")
+    parser.add_option("-X", "--metrics",          dest="metrics",           help="Write drift and runtime metrics of a successful run to FILE in the OpenMetrics text format",default="",metavar="FILE")
+    parser.add_option("-N", "--ndjson",           dest="ndjson",            help="Also write every difference to FILE as one json record per line",default="",metavar="FILE")
+    parser.add_option("-B", "--max_diffs",        dest="maxdiffs",          help="Stop after N differences (1: fail fast), cancel the running queries and exit with return code %d (default 0: off)" % RC_DIFF,default=0,metavar="N", type=int)
+    parser.add_option("-R", "--count_timeout",    dest="counttimeout",      help="DetailedScan: seconds a table count may run before its estimate is used instead (default 0: no limit)",default=0,metavar="SECS", type=int)
+    parser.add_option("-V", "--partitions",       dest="partitions",        help="Compare the row counts of partitioned tables per parent, rolled up from their leaf partitions",default=False, action="store_true")
+    parser.add_option("-w", "--workers",          dest="workers",           help="Connections per side for concurrent queries and DetailedScan counts (default 2)",default=2, type=int)
     parser.add_option("-x", "--print_help",       dest="print_help",        help="Print Help",default=False, action="store_true")
     
     return parser
@@ -1709,35 +3043,109 @@ pg.IgnoreIndexes     = options.ignore_indexes
 pg.IgnoreFuncs       = options.ignore_funcs
 pg.IgnoreColumns     = options.ignore_columns
 pg.PrintHelp         = options.print_help
+pg.workers           = options.workers
+pg.Checksums         = options.checksums
+pg.Partitions        = options.partitions
+pg.samplepct         = options.samplepct
+pg.snapshot          = options.snapshot
+pg.NoCache           = options.nocache
+pg.cachemb           = options.cachemb
+pg.Export            = options.export
+pg.Tsnapshot         = options.tsnapshot
+pg.Incremental       = options.incremental
+pg.Targets           = options.targets
+pg.AllSchemas        = options.all_schemas
+pg.SchemaMap         = options.schema_map
+pg.multischema       = pg.AllSchemas or pg.SchemaMap != ''
+pg.pipeline          = options.pipeline
+pg.jsoncatalog       = options.jsoncatalog
+pg.itersize          = options.itersize
+pg.InfoSchema        = options.infoschema
+pg.Timings           = options.timings
+pg.ProfileJson       = options.profilejson
+pg.Profile           = options.profile or pg.ProfileJson != ''
+pg.Metrics           = options.metrics
+pg.maxdiffs          = options.maxdiffs
+pg.counttimeout      = options.counttimeout
+if pg.Profile or pg.Metrics != '':
+    # --metrics takes its query counts and rows fetched from the profile records
+    pg.profiler = profiledata()
+if pg.Profile and tracemalloc is not None:
+    tracemalloc.start()
+if options.ndjson != '':
+    try:
+        pg.ndjson = ndjsonwriter(open(options.ndjson, 'w'), NDJSONBATCH)
+    except Exception as error:
+        print ('NDJSON file error %s *** %s' % (type(error), error))
+        sys.exit(FAIL)
+if pg.pipeline and psycopg is None:
+    print ('psycopg 3 is not installed: --pipeline ignored, catalog queries use the psycopg2 connections.')
+    pg.pipeline = False
 
 if pg.PrintHelp:
   optionParser.print_help()
   sys.exit(SUCCESS)
 
-# check parms
-if pg.Suser == '':
+# check parms: export mode only reads the target, --Tsnapshot replaces the target
+if pg.Export != '' and pg.Tsnapshot != '':
+     print ('Export and Tsnapshot are mutually exclusive.')
+     sys.exit(FAIL)    
+elif pg.Suser == '' and pg.Export == '':
      print ('Source DBuser not provided.')
      sys.exit(FAIL)    
-elif pg.Tuser == '':
+elif pg.Tuser == '' and pg.Tsnapshot == '' and pg.Targets == '':
      print ('Target DBuser not provided.')
      sys.exit(FAIL)    
-elif pg.Sdb == '':
+elif pg.Sdb == '' and pg.Export == '':
      print ('Source DB not provided.')
      sys.exit(FAIL)    
-elif pg.Tdb == '':
+elif pg.Tdb == '' and pg.Tsnapshot == '' and pg.Targets == '':
      print ('Target DB not provided.')
      sys.exit(FAIL)    
-elif pg.Sschema == '':     
+elif pg.Sschema == '' and pg.Export == '' and not pg.multischema:     
      print ('Source schema not provided.')
      sys.exit(FAIL)         
-elif pg.Tschema == '':     
+elif pg.Tschema == '' and pg.Tsnapshot == '' and pg.Targets == '' and not pg.multischema:     
      print ('Target schema not provided.')
      sys.exit(FAIL)              
-elif pg.scantype != 'simplescan' and pg.scantype != 'detailedscan':     
-     print ('Scantype invalid: %s.  Must be "SimpleScan" or "DetailedScan"' % pg.scantype)
+elif pg.Tsnapshot != '' and (pg.scantype != 'simplescan' or pg.Checksums):
+     print ('A target schema snapshot only holds row estimates: use SimpleScan without checksums.')
+     sys.exit(FAIL)              
+elif pg.Partitions and (pg.scantype == 'samplescan' or pg.Tsnapshot != ''):
+     print ('Partitions needs the catalog of both sides and does not apply to SampleScan.')
+     sys.exit(FAIL)              
+elif pg.AllSchemas and pg.SchemaMap != '':
+     print ('All_schemas and schema_map are mutually exclusive.')
+     sys.exit(FAIL)              
+elif pg.multischema and (pg.Targets != '' or pg.Export != '' or pg.Tsnapshot != '' or pg.Incremental != ''):
+     print ('Multi-schema mode cannot be combined with Targets, Export, Tsnapshot or Incremental.')
+     sys.exit(FAIL)              
+elif pg.Targets != '' and asyncio is None:
+     print ('Fan-out mode (targets file) requires Python 3.')
+     sys.exit(FAIL)              
+elif pg.Targets != '' and (pg.Export != '' or pg.Tsnapshot != '' or pg.Incremental != ''):
+     print ('A targets file cannot be combined with Export, Tsnapshot or Incremental.')
+     sys.exit(FAIL)              
+elif pg.Targets != '' and (pg.scantype != 'simplescan' or pg.Checksums):
+     print ('Fan-out mode extracts the source once: use SimpleScan without checksums.')
+     sys.exit(FAIL)              
+elif pg.scantype not in ('simplescan', 'detailedscan', 'samplescan') and pg.Export == '':
+     print ('Scantype invalid: %s.  Must be "SimpleScan", "DetailedScan" or "SampleScan"' % pg.scantype)
+     sys.exit(FAIL)              
+elif pg.samplepct <= 0 or pg.samplepct > 100:
+     print ('Sample percentage invalid: %s.  Must be greater than 0 and at most 100' % pg.samplepct)
+     sys.exit(FAIL)              
+elif pg.maxdiffs < 0:
+     print ('Max diffs invalid: %d.  Must be 0 (off) or more' % pg.maxdiffs)
+     sys.exit(FAIL)              
+elif pg.counttimeout < 0:
+     print ('Count timeout invalid: %d.  Must be 0 (no limit) or more seconds' % pg.counttimeout)
+     sys.exit(FAIL)              
+elif pg.workers < 1:
+     print ('Workers invalid: %d.  Must be at least 1' % pg.workers)
      sys.exit(FAIL)              
 
-print ('%s  Version %.1f  %s  Compare in progress...' % (PROGNAME, VERSION, ADATE))
+print ('%s  Version %.1f  %s  %s in progress...' % (PROGNAME, VERSION, ADATE, 'Export' if pg.Export != '' else 'Compare'))
      
      
 # capture database warnings like data truncated warnings 
@@ -1748,107 +3156,90 @@ print ('%s  Version %.1f  %s  Compare in progress...' % (PROGNAME, VERSION, ADAT
 now = datetime.datetime.now().strftime("%Y_%m_%d")
 pg.logit(INFO,"--------- program start ----------")
 
+# Fan-out mode: the targets come from the targets file, this run only connects to the source
+if pg.Targets != '':
+    targets = pg.LoadTargets()
+    if targets is None:
+        pg.CloseStuff()
+        sys.exit(FAIL)
+    pg.fanout = True
+
 # get connection handles to source and target schemas
 rc = pg.ConnectAll() 
 if rc == RC_ERR:
     # error has already been logged
     pg.logit(INFO, 'Program ended with error(s).')
-    pg.CloseStuff()
+    pg.CloseStuff(rc)
     sys.exit(FAIL)
 
 #pg.logit(INFO, "connected to source and target databases successfully.")
 
-# Phase 1: Compare object counts
-pg.logit(INFO, "PHASE 1: Comparing Object Counts...")
-rc = pg.CompareObjects()
-if rc == RC_ERR:
-    # error has already been logged
-    pg.logit(INFO, 'CompareObjects() Errror.')
+# Multi-schema mode: every mapped schema pair of the two databases, one catalog pull per side
+if pg.multischema:
+    rc = pg.CompareSchemas()
+    if rc == RC_ERR:
+        # error has already been logged
+        pg.CloseStuff(rc)
+        sys.exit(FAIL)
+    secs = (datetime.datetime.utcnow() - dt_started).total_seconds()
+    pg.Summary(round(secs))
+    if pg.Timings != '':
+        pg.WriteTimings(secs, pg.runs)
+    if pg.Metrics != '':
+        pg.WriteMetrics(secs, pg.runs)
+    if pg.Profile:
+        pg.ProfileReport()
+    pg.logit(INFO,"--------- program end   ----------")
     pg.CloseStuff()
-    sys.exit(FAIL)
-
-# Phase 2: Compare Tables/Views
-pg.logit(INFO, "PHASE 2: Comparing Tables/Views...")
-rc = pg.CompareTablesViews()
+    sys.exit(RC_DIFF if rc == RC_DIFF else SUCCESS)
+
+# queue up the catalog queries for all enabled phases; each phase below diffs as soon as its own results are in
+pg.Prefetch()
+
+# Fan-out mode: compare the extracted source against every target in the targets file
+if pg.Targets != '':
+    rc = pg.FanOut(targets)
+    secs = (datetime.datetime.utcnow() - dt_started).total_seconds()
+    if pg.Timings != '' and rc in (RC_OK, RC_DIFF):
+        pg.WriteTimings(secs, pg.runs)
+    if pg.Metrics != '' and rc in (RC_OK, RC_DIFF):
+        pg.WriteMetrics(secs, pg.runs)
+    if pg.Profile:
+        pg.ProfileReport()
+    pg.logit(INFO,"--------- program end   ----------")
+    pg.CloseStuff(rc)
+    sys.exit(SUCCESS if rc == RC_OK else (RC_DIFF if rc == RC_DIFF else FAIL))
+
+# Export mode: write the target side to a schema snapshot file, nothing to compare
+if pg.Export != '':
+    rc = pg.WriteSchemaSnapshot()
+    if pg.Profile:
+        pg.ProfileReport()
+    pg.logit(INFO,"--------- program end   ----------")
+    pg.CloseStuff(rc)
+    sys.exit(SUCCESS if rc == RC_OK else FAIL)
+
+rc = pg.RunPhases()
 if rc == RC_ERR:
     # error has already been logged
-    pg.logit(INFO, 'CompareTablesViews() Errror.')
-    pg.CloseStuff()
+    pg.CloseStuff(rc)
     sys.exit(FAIL)
 
-# Phase 3: Compare Columns
-if pg.IgnoreColumns:
-    pg.logit(INFO, 'PHASE 4: Bypassing Column comparison...')
-    print('')
-else:
-    pg.logit(INFO, "PHASE 3: Comparing Columns...")
-    rc = pg.CompareColumns()
-    if rc == RC_ERR:
-        # error has already been logged
-        pg.logit(INFO, 'CompareColumns() Errror.')
-        pg.CloseStuff()
-        sys.exit(FAIL)    
-
-# Phase 4: Compare Key/Indexes
-if pg.IgnoreIndexes:
-    pg.logit(INFO, 'PHASE 4: Bypassing Index comparison...')
-    print('')
-else:
-    pg.logit(INFO, "PHASE 4: Comparing Constraints/Indexes...")
-    rc = pg.CompareKeysIndexes()
-    if rc == RC_ERR:
-        # error has already been logged
-        pg.logit(INFO, 'CompareKeysIndexes Errror.')
-        pg.CloseStuff()
-        sys.exit(FAIL)    
-
-# Phase 5: Compare Funcs/Procs
-if pg.IgnoreFuncs:
-    pg.logit(INFO, 'PHASE 5: Bypassing Func/Proc comparison...')
-    print('')
-else:
-    if pg.pg_version_numS < 110000 or pg.pg_version_numT < 110000:
-        pg.logit(WARN, 'PHASE 5: Bypassing Func/Proc comparison due to incompatible PG Version, v10...')    
-        print('')
-    else:    
-        pg.logit(INFO, "PHASE 5: Comparing Funcs/Procs...")
-        rc = pg.CompareFuncsProcs()
-        if rc == RC_ERR:
-            # error has already been logged
-            pg.logit(INFO, 'CompareFuncsProcs Errror.')
-            pg.CloseStuff()
-            sys.exit(FAIL)    
-
-# Phase 6: Compare Row Counts
-if pg.IgnoreRowCounts:
-    pg.logit(INFO, 'PHASE 6: Bypassing Row Count comparison...')
-    print('')
-else:
-    pg.logit(INFO, "PHASE 6: Comparing Row Counts...")
-    if pg.scantype == 'simplescan':
-        pg.logit(INFO, "PHASE 6: Comparing Row Counts...")
-        pg.logit(WARN, '*** SimpleScan: Row Counts are statistically computed so make sure you run ANALYZE beforehand. ***')
-    else:
-        pg.logit(INFO, "PHASE 6: Comparing Row Counts. This may take a long time...")
-    rc = pg.CompareRowCounts()
-    if rc == RC_ERR:
-        # error has already been logged
-        pg.logit(INFO, 'CompareRowCounts() Errror.')
-        pg.CloseStuff()
-        sys.exit(FAIL)    
-
 dt_ended = datetime.datetime.utcnow()
 secs = round((dt_ended - dt_started).total_seconds())
-
-if pg.ddldiffs == 0 and pg.rowcntdiffs == 0:
-    pg.logit(INFO,"Summary (%d seconds): No differences found." % secs)
-else:
-    pg.logit(INFO,"Summary (%d seconds): Differences found: ddl (%d)  rowcnts (%d)" % (secs, pg.ddldiffs, pg.rowcntdiffs))
+pg.Summary(secs)
+if pg.Timings != '':
+    pg.WriteTimings((dt_ended - dt_started).total_seconds())
+if pg.Metrics != '':
+    pg.WriteMetrics((dt_ended - dt_started).total_seconds())
+if pg.Profile:
+    pg.ProfileReport()
 
 pg.logit(INFO,"--------- program end   ----------")
 pg.CloseStuff()
 
-sys.exit(SUCCESS)
+# --max_diffs: a run stopped by the diff budget has its own exit code
+sys.exit(RC_DIFF if rc == RC_DIFF else SUCCESS)
 
 ''' 
 following is stuff to get other DDL stuff to compare
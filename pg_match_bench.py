@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+from __future__ import print_function
+##########################################################################################
+# File Name: pg_match_bench.py
+# Description:
+# Benchmarks for pg_match.py.
+# latency:  measures what --pipeline saves on a slow link.  Both sides of a pg_match.py run are pointed at a local
+#           TCP proxy that delays every chunk by half the requested round trip in each direction, then the same
+#           comparison is timed with and without --pipeline.
+# backends: generates two schemas of --tables tables each and times the same comparison with the pg_catalog
+#           backend and with --info_schema.  The generated schemas are dropped afterwards unless --keep is given.
+# scale:    for every table count in --scales, generates source and target schemas with columns, indexes, constraints,
+#           partitions, functions and comments, with --diff_pct percent of the target tables changed, runs one
+#           comparison with --timings and appends the phase times and peak RSS as one json line to --output.
+#           The run fails if pg_match.py does not report every injected difference.
+#
+# usage:
+# pg_match_bench.py -H localhost -P 5432 -U postgres -D clone_testing -S sample -s sample_clone1 --rtt 70 --runs 3
+# pg_match_bench.py -H localhost -P 5432 -U postgres -D clone_testing --mode backends --tables 10000
+# pg_match_bench.py -H localhost -P 5432 -U postgres -D clone_testing --mode scale --scales 1000,10000,50000 --columns 10 --diff_pct 1
+##########################################################################################
+import os, sys, socket, subprocess, threading, time
+from optparse import OptionParser
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class delayproxy():
+    # forwards localhost:<port> to host:port, delivering every chunk rtt/2 seconds after it was received
+    def __init__(self, host, port, rtt_ms):
+        self.host     = host
+        self.port     = port
+        self.delay    = rtt_ms / 2000.0
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(64)
+        self.localport = self.listener.getsockname()[1]
+
+    def Start(self):
+        t = threading.Thread(target=self.Accept)
+        t.daemon = True
+        t.start()
+
+    def Accept(self):
+        while True:
+            client, addr = self.listener.accept()
+            server = socket.create_connection((self.host, self.port))
+            # forward every chunk as it falls due: Nagle would hold small ones back until the previous one is acked
+            for sock in (client, server):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for src, dst in ((client, server), (server, client)):
+                pending = queue.Queue()
+                for target, args in ((self.Reader, (src, pending)), (self.Writer, (dst, pending))):
+                    t = threading.Thread(target=target, args=args)
+                    t.daemon = True
+                    t.start()
+
+    def Reader(self, src, pending):
+        while True:
+            try:
+                chunk = src.recv(65536)
+            except socket.error:
+                chunk = b''
+            pending.put((time.time() + self.delay, chunk))
+            if not chunk:
+                return
+
+    def Writer(self, dst, pending):
+        while True:
+            due, chunk = pending.get()
+            wait = due - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            if not chunk:
+                try:
+                    dst.shutdown(socket.SHUT_WR)
+                except socket.error:
+                    pass
+                return
+            try:
+                dst.sendall(chunk)
+            except socket.error:
+                return
+
+
+def RunMatch(options, host, port, extra):
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pg_match.py'),
+           '-t', 'simplescan', '-C',
+           '-H', host, '-P', str(port), '-U', options.user, '-D', options.db, '-S', options.sschema,
+           '-h', host, '-p', str(port), '-u', options.user, '-d', options.db, '-s', options.tschema] + extra
+    start = time.time()
+    rc = subprocess.call(cmd, stdout=open(os.devnull, 'w'))
+    return rc, time.time() - start
+
+
+def TimeModes(options, host, port, modes):
+    # modes: (label, extra pg_match.py args); returns the sorted run times per label
+    results = {}
+    for label, extra in modes:
+        times = []
+        for i in range(options.runs):
+            rc, secs = RunMatch(options, host, port, extra)
+            if rc not in (0, 4):
+                print ("pg_match.py failed (rc=%d) %s" % (rc, ' '.join(extra)))
+                sys.exit(1)
+            times.append(secs)
+        times.sort()
+        results[label] = times
+        print ("%-20s best %7.3fs  median %7.3fs" % (label, times[0], Median(times)))
+    return results
+
+
+def Median(times):
+    return times[len(times) // 2]
+
+
+def LatencyBench(options):
+    proxy = delayproxy(options.host, options.port, options.rtt)
+    proxy.Start()
+    print ("proxy 127.0.0.1:%d -> %s:%d  rtt=%.0fms  runs=%d" % (proxy.localport, options.host, options.port, options.rtt, options.runs))
+    results = TimeModes(options, '127.0.0.1', proxy.localport, (('psycopg2', []), ('pipeline', ['-L'])))
+    saved = Median(results['psycopg2']) - Median(results['pipeline'])
+    print ("saved %.3fs per run (%.1f round trips at %.0fms)" % (saved, saved * 1000.0 / options.rtt, options.rtt))
+
+
+def DropSchema(conn, aschema):
+    # tables and functions go 200 at a time, each batch committed, so no transaction locks a whole generated schema at once
+    cur = conn.cursor()
+    while True:
+        cur.execute("SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = %s "
+                    "AND c.relkind IN ('r', 'p') AND NOT c.relispartition LIMIT 200", (aschema,))
+        tables = [arow[0] for arow in cur.fetchall()]
+        if not tables:
+            break
+        cur.execute("DROP TABLE %s CASCADE" % ', '.join(['%s.%s' % (aschema, t) for t in tables]))
+        conn.commit()
+    while True:
+        cur.execute("SELECT p.oid::regprocedure::text FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace WHERE n.nspname = %s LIMIT 200", (aschema,))
+        funcs = [arow[0] for arow in cur.fetchall()]
+        if not funcs:
+            break
+        cur.execute("DROP FUNCTION %s" % ', '.join(funcs))
+        conn.commit()
+    cur.execute("DROP SCHEMA IF EXISTS %s CASCADE" % aschema)
+    conn.commit()
+    cur.close()
+
+
+def Analyze(conn):
+    # outside a transaction block ANALYZE commits after every table, so it holds one table's lock at a time
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        cur.execute("ANALYZE")
+        cur.close()
+    finally:
+        conn.autocommit = False
+
+
+def GenerateSchemas(conn, schemas, ntables):
+    # every table gets a primary key, a varchar with a default, a checked numeric and a timestamp; every 10th also a view.
+    # Committed every 500 tables so the locks taken stay well below max_locks_per_transaction.
+    cur = conn.cursor()
+    for aschema in schemas:
+        DropSchema(conn, aschema)
+        cur.execute("CREATE SCHEMA %s" % aschema)
+        conn.commit()
+        for first in range(1, ntables + 1, 500):
+            cur.execute("DO $$ BEGIN FOR i IN %d..%d LOOP "
+                        "EXECUTE format($f$CREATE TABLE %s.t%%s (id int PRIMARY KEY, name varchar(40) NOT NULL DEFAULT '', "
+                        "amount numeric(12,2) CHECK (amount >= 0), created timestamptz)$f$, i); "
+                        "IF i %% 10 = 0 THEN EXECUTE format($f$CREATE VIEW %s.v%%s AS SELECT id, name FROM %s.t%%s$f$, i, i); END IF; "
+                        "END LOOP; END $$" % (first, min(first + 499, ntables), aschema, aschema, aschema))
+            conn.commit()
+    cur.close()
+    Analyze(conn)
+
+
+def BackendsBench(options):
+    import psycopg2
+    conn = psycopg2.connect(host=options.host, port=options.port, user=options.user, dbname=options.db)
+    options.sschema, options.tschema = 'match_bench_s', 'match_bench_t'
+    try:
+        start = time.time()
+        GenerateSchemas(conn, (options.sschema, options.tschema), options.tables)
+        print ("generated %d tables in %s and %s in %.1fs  runs=%d" % (options.tables, options.sschema, options.tschema, time.time() - start, options.runs))
+        results = TimeModes(options, options.host, options.port, (('information_schema', ['-K']), ('pg_catalog', [])))
+    finally:
+        if not options.keep:
+            conn.rollback()
+            for aschema in (options.sschema, options.tschema):
+                DropSchema(conn, aschema)
+        conn.close()
+    print ("pg_catalog backend is %.1fx faster (median)" % (Median(results['information_schema']) / max(Median(results['pg_catalog']), 0.001)))
+
+
+# one DO block per chunk of tables.  Every table: a primary key, c1 with a default and a CHECK, an index on c1 and
+# ncols columns of mixed types; every 10th also a table and column comment and a function; every 50th also a
+# partitioned table with two partitions.  On the target every step-th table gets one of five injected differences.
+SCALE_DDL = """DO $$
+DECLARE
+    sch  text := '{schema}';
+    cols text;
+BEGIN
+    FOR i IN {first}..{last} LOOP
+        cols := '';
+        FOR j IN 2..{ncols} LOOP
+            cols := cols || format(', c%s %s', j, (ARRAY['varchar(40)', 'numeric(12,2)', 'timestamptz', 'text'])[1 + j % 4]);
+        END LOOP;
+        EXECUTE format('CREATE TABLE %I.t%s (id int PRIMARY KEY, c1 int NOT NULL DEFAULT 0 CHECK (c1 >= 0)%s)', sch, i, cols);
+        EXECUTE format('CREATE INDEX t%s_c1_idx ON %I.t%s (c1)', i, sch, i);
+        IF i % 10 = 0 THEN
+            EXECUTE format('COMMENT ON TABLE %I.t%s IS %L', sch, i, 'table ' || i);
+            EXECUTE format('COMMENT ON COLUMN %I.t%s.c1 IS %L', sch, i, 'column c1 of table ' || i);
+            EXECUTE format('CREATE FUNCTION %I.f%s(int) RETURNS int LANGUAGE sql AS %L', sch, i, 'SELECT $1 + ' || i);
+        END IF;
+        IF i % 50 = 0 THEN
+            EXECUTE format('CREATE TABLE %I.p%s (id int, c1 int) PARTITION BY RANGE (id)', sch, i);
+            EXECUTE format('CREATE TABLE %I.p%s_1 PARTITION OF %I.p%s FOR VALUES FROM (MINVALUE) TO (1000)', sch, i, sch, i);
+            EXECUTE format('CREATE TABLE %I.p%s_2 PARTITION OF %I.p%s FOR VALUES FROM (1000) TO (MAXVALUE)', sch, i, sch, i);
+        END IF;
+        IF {target} AND i % {step} = 0 THEN
+            CASE (i / {step}) % 5
+                WHEN 0 THEN EXECUTE format('ALTER TABLE %I.t%s ADD COLUMN c_extra int', sch, i);
+                WHEN 1 THEN EXECUTE format('ALTER TABLE %I.t%s ALTER COLUMN c1 TYPE bigint', sch, i);
+                WHEN 2 THEN EXECUTE format('DROP INDEX %I.t%s_c1_idx', sch, i);
+                WHEN 3 THEN EXECUTE format('COMMENT ON INDEX %I.t%s_c1_idx IS %L', sch, i, 'added');
+                ELSE EXECUTE format('DROP TABLE %I.t%s CASCADE', sch, i);
+            END CASE;
+        END IF;
+    END LOOP;
+END $$"""
+
+
+def GenerateScaleSchemas(conn, options, ntables):
+    # the target gets a difference in one table out of every step, i.e. --diff_pct percent of them
+    step = max(1, int(round(100.0 / options.diffpct))) if options.diffpct > 0 else ntables + 1
+    cur = conn.cursor()
+    for aschema, target in ((options.sschema, 'false'), (options.tschema, 'true')):
+        DropSchema(conn, aschema)
+        cur.execute("CREATE SCHEMA %s" % aschema)
+        conn.commit()
+        for first in range(1, ntables + 1, 500):
+            cur.execute(SCALE_DDL.format(schema=aschema, first=first, last=min(first + 499, ntables), ncols=options.columns, target=target, step=step))
+            conn.commit()
+    cur.close()
+    Analyze(conn)
+
+
+def ScaleExpected(options, ntables):
+    # the (category, objkey) DIFF records every injected difference must produce, one per injection.  The comment
+    # counts are compared per object type, so the added index comments all land in one record: count them instead.
+    step = max(1, int(round(100.0 / options.diffpct))) if options.diffpct > 0 else ntables + 1
+    expected, comments = [], 0
+    for i in range(step, ntables + 1, step):
+        case = (i // step) % 5
+        if case == 0:
+            expected.append(('Columns Diff', 't%d' % i))
+        elif case == 1:
+            expected.append(('Attributes Diff', 't%d' % i))
+        elif case == 2:
+            expected.append(('Indexes Diff', 't%d.t%d_c1_idx' % (i, i)))
+        elif case == 3:
+            comments += 1
+        else:
+            expected.append(('Tables Diff', 't%d' % i))
+    return expected, comments
+
+
+def ScaleCheck(options, ntables, ndjsonfile):
+    # returns the injected differences pg_match.py did not report
+    import json
+    expected, comments = ScaleExpected(options, ntables)
+    found, added = set(), 0
+    for line in (open(ndjsonfile) if os.path.exists(ndjsonfile) else []):
+        record = json.loads(line)
+        found.add((record['category'], record['objkey']))
+        if record['category'] == 'Comments Diff' and record['objkey'] == 'INDEX':
+            added = (record['target_value'] or 0) - (record['source_value'] or 0)
+    missing = ['%s %s' % diff for diff in expected if diff not in found]
+    if added != comments:
+        missing.append('Comments Diff INDEX: %d added, %d reported' % (comments, added))
+    return len(expected) + comments, missing
+
+
+def ScaleBench(options):
+    # per scale: generate, run one timed comparison, append one json line to --output
+    import json, psycopg2
+    conn = psycopg2.connect(host=options.host, port=options.port, user=options.user, dbname=options.db)
+    options.sschema, options.tschema = 'match_bench_s', 'match_bench_t'
+    timingsfile = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'pg_match_bench_timings_%d.json' % os.getpid())
+    ndjsonfile  = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'pg_match_bench_diffs_%d.json' % os.getpid())
+    try:
+        for ntables in [int(n) for n in options.scales.split(',')]:
+            start = time.time()
+            GenerateScaleSchemas(conn, options, ntables)
+            gensecs = time.time() - start
+            if os.path.exists(ndjsonfile):
+                os.remove(ndjsonfile)
+            rc, secs = RunMatch(options, options.host, options.port, ['-W', timingsfile, '-N', ndjsonfile])
+            if rc not in (0, 4):
+                print ("pg_match.py failed (rc=%d) at %d tables" % (rc, ntables))
+                sys.exit(1)
+            injected, missing = ScaleCheck(options, ntables, ndjsonfile)
+            if missing:
+                print ("pg_match.py missed %d of %d injected differences at %d tables:" % (len(missing), injected, ntables))
+                for diff in missing:
+                    print ("        %s" % diff)
+                sys.exit(1)
+            timings = json.load(open(timingsfile))
+            result = {'when': time.strftime('%Y-%m-%d %H:%M:%S'), 'tables': ntables, 'columns': options.columns, 'diff_pct': options.diffpct,
+                      'generate_secs': round(gensecs, 1), 'run_secs': round(secs, 3), 'timings': timings}
+            f = open(options.output, 'a')
+            f.write(json.dumps(result, sort_keys=True) + '\n')
+            f.close()
+            print ("%6d tables  run %8.2fs  peak RSS %s KB  diffs %d  injected %d, all found" % (ntables, secs, timings['peak_rss_kb'], timings['ddldiffs'], injected))
+            for phase in timings['phases']:
+                print ("        %-20s %8.3fs" % (phase['phase'], phase['secs']))
+    finally:
+        for afile in (timingsfile, ndjsonfile):
+            if os.path.exists(afile):
+                os.remove(afile)
+        if not options.keep:
+            conn.rollback()
+            for aschema in (options.sschema, options.tschema):
+                DropSchema(conn, aschema)
+        conn.close()
+    print ("results appended to %s" % options.output)
+
+
+def setupOptionParser():
+    parser = OptionParser(description='Benchmarks for pg_match.py: --pipeline through a delaying proxy, or the pg_catalog backend against information_schema')
+    parser.add_option("-H", "--host",    dest="host",    help="database host",     default="localhost")
+    parser.add_option("-P", "--port",    dest="port",    help="database port",     default=5432, type=int)
+    parser.add_option("-U", "--user",    dest="user",    help="database user",     default="postgres")
+    parser.add_option("-D", "--db",      dest="db",      help="database",          default="postgres")
+    parser.add_option("-S", "--Sschema", dest="sschema", help="source schema",     default="public")
+    parser.add_option("-s", "--Tschema", dest="tschema", help="target schema",     default="public")
+    parser.add_option("-r", "--rtt",     dest="rtt",     help="simulated round trip in ms (default 70)", default=70.0, type=float)
+    parser.add_option("-n", "--runs",    dest="runs",    help="runs per mode (default 3)",                default=3, type=int)
+    parser.add_option("-m", "--mode",    dest="mode",    help="latency | backends | scale (default latency)", default="latency")
+    parser.add_option("-t", "--tables",  dest="tables",  help="tables per generated schema in backends mode (default 10000)", default=10000, type=int)
+    parser.add_option("-c", "--scales",  dest="scales",  help="comma separated table counts for scale mode (default 1000,10000,50000)", default="1000,10000,50000")
+    parser.add_option("-C", "--columns", dest="columns", help="columns per generated table in scale mode (default 10)", default=10, type=int)
+    parser.add_option("-f", "--diff_pct", dest="diffpct", help="percent of target tables given a difference in scale mode (default 1)", default=1.0, type=float)
+    parser.add_option("-o", "--output",  dest="output",  help="json lines file scale mode appends its results to (default pg_match_bench.jsonl)", default="pg_match_bench.jsonl")
+    parser.add_option("-k", "--keep",    dest="keep",    help="keep the generated schemas",                default=False, action="store_true")
+    return parser
+
+
+if __name__ == '__main__':
+    options, args = setupOptionParser().parse_args()
+    if options.mode.lower() == 'latency':
+        LatencyBench(options)
+    elif options.mode.lower() == 'backends':
+        BackendsBench(options)
+    elif options.mode.lower() == 'scale':
+        ScaleBench(options)
+    else:
+        print ("Invalid mode (%s): use latency, backends or scale" % options.mode)
+        sys.exit(1)
+    sys.exit(0)
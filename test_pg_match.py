@@ -0,0 +1,579 @@
+#!/usr/bin/env python
+##########################################################################################
+# File Name: test_pg_match.py
+# Description:
+# Checks that the keyed diff (keyeddiff) reports exactly what the nested loops it replaced did.
+# The same source/target rows are fed to the phase methods of pg_match.py and to copies of the old
+# O(n*m) loops below; the DIFF lines, in order, and the ddldiffs/rowcntdiffs/datadiffs counts must match.
+# No database is needed: the catalog queries are replaced by the rows of each case.
+# The DetailedScan count strategy and its timeout fallback are checked on catalog values, the --partitions rollup
+# on per-partition counts, and the SampleScan estimates and confidence intervals on per-page row counts.
+# The multi-schema catalog SQL is checked as text, and run on a server when PG_MATCH_TEST_DSN is set.
+#
+# usage:
+# python -m pytest -q test_pg_match.py
+# python test_pg_match.py
+##########################################################################################
+import math, os, types, unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+def load_pg_match():
+    # pg_match.py is a script: load its definitions, everything above the main entry point
+    path   = os.path.join(HERE, 'pg_match.py')
+    source = open(path).read()
+    source = source[:source.index('####################\n# MAIN ENTRY POINT #')]
+    module = types.ModuleType('pg_match')
+    module.__file__ = path
+    exec(compile(source, path, 'exec'), module.__dict__)
+    return module
+
+
+###########################################################################
+# The old nested loops, as they were before keyeddiff, reduced to their   #
+# matching and reporting.  Each returns the DIFF lines and the diff count. #
+###########################################################################
+def old_comments(Srows, Trows, Sschema, Tschema):
+    lines = []
+    typediff = 'Comments Diff:'
+    for Srow in Srows:
+        for Trow in Trows:
+            if Srow[0] == Trow[0]:
+                if Srow[1] != Trow[1]:
+                    lines.append("%20s %s  source (%d)  target (%d)" % (typediff, Srow[0], Srow[1], Trow[1]))
+    for Srow in Srows:
+        found = False
+        for Trow in Trows:
+            if Trow[0] == Srow[0]:
+                found = True
+                break
+        if not found:
+            lines.append("%20s %-19s  source comments (%04d) not found in target schema (%s)." % (typediff, Srow[0], Srow[1], Tschema))
+    for Trow in Trows:
+        found = False
+        for Srow in Srows:
+            if Trow[0] == Srow[0]:
+                found = True
+                break
+        if not found:
+            lines.append("%20s %-19s  target comments (%04d) not found in source schema (%s)." % (typediff, Trow[0], Trow[1], Sschema))
+    return lines, len(lines)
+
+def old_tables(Srows, Trows, Sschema, Tschema):
+    lines = []
+    typediff = 'Tables Diff:'
+    labels = ((2, 'TableSpace', 'Tablespace'), (3, 'HasIndexes', 'HasIndexes'), (4, 'HasRules', 'HasRules'),
+              (5, 'HasTriggers', 'HasTriggers'), (6, 'RowSecurity', 'RowSecurity'))
+    for Sarow in Srows:
+        bFound = False
+        for Tarow in Trows:
+            if Sarow[0] == Tarow[0]:
+                bFound = True
+                for i, slabel, tlabel in labels:
+                    if Sarow[i] != Tarow[i]:
+                        lines.append('%20s %20s Source %s (%s) <> Target %s (%s)' % (typediff, Sarow[0], slabel, Sarow[i], tlabel, Tarow[i]))
+        if not bFound:
+            lines.append('%20s Source table (%35s) not found in Target' % (typediff, Sarow[0]))
+    for Tarow in Trows:
+        bFound = False
+        for Sarow in Srows:
+            if Sarow[0] == Tarow[0]:
+                bFound = True
+                continue
+        if not bFound:
+            lines.append('%20s Target table (%35s) not found in Source' % (typediff, Tarow[0]))
+    return lines, len(lines)
+
+def old_views(Srows, Trows, Sschema, Tschema):
+    lines = []
+    typediff = 'Views Diff:'
+    labels = ((2, 'CheckOption'), (3, 'IsUpdatable'), (4, 'IsInsertable_into'), (5, 'IsTriggerUpdatable'),
+              (6, 'IsTriggerDeletable'), (7, 'IsTriggerInsertable_into'))
+    for Sarow in Srows:
+        bFound = False
+        for Tarow in Trows:
+            if Sarow[0] == Tarow[0]:
+                bFound = True
+                if Sarow[1] != Tarow[1].replace(Tschema, Sschema):
+                    lines.append('%20s Source  view (%s) def <> Target' % (typediff, Sarow[0]))
+                for i, label in labels:
+                    if Sarow[i] != Tarow[i]:
+                        lines.append('%20s Source  view (%s) %s <> Target' % (typediff, Sarow[0], label))
+        if not bFound:
+            lines.append('%20s Source  view (%s) not found in Target' % (typediff, Sarow[0]))
+    for Tarow in Trows:
+        bFound = False
+        for Sarow in Srows:
+            if Sarow[0] == Tarow[0]:
+                bFound = True
+                break
+        if not bFound:
+            lines.append('%20s Target  view (%s) not found in Source' % (typediff, Tarow[0]))
+    return lines, len(lines)
+
+def old_funcs(Srows, Trows, Sschema, Tschema):
+    # the old messages were tuples instead of formatted strings; this is what they were meant to print
+    lines = []
+    typediff = 'Funcs/Procs Diff'
+    for sRow in Srows:
+        bFound = False
+        for tRow in Trows:
+            if tRow[0] == sRow[0]:
+                bFound = True
+                break
+        if not bFound:
+            lines.append('%20s:       Missing in Target - %s' % (typediff, sRow[0]))
+    for tRow in Trows:
+        bFound = False
+        for sRow in Srows:
+            if tRow[0] == sRow[0]:
+                bFound = True
+                break
+        if not bFound:
+            lines.append('%20s:       Missing in Source - %s' % (typediff, tRow[0]))
+    return lines, len(lines)
+
+def old_constraints(Srows, Trows, Sschema, Tschema):
+    # the old source loop hit `continue` before its "Target constraint name not found" line, so it never printed it;
+    # this is what it was meant to print: a missing name, when the table itself is in the target
+    lines = []
+    typediff = 'Constraints Diff:'
+    labels = ((2, '%20s   Constraint Type mismatch (%s<>%s)'), (3, '%20s       ConfUpdType mismatch (%s<>%s)'), (4, '%20s       ConfDelType mismatch (%s<>%s)'),
+              (5, '%20s     ConfMatchType mismatch (%s<>%s)'), (6, '%20s            ConKey mismatch (%s<>%s)'), (7, '%20s           ConfKey mismatch (%s<>%s)'))
+    for sRow in Srows:
+        bFoundTable = False
+        bFoundConstraint = False
+        for tRow in Trows:
+            if sRow[0] == tRow[0]:
+                bFoundTable = True
+                if sRow[1] == tRow[1]:
+                    bFoundConstraint = True
+                    for i, fmt in labels:
+                        if sRow[i] != tRow[i]:
+                            lines.append(fmt % (typediff, sRow[i], tRow[i]))
+                    if sRow[8] != tRow[8].replace(Tschema + '.', Sschema + '.'):
+                        lines.append('%20s ConstraintDef mismatch (%s<>%s)' % (typediff, sRow[8], tRow[8]))
+        if bFoundTable and not bFoundConstraint:
+            lines.append('%20s Target constraint name not found. Table(%35s)  Constraint(%s)' % (typediff, sRow[0], sRow[1]))
+    for tRow in Trows:
+        bFoundTable = False
+        bFoundConstraint = False
+        for sRow in Srows:
+            if bFoundTable and sRow[0] != tRow[0]:
+                bFoundConstraint = False
+                break
+            if sRow[0] == tRow[0]:
+                bFoundTable = True
+                if sRow[1] == tRow[1]:
+                    bFoundConstraint = True
+                    break
+        if not bFoundConstraint:
+            lines.append('%20s  Source constraint name not found. Table(%35s)  Constraint(%s)' % (typediff, tRow[0], tRow[1]))
+    return lines, len(lines)
+
+def old_indexes(Srows, Trows, Sschema, Tschema):
+    # the old source loop compared the source KeyAtts with itself, never reached "Target index name not found",
+    # and reported a missing target table once, for the last source row; this is what it was meant to print
+    lines = []
+    typediff = 'Indexes Diff:'
+    labels = ((2, '%20s    Index IndNatts mismatch'), (3, '%20s     Index KeyAtts mismatch'), (4, '%20s    Index IsUnique mismatch'),
+              (5, '%20s   Index IsPrimary mismatch'), (6, '%20s Index IsExclusion mismatch'), (8, '%20s Index IsClustered mismatch'),
+              (9, '%20s     Index IsValid mismatch'), (10, '%20s     Index IsReady mismatch'), (11, '%20s      Index IsLive mismatch'),
+              (12, '%20s      Index IndKey mismatch'), (13, '%20s     Index KeyCols mismatch'))
+    # indnkeyatts is selected as '' from a PG10 server, and then not compared on either side
+    if [row for row in Srows + Trows if row[3] == '']:
+        labels = [(i, fmt) for i, fmt in labels if i != 3]
+    for sRow in Srows:
+        bFoundTable = False
+        bFoundIndex = False
+        for tRow in Trows:
+            if sRow[0] == tRow[0]:
+                bFoundTable = True
+                if sRow[1] == tRow[1]:
+                    bFoundIndex = True
+                    for i, fmt in labels:
+                        if sRow[i] != tRow[i]:
+                            lines.append((fmt + ' for table(%35s) index(%s): (%s<>%s)') % (typediff, sRow[0], sRow[1], sRow[i], tRow[i]))
+                    if sRow[14] != tRow[14].replace(Tschema + '.', Sschema + '.'):
+                        lines.append('%20s Index IndexDef mismatch for table(%35s) index(%s): (%s<>%s)' % (typediff, sRow[0], sRow[1], sRow[14], tRow[14]))
+        if not bFoundTable:
+            lines.append('%20s          Target index table not found. Table(%35s).  Missing at least one index:%s' % (typediff, sRow[0], sRow[1]))
+        elif not bFoundIndex:
+            lines.append('%20s       Target index name not found. Table(%35s)  Index(%s)' % (typediff, sRow[0], sRow[1]))
+    for tRow in Trows:
+        bFoundTable = False
+        bFoundIndex = False
+        for sRow in Srows:
+            if bFoundTable and sRow[0] != tRow[0]:
+                bFoundIndex = False
+                break
+            if sRow[0] == tRow[0]:
+                bFoundTable = True
+                if sRow[1] == tRow[1]:
+                    bFoundIndex = True
+                    break
+        if not bFoundIndex and bFoundTable:
+            lines.append('%20s       Source index name not found. Table(%35s)  Index(%s)' % (typediff, tRow[0], tRow[1]))
+        if not bFoundTable:
+            lines.append('%20s      Source index table not found. Table(%35s)  Missing at least one index:%s' % (typediff, tRow[0], tRow[1]))
+    return lines, len(lines)
+
+def old_rowcounts(Srows, Trows, Sschema, Tschema):
+    # SimpleScan: estimates only
+    lines = []
+    typediff = 'Row Counts Diff:'
+    for sRow in Srows:
+        for tRow in Trows:
+            if sRow[0] == tRow[0]:
+                if sRow[1] != tRow[1]:
+                    lines.append('%20s %-35s rowcnts mismatch %09d<>%09d  diff=%09d' % (typediff, sRow[0], sRow[1], tRow[1], abs(sRow[1] - tRow[1])))
+                break
+    return lines, len(lines)
+
+
+def table(name, space=None, indexes=True, rules=False, triggers=False, rowsecurity=False):
+    return (name, 'postgres', space, indexes, rules, triggers, rowsecurity)
+
+def view(name, definition, updatable='YES'):
+    return (name, definition, 'NONE', updatable, updatable, 'NO', 'NO', 'NO')
+
+def constraint(tablename, name, contype='PRIMARY KEY', ondelete='NO ACTION', conkey=(1,), definition='PRIMARY KEY (id)'):
+    return (tablename, name, contype, 'NO ACTION', ondelete, 'SIMPLE', list(conkey), None, definition, 'id')
+
+def index(tablename, name, nkeyatts=1, unique=True, valid=True, keycols='id', indexdef=None):
+    indexdef = indexdef or 'CREATE UNIQUE INDEX %s ON sample.%s USING btree (%s)' % (name, tablename, keycols)
+    return (tablename, name, 1, nkeyatts, unique, False, False, True, False, valid, True, True, '1', keycols, indexdef)
+
+def rowcount(name, rowcnt, relsize=8192):
+    return (name, rowcnt, name, rowcnt, relsize)
+
+
+@unittest.skipIf(psycopg2 is None, 'pg_match.py needs psycopg2')
+class KeyedDiffTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pgm = load_pg_match()
+
+    def run_phase(self, method, rows, maxdiffs=0, version=160000):
+        # rows: {query name: (source rows, target rows)}; returns the DIFF lines and the instance
+        pgm = self.pgm
+        pg = pgm.maint()
+        pg.maxdiffs = maxdiffs
+        pg.Sschema, pg.Tschema = 'sample', 'sample_clone1'
+        pg.scantype = 'simplescan'
+        pg.pg_version_numS = pg.pg_version_numT = version
+        lines = []
+
+        def FetchPair(qname):
+            Srows, Trows = rows.get(qname, ([], []))
+            record = pgm.CATALOG_RECORDS.get(qname)
+            if record is not None:
+                Srows = [record(row) for row in Srows]
+                Trows = [record(row) for row in Trows]
+            return pgm.RC_OK, list(Srows), list(Trows)
+
+        def logit(severity, msg):
+            if severity == pgm.DIFF:
+                lines.append(msg)
+
+        pg.FetchPair = FetchPair
+        pg.logit     = logit
+        pg.Echo      = lambda msg='': None
+        self.assertEqual(getattr(pg, method)(), pgm.RC_OK)
+        return lines, pg
+
+    def check(self, method, qname, old, Srows, Trows, counter='ddldiffs', extra=None, version=160000):
+        rows = {qname: (Srows, Trows)}
+        rows.update(extra or {})
+        lines, pg = self.run_phase(method, rows, version=version)
+        oldlines, olddiffs = old(Srows, Trows, pg.Sschema, pg.Tschema)
+        self.assertEqual(lines, oldlines)
+        self.assertTrue(len(lines) > 0)
+        counts = {'ddldiffs': 0, 'rowcntdiffs': 0, 'datadiffs': 0}
+        counts[counter] = olddiffs
+        self.assertEqual((pg.ddldiffs, pg.rowcntdiffs, pg.datadiffs), (counts['ddldiffs'], counts['rowcntdiffs'], counts['datadiffs']))
+
+    def test_pairs(self):
+        diff = self.pgm.keyeddiff([('a', 1), ('b', 2), ('b', 3), ('c', 4)], [('b', 5), ('d', 6), ('b', 7), ('a', 8)], lambda r: r[0])
+        self.assertEqual(diff.pairs, [(('a', 1), ('a', 8)), (('b', 2), ('b', 5)), (('b', 2), ('b', 7)), (('b', 3), ('b', 5)),
+                                      (('b', 3), ('b', 7)), (('c', 4), None)])
+        self.assertEqual(diff.sourceonly, [('c', 4)])
+        self.assertEqual(diff.targetonly, [('d', 6)])
+        first = self.pgm.keyeddiff([('b', 2)], [('b', 5), ('b', 7)], lambda r: r[0], firstmatch=True)
+        self.assertEqual(first.matched, [(('b', 2), ('b', 5))])
+
+    def test_comments(self):
+        objects = ([(0,) * 20], [(0,) * 20])
+        Srows = [('COLUMN', 4), ('FUNCTION', 2), ('SCHEMA', 1), ('TABLE', 3), ('TABLE', 5)]
+        Trows = [('COLUMN', 4), ('DOMAIN', 1), ('FUNCTION', 1), ('TABLE', 2), ('TABLE', 3)]
+        self.check('CompareObjects', 'comments', old_comments, Srows, Trows, extra={'objects': objects})
+
+    def test_tables(self):
+        Srows = [table('addr'), table('dup'), table('orders', space='fast'), table('person', triggers=True), table('srconly')]
+        Trows = [table('addr'), table('dup', rules=True), table('dup', rowsecurity=True), table('orders'), table('person', indexes=False),
+                 table('tgtonly'), table('tgtonly')]
+        self.check('CompareTablesViews', 'tables', old_tables, Srows, Trows)
+
+    def test_views(self):
+        Srows = [view('v1', 'SELECT a FROM sample.t'), view('v2', 'SELECT b FROM sample.t'), view('v3', 'SELECT c'), view('v3', 'SELECT d')]
+        Trows = [view('v1', 'SELECT a FROM sample_clone1.t'), view('v2', 'SELECT x FROM sample_clone1.t', updatable='NO'),
+                 view('v3', 'SELECT c'), view('v4', 'SELECT e')]
+        self.check('CompareTablesViews', 'views', old_views, Srows, Trows, extra={'tables': ([table('t')], [table('t')])})
+
+    def test_funcs(self):
+        Srows = [('FUNCTION:f(integer)',), ('FUNCTION:g(text)',), ('FUNCTION:g(text)',), ('PROCEDURE:p()',)]
+        Trows = [('FUNCTION:f(integer)',), ('FUNCTION:f(bigint)',), ('FUNCTION:f(bigint)',), ('PROCEDURE:p()',)]
+        self.check('CompareFuncsProcs', 'funcs', old_funcs, Srows, Trows)
+
+    def test_constraints(self):
+        Srows = [constraint('addr', 'addr_pkey'), constraint('orders', 'orders_fk', 'FOREIGN KEY', 'CASCADE', (2,), 'FOREIGN KEY (pid) REFERENCES sample.person(id)'),
+                 constraint('orders', 'orders_pkey'), constraint('orders', 'orders_qty_check', 'CHECK CONSTRAINT', definition='CHECK ((qty > 0))'),
+                 constraint('person', 'person_pkey'), constraint('srconly', 'srconly_pkey')]
+        Trows = [constraint('addr', 'addr_pkey', conkey=(1, 2), definition='PRIMARY KEY (id, kind)'),
+                 constraint('orders', 'orders_fk', 'FOREIGN KEY', 'SET NULL', (2,), 'FOREIGN KEY (pid) REFERENCES sample_clone1.person(id)'),
+                 constraint('orders', 'orders_pkey'), constraint('orders', 'orders_qty_check', 'UNIQUE CONSTRAINT', definition='UNIQUE (qty)'),
+                 constraint('person', 'person_id_key', 'UNIQUE CONSTRAINT', definition='UNIQUE (id)'), constraint('tgtonly', 'tgtonly_pkey')]
+        self.check('CompareKeysIndexes', 'constraints', old_constraints, Srows, Trows)
+
+    def test_indexes(self):
+        Srows = [index('addr', 'addr_pkey'), index('orders', 'orders_pkey', nkeyatts=1), index('orders', 'orders_qty', unique=False, keycols='qty'),
+                 index('person', 'person_name', keycols='name'), index('person', 'person_pkey'), index('srconly', 'srconly_pkey')]
+        Trows = [index('addr', 'addr_pkey', indexdef='CREATE UNIQUE INDEX addr_pkey ON sample_clone1.addr USING btree (id)'),
+                 index('orders', 'orders_pkey', nkeyatts=2), index('orders', 'orders_qty', valid=False, keycols='qty, pid'),
+                 index('person', 'person_pkey'), index('person', 'person_upper', keycols='upper(name)'), index('tgtonly', 'tgtonly_pkey')]
+        self.check('CompareKeysIndexes', 'indexes', old_indexes, Srows, Trows)
+        # a PG10 side has no indnkeyatts: it is not compared
+        Trows[1] = index('orders', 'orders_pkey', nkeyatts='')
+        self.check('CompareKeysIndexes', 'indexes', old_indexes, Srows, Trows, version=100000)
+
+    def test_budget(self):
+        # --max_diffs: once the budget is used up, the rows already fetched report nothing more
+        Srows = [table('t%02d' % i) for i in range(10)]
+        Trows = [table('t%02d' % i, rules=True, triggers=True) for i in range(10)]
+        for maxdiffs in (1, 3):
+            lines, pg = self.run_phase('CompareTablesViews', {'tables': (Srows, Trows)}, maxdiffs=maxdiffs)
+            self.assertEqual(len(lines), maxdiffs)
+            self.assertEqual(pg.ddldiffs, maxdiffs)
+            self.assertTrue(pg.stopped.is_set())
+
+    def test_rowcounts(self):
+        Srows = [rowcount('a', 10), rowcount('b', 20), rowcount('c', 30), rowcount('dup', 5), rowcount('srconly', 1)]
+        Trows = [rowcount('a', 10), rowcount('b', 25), rowcount('dup', 6), rowcount('dup', 5), rowcount('c', 0), rowcount('tgtonly', 1)]
+        self.check('CompareRowCounts', 'rowcounts', old_rowcounts, Srows, Trows, counter='rowcntdiffs')
+
+
+class task(object):
+    # a finished SubmitQuery task: its rows, or the error it ended with
+    def __init__(self, rows=None, error=None):
+        self.rows  = rows
+        self.error = error
+
+class ndjson(object):
+    # collects the --ndjson records
+    def __init__(self, records):
+        self.Write = records.append
+
+
+@unittest.skipIf(psycopg2 is None, 'pg_match.py needs psycopg2')
+class RowCountTest(unittest.TestCase):
+    # the row count arithmetic of DetailedScan, --partitions and SampleScan, without a database
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pgm = load_pg_match()
+
+    def instance(self, scantype='detailedscan'):
+        pg = self.pgm.maint()
+        pg.Sschema, pg.Tschema = 'sample', 'sample_clone1'
+        pg.scantype = scantype
+        pg.logged = []
+        pg.logit = lambda severity, msg: pg.logged.append((severity, msg))
+        return pg
+
+    def test_count_strategy(self):
+        pg = self.instance()
+        big = self.pgm.COUNTPARALLELMB * 1024 * 1024 // self.pgm.BLOCKSIZE
+        indexonly = [('enable_seqscan', 'off'), ('enable_bitmapscan', 'off')]
+        parallel  = [('max_parallel_workers_per_gather', str(self.pgm.COUNTPARALLEL)), ('parallel_setup_cost', '0')]
+        self.assertEqual(pg.CountStrategy(None), ('seqscan', []))
+        self.assertEqual(pg.CountStrategy(('t', 1000, 900, True)), ('indexonly', indexonly))
+        self.assertEqual(pg.CountStrategy(('t', 1000, 899, True)), ('seqscan', []))
+        self.assertEqual(pg.CountStrategy(('t', 1000, 1000, False)), ('seqscan', []))
+        self.assertEqual(pg.CountStrategy(('t', 0, 0, True)), ('seqscan', []))
+        # the visibility map wins over the heap size; without a primary key a big heap goes parallel
+        self.assertEqual(pg.CountStrategy(('t', big, big, True)), ('indexonly', indexonly))
+        self.assertEqual(pg.CountStrategy(('t', big, big, False)), ('parallel', parallel))
+        self.assertEqual(pg.CountStrategy(('t', big - 1, 0, False)), ('seqscan', []))
+        # --count_timeout caps every strategy
+        pg.counttimeout = 5
+        timeout = [('statement_timeout', "'5s'")]
+        self.assertEqual(pg.CountStrategy(None), ('seqscan', timeout))
+        self.assertEqual(pg.CountStrategy(('t', 1000, 1000, True)), ('indexonly', timeout + indexonly))
+        self.assertEqual(pg.CountStrategy(('t', big, 0, False)), ('parallel', timeout + parallel))
+
+    def test_count_fallback(self):
+        pg = self.instance()
+        row = self.pgm.rowcountrecord(('t', 42, 't', 40, 8192))
+        cancelled = task(error=psycopg2.extensions.QueryCanceledError('canceling statement due to statement timeout'))
+        self.assertEqual(pg.CountResult('Source', task(rows=[(45,)]), row, 'indexonly'), (45, 'indexonly'))
+        # without --count_timeout a cancelled count is an error, with it the pg_class estimate is compared instead
+        self.assertEqual(pg.CountResult('Source', cancelled, row, 'seqscan'), (None, 'seqscan'))
+        self.assertEqual(pg.logged[-1][0], self.pgm.ERR)
+        pg.counttimeout = 5
+        self.assertEqual(pg.CountResult('Source', cancelled, row, 'parallel'), (42, 'estimate'))
+        self.assertEqual(pg.logged[-1][0], self.pgm.WARN)
+        failed = task(error=psycopg2.ProgrammingError('relation "t" does not exist'))
+        self.assertEqual(pg.CountResult('Target', failed, row, 'seqscan'), (None, 'seqscan'))
+        self.assertEqual(pg.logged[-1][0], self.pgm.ERR)
+
+    def rollup(self, scantype, rollups, results):
+        # RollupPartitions on (source, target) estimates per partition; returns the DIFF lines and the --ndjson records
+        pg = self.instance(scantype)
+        records = []
+        pg.ndjson = ndjson(records)
+        record = self.pgm.rowcountrecord
+        rollups = dict([(parent, [(record(rowcount(name, s)), record(rowcount(name, t))) for name, s, t in parts]) for parent, parts in rollups.items()])
+        pg.RollupPartitions('Row Counts Diff:', rollups, results)
+        return [msg for severity, msg in pg.logged if severity == self.pgm.DIFF], records, pg
+
+    def test_rollup(self):
+        # DetailedScan: partitions with matching estimates were not counted and add their estimate to the totals
+        rollups = {'events': [('events_p1', 100, 100), ('events_p2', 190, 190), ('events_p3', 50, 50), ('events_p4', 30, 31)],
+                   'logs':   [('logs_p1', 10, 10), ('logs_p2', 5, 9)],
+                   'orders': [('orders_p1', 7, 7), ('orders_p2', 8, 9)]}
+        results = {'events_p2': (200, 210, 'seqscan', 'indexonly'), 'events_p4': (30, 30, 'seqscan', 'seqscan'),
+                   'logs_p2': (5, 9, 'seqscan', 'estimate'), 'orders_p2': (8, 8, 'indexonly', 'indexonly')}
+        lines, records, pg = self.rollup('detailedscan', rollups, results)
+        typediff = 'Row Counts Diff:'
+        self.assertEqual(lines, [
+            '%20s %-35s Partitioned Real rowcnts mismatch %09d<>%09d  diff=%09d  (1 of 4 partitions differ)' % (typediff, 'events', 380, 390, 10),
+            '%20s %-35s   partition %-30s %09d<>%09d  diff=%09d  (seqscan/indexonly)' % (typediff, 'events', 'events_p2', 200, 210, 10),
+            '%20s %-35s Partitioned rowcnts mismatch %09d<>%09d  diff=%09d  (1 of 2 partitions differ)' % (typediff, 'logs', 15, 19, 4),
+            '%20s %-35s   partition %-30s %09d<>%09d  diff=%09d  (seqscan/estimate)' % (typediff, 'logs', 'logs_p2', 5, 9, 4)])
+        # the drill-down lines are not differences of their own
+        self.assertEqual((pg.rowcntdiffs, pg.ddldiffs), (2, 0))
+        self.assertEqual([(r['objkey'], r['objtype'], r['attribute'], r['source_value'], r['target_value']) for r in records],
+                         [('events', 'partitioned table', 'count', 380, 390), ('logs', 'partitioned table', 'count', 15, 19)])
+        self.assertEqual(records[0]['partitions'], [{'partition': 'events_p2', 'source_value': 200, 'target_value': 210,
+                                                     'strategy': {'source': 'seqscan', 'target': 'indexonly'}}])
+
+    def test_rollup_estimates(self):
+        # SimpleScan: every partition is compared on its estimate, the drill-down has no strategies
+        rollups = {'events': [('events_p1', 100, 100), ('events_p2', 190, 180), ('events_p3', 5, 6)]}
+        lines, records, pg = self.rollup('simplescan', rollups, {})
+        typediff = 'Row Counts Diff:'
+        self.assertEqual(lines, [
+            '%20s %-35s Partitioned rowcnts mismatch %09d<>%09d  diff=%09d  (2 of 3 partitions differ)' % (typediff, 'events', 295, 286, 9),
+            '%20s %-35s   partition %-30s %09d<>%09d  diff=%09d' % (typediff, 'events', 'events_p2', 190, 180, 10),
+            '%20s %-35s   partition %-30s %09d<>%09d  diff=%09d' % (typediff, 'events', 'events_p3', 5, 6, 1)])
+        self.assertEqual(pg.rowcntdiffs, 1)
+        self.assertEqual(records[0]['attribute'], 'rowcnt')
+
+    def sample(self, samplepct, tables):
+        # SampleRowCounts on tables: [(name, pages, source (sum(n), sum(n*n)), target (...))]; returns the SQL per side and table,
+        # the DIFF and DEBUG lines and the instance
+        pg = self.instance('samplescan')
+        pg.samplepct = samplepct
+        submitted = {}
+
+        def SubmitQuery(name, side, sql, settings=None):
+            table = [t[0] for t in tables if '"%s"' % t[0] in sql][0]
+            submitted[(side, table)] = sql
+            return side, table
+
+        def WaitPair(label, taskS, taskT):
+            rows = dict([(t[0], (t[2], t[3])) for t in tables])
+            return self.pgm.RC_OK, [rows[taskS[1]][0]], [rows[taskT[1]][1]]
+
+        pg.SubmitQuery = SubmitQuery
+        pg.WaitPair    = WaitPair
+        pg.Progress    = lambda msg: None
+        pg.Echo        = lambda msg='': None
+        record = self.pgm.rowcountrecord
+        matched = [(record(rowcount(t[0], 0, t[1] * self.pgm.BLOCKSIZE)), record(rowcount(t[0], 0, t[1] * self.pgm.BLOCKSIZE))) for t in tables]
+        self.assertEqual(pg.SampleRowCounts(matched), self.pgm.RC_OK)
+        lines = [(severity, msg) for severity, msg in pg.logged if severity in (self.pgm.DIFF, self.pgm.DEBUG)]
+        return submitted, lines, pg
+
+    def interval(self, q, sumn, sumn2):
+        # the Horvitz-Thompson estimate of a page sample and its 95% confidence interval
+        est = sumn / q
+        err = math.sqrt((1 - q) * sumn2) / q
+        return est, max(0.0, est - 1.96 * err), est + 1.96 * err
+
+    def test_sample(self):
+        tables = [('same', 10000, (500, 25000), (1000, 100000)), ('drift', 10000, (500, 25000), (5000, 2500000)),
+                  ('small', 500, (120, None), (121, None)), ('tiny', 500, (7, None), (7, None))]
+        submitted, lines, pg = self.sample(1.0, tables)
+        # 1% of 10000 pages is a sample of 100 pages; 1% of 500 pages would be 5, below MINSAMPLEPAGES, so those are counted
+        self.assertIn('"same" TABLESAMPLE SYSTEM (1.0)', submitted[('S', 'same')])
+        self.assertIn('"drift" TABLESAMPLE SYSTEM (1.0)', submitted[('T', 'drift')])
+        self.assertTrue(submitted[('S', 'small')].startswith('SELECT COUNT(*), NULL from sample."small"'))
+        self.assertTrue(submitted[('T', 'small')].startswith('SELECT COUNT(*), NULL from sample_clone1."small"'))
+
+        typediff = 'Row Counts Diff:'
+        fmt = '%20s %-35s sampled rowcnts %d [%d-%d] <> %d [%d-%d] (95%% CI)'
+        same  = self.interval(0.01, 500, 25000) + self.interval(0.01, 1000, 100000)
+        drift = self.interval(0.01, 500, 25000) + self.interval(0.01, 5000, 2500000)
+        # 50000 [19165-80834] overlaps 100000 [38330-161669]; 500000 [191650-808349] does not
+        self.assertEqual([int(x) for x in same + drift], [50000, 19165, 80834, 100000, 38330, 161669, 50000, 19165, 80834, 500000, 191650, 808349])
+        self.assertEqual(lines, [(self.pgm.DEBUG, fmt % ((typediff, 'same') + same)), (self.pgm.DIFF, fmt % ((typediff, 'drift') + drift)),
+                                 (self.pgm.DIFF, fmt % (typediff, 'small', 120, 120, 120, 121, 121, 121)),
+                                 (self.pgm.DEBUG, fmt % (typediff, 'tiny', 7, 7, 7, 7, 7, 7))])
+        self.assertEqual(pg.rowcntdiffs, 2)
+
+    def test_sample_all(self):
+        # at 100 percent every table is counted exactly
+        submitted, lines, pg = self.sample(100.0, [('big', 100000, (10, None), (10, None))])
+        self.assertTrue(submitted[('S', 'big')].startswith('SELECT COUNT(*), NULL'))
+        self.assertEqual(pg.rowcntdiffs, 0)
+
+
+@unittest.skipIf(psycopg2 is None, 'pg_match.py needs psycopg2')
+class SchemasSQLTest(unittest.TestCase):
+    # multi-schema mode: the single-schema catalog queries with the schema name taken from the LATERAL schema list
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pgm = load_pg_match()
+
+    def schemas_sql(self, version, infoschema=False):
+        pg = self.pgm.maint()
+        pg.pg_version_numS = pg.pg_version_numT = version
+        pg.InfoSchema = infoschema
+        return [(qname, pg.SchemasSQL(qname, 'S', ['sample', "o'neil"])) for qname, phase, label in self.pgm.CATALOG_QUERIES]
+
+    def test_text(self):
+        for version, infoschema in ((160000, False), (160000, True), (90600, False)):
+            for qname, sql in self.schemas_sql(version, infoschema):
+                self.assertNotIn(self.pgm.SCHEMATOKEN, sql, qname)
+                # OPERATOR() binds as tightly as ||: the pattern must be one parenthesized operand
+                self.assertNotIn("OPERATOR(pg_catalog.~) '^('", sql, qname)
+                self.assertTrue(sql.startswith("SELECT mschema.nspname, q.* FROM unnest(ARRAY['sample','o''neil']::name[])"), qname)
+        objects = dict(self.schemas_sql(160000))['objects']
+        self.assertIn("OPERATOR(pg_catalog.~) ('^(' || mschema.nspname || ')$')", objects)
+
+    @unittest.skipUnless(os.environ.get('PG_MATCH_TEST_DSN'), 'set PG_MATCH_TEST_DSN to run the catalog queries on a server')
+    def test_run(self):
+        conn = psycopg2.connect(os.environ['PG_MATCH_TEST_DSN'])
+        try:
+            for infoschema in (False, True):
+                for qname, sql in self.schemas_sql(conn.server_version, infoschema):
+                    cur = conn.cursor()
+                    cur.execute(sql)
+                    cur.fetchall()
+                    cur.close()
+                    conn.rollback()
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()